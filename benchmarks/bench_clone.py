@@ -0,0 +1,151 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+Benchmarks for the ways :meth:`carthage.image.ImageVolume.do_create` can create an image from a base image; see :mod:`carthage.image_clone`.
+
+When run as root with the corresponding ``mkfs`` available, loop mounted btrfs, xfs and ext4 filesystems are created for the comparison.  Directories given on the command line are also measured.
+
+Run as ``python3 benchmarks/bench_clone.py [--size MiB] [directory ...]``.
+'''
+
+import argparse
+import contextlib
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from carthage import image_clone
+
+FILESYSTEMS = ('btrfs', 'xfs', 'ext4')
+
+
+def make_base_image(path, size_mib):
+    '''Write a raw image in which every other MiB is random and the rest is zero, like a partly used disk.'''
+    with open(path, 'wb') as f:
+        for i in range(size_mib):
+            if i % 2:
+                f.seek(1024*1024, os.SEEK_CUR)
+            else:
+                f.write(os.urandom(1024*1024))
+        f.truncate(size_mib*1024*1024)
+    with open(path, 'rb') as src, gzip.open(str(path)+'.gz', 'wb', compresslevel=1) as dst:
+        shutil.copyfileobj(src, dst, 4*1024*1024)
+
+
+def strategy_ficlone(base, dest):
+    if not image_clone.clone_file(base, dest):
+        return 'unsupported'
+
+
+def strategy_cp_reflink(base, dest):
+    subprocess.run(['cp', '--reflink=auto', '-p', base, dest], check=True)
+
+
+def strategy_qemu_img_convert(base, dest):
+    subprocess.run(['qemu-img', 'convert', '-C', '-fraw', '-Oraw', base, dest], check=True)
+
+
+def strategy_copy(base, dest):
+    shutil.copyfile(base, dest)
+
+
+def strategy_gunzip_convert(base, dest):
+    with tempfile.NamedTemporaryFile(dir=Path(dest).parent) as t:
+        subprocess.run(['gzip', '-d', '-c', str(base)+'.gz'], stdout=t, check=True)
+        subprocess.run(['qemu-img', 'convert', '-Oraw', '-fraw', t.name, dest], check=True)
+
+
+def strategy_decompress_sparse(base, dest):
+    image_clone.decompress_sparse(str(base)+'.gz', dest)
+
+
+STRATEGIES = [
+    ('FICLONE', strategy_ficlone, ()),
+    ('cp --reflink=auto', strategy_cp_reflink, ('cp',)),
+    ('qemu-img convert -C', strategy_qemu_img_convert, ('qemu-img',)),
+    ('copyfile', strategy_copy, ()),
+    ('gzip -d + qemu-img convert', strategy_gunzip_convert, ('gzip', 'qemu-img')),
+    ('decompress_sparse', strategy_decompress_sparse, ()),
+]
+
+
+def used_mib(path):
+    return os.stat(path).st_blocks*512/1024/1024
+
+
+def bench_directory(label, directory, size_mib):
+    directory = Path(directory)
+    base = directory/'bench-base.raw'
+    make_base_image(base, size_mib)
+    os.sync()
+    print(f'{label}: {size_mib} MiB image, reflink supported: {image_clone.reflink_supported(directory)}')
+    print(f'  {"strategy":<28} {"seconds":>8} {"MiB allocated":>14}')
+    try:
+        for name, func, commands in STRATEGIES:
+            if not all(shutil.which(c) for c in commands):
+                print(f'  {name:<28} {"skipped":>8}')
+                continue
+            dest = directory/'bench-clone.raw'
+            start = time.perf_counter()
+            result = func(base, dest)
+            os.sync()
+            elapsed = time.perf_counter()-start
+            if result:
+                print(f'  {name:<28} {result:>8}')
+            else:
+                # For clones, allocation is shared with the base image
+                print(f'  {name:<28} {elapsed:>8.3f} {used_mib(dest):>14.1f}')
+            with contextlib.suppress(FileNotFoundError):
+                dest.unlink()
+    finally:
+        base.unlink()
+        Path(str(base)+'.gz').unlink()
+
+
+@contextlib.contextmanager
+def loop_filesystem(fs, size_mib, workdir):
+    image = workdir/f'{fs}.img'
+    mountpoint = workdir/fs
+    mountpoint.mkdir()
+    with open(image, 'wb') as f:
+        f.truncate(size_mib*1024*1024)
+    options = {'xfs': ['-m', 'reflink=1'], 'ext4': ['-F']}.get(fs, [])
+    subprocess.run([f'mkfs.{fs}', '-q', *options, str(image)], check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(['mount', '-o', 'loop', str(image), str(mountpoint)], check=True)
+    try:
+        yield mountpoint
+    finally:
+        subprocess.run(['umount', str(mountpoint)])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024, help='size of the base image in MiB')
+    parser.add_argument('directories', nargs='*')
+    args = parser.parse_args()
+    for directory in args.directories:
+        bench_directory(directory, directory, args.size)
+    if os.geteuid() != 0:
+        print('Not root; skipping loop mounted filesystems')
+        return
+    with tempfile.TemporaryDirectory() as workdir:
+        for fs in FILESYSTEMS:
+            if not shutil.which(f'mkfs.{fs}'):
+                print(f'{fs}: mkfs.{fs} not found; skipped')
+                continue
+            # Room for the base image, its compressed copy and a full copy
+            with loop_filesystem(fs, args.size*4+512, Path(workdir)) as mountpoint:
+                bench_directory(fs, mountpoint, args.size)
+
+
+if __name__ == '__main__':
+    main()
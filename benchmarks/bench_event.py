@@ -0,0 +1,54 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+Micro-benchmarks for :meth:`carthage.event.EventListener.emit_event`.
+
+Each level of the injector tree has a listener for an unrelated key so that every injector has its own :class:`~carthage.event.EventScope`, the worst case for walking the parent chain.
+
+Run as ``python3 benchmarks/bench_event.py``.
+'''
+
+import asyncio
+import timeit
+from carthage.dependency_injection import Injector, InjectionKey
+
+EMITS = 20000
+
+
+def injector_chain(depth):
+    root = Injector()
+    injector = root
+    for i in range(depth):
+        injector.add_event_listener(InjectionKey(f'unrelated_{i}'), 'event', lambda **kwargs: None)
+        if i < depth - 1:
+            injector = injector(Injector)
+    return root, injector
+
+
+def bench_emit(loop):
+    key = InjectionKey('bench_event')
+    print('emit_event from the leaf of an injector tree')
+    print(f'{"depth":>6} {"usec/emit (none)":>17} {"usec/emit (root)":>17}')
+    for depth in (1, 2, 5, 10, 20, 50):
+        root, leaf = injector_chain(depth)
+        unheard = timeit.timeit(
+            lambda: leaf.emit_event(key, 'event', leaf, loop=loop), number=EMITS)
+        root.add_event_listener(key, 'event', lambda **kwargs: None)
+        heard = timeit.timeit(
+            lambda: leaf.emit_event(key, 'event', leaf, loop=loop), number=EMITS)
+        print(f'{depth:>6} {unheard / EMITS * 1e6:>17.3f} {heard / EMITS * 1e6:>17.3f}')
+        root.close()
+
+
+if __name__ == '__main__':
+    loop = asyncio.new_event_loop()
+    try:
+        bench_emit(loop)
+    finally:
+        loop.close()
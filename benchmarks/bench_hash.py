@@ -0,0 +1,69 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+Probe-length distribution for the :class:`carthage.kvstore.HashedRangeAssignments` hash versions.
+
+Keys shaped like the link keys used for address assignment are placed into a range using the same nearest-to-hash order as ``possible_assignments``.  The probe length is the distance from the hashed position to the position actually assigned.
+
+Run as ``python3 benchmarks/bench_hash.py``.
+'''
+
+import statistics
+from carthage.kvstore import HashedRangeAssignments
+
+
+def realistic_keys(count):
+    sites = ['bos', 'iad', 'sjc', 'lhr']
+    roles = ['web', 'db', 'cache', 'worker', 'build']
+    keys = []
+    i = 0
+    while len(keys) < count:
+        site = sites[i % len(sites)]
+        role = roles[(i // len(sites)) % len(roles)]
+        n = i // (len(sites) * len(roles))
+        for interface in ('eth0', 'eth1'):
+            keys.append(f'{role}{n:02d}.{site}|{interface}')
+        i += 1
+    return keys[:count]
+
+
+def place(keys, hash_function, size):
+    occupied = set()
+    probes = []
+    for key in keys:
+        start = hash_function(key) % size
+        for distance in range(size):
+            candidates = [start + distance]
+            if distance: candidates.append(start - distance)
+            found = [c for c in candidates if 0 <= c < size and c not in occupied]
+            if found:
+                occupied.add(found[0])
+                probes.append(distance)
+                break
+    return probes
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    print(f'{"version":>7} {"keys":>6} {"range":>6} {"mean":>8} {"p50":>5} {"p90":>5} {"p99":>5} {"max":>6}')
+    for count, size in ((500, 1024), (2000, 4096), (3500, 4096)):
+        keys = realistic_keys(count)
+        for version, hash_function in sorted(HashedRangeAssignments.hash_functions.items()):
+            probes = place(keys, hash_function, size)
+            print(f'{version:>7} {count:>6} {size:>6} {statistics.mean(probes):>8.2f} '
+                  f'{percentile(probes, .5):>5} {percentile(probes, .9):>5} '
+                  f'{percentile(probes, .99):>5} {max(probes):>6}')
+
+
+if __name__ == '__main__':
+    main()
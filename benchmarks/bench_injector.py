@@ -0,0 +1,42 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+Micro-benchmarks for :class:`carthage.dependency_injection.Injector`.
+
+Run as ``python3 benchmarks/bench_injector.py``.
+'''
+
+import timeit
+from carthage.dependency_injection import Injector, InjectionKey
+
+LOOKUPS = 20000
+
+
+def injector_chain(depth):
+    root = Injector()
+    injector = root
+    for i in range(depth - 1):
+        injector = injector(Injector)
+    return root, injector
+
+
+def bench_get_instance():
+    key = InjectionKey('bench_value')
+    print('get_instance of a key provided at the root')
+    print(f'{"depth":>6} {"usec/lookup":>12}')
+    for depth in range(1, 21):
+        root, leaf = injector_chain(depth)
+        root.add_provider(key, 42)
+        elapsed = timeit.timeit(lambda: leaf.get_instance(key), number=LOOKUPS)
+        print(f'{depth:>6} {elapsed / LOOKUPS * 1e6:>12.3f}')
+        root.close()
+
+
+if __name__ == '__main__':
+    bench_get_instance()
@@ -0,0 +1,59 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+Benchmark defining and instantiating a layout with many machines.
+
+Run as ``python3 benchmarks/bench_layout.py [machines]``.
+'''
+
+import asyncio
+import sys
+import tempfile
+import time
+from carthage import base_injector, ConfigLayout
+from carthage.dependency_injection import AsyncInjector, Injector, InjectionKey
+from carthage.modeling import *
+
+
+def layout_source(machines):
+    lines = ['class layout(CarthageLayout):',
+             '    layout_name = "bench"',
+             ]
+    for i in range(machines):
+        lines.append(f'    class web{i:04d}(MachineModel): pass')
+    return '\n'.join(lines)
+
+
+async def instantiate(layout, state_dir):
+    injector = base_injector(Injector)
+    config = injector(ConfigLayout)
+    config.base_dir = state_dir
+    ainjector = injector(AsyncInjector)
+    start = time.perf_counter()
+    l = await ainjector(layout)
+    models = await l.all_models(ready=False)
+    elapsed = time.perf_counter() - start
+    injector.close()
+    return elapsed, len(models)
+
+
+def main(machines=1000):
+    import carthage.modeling
+    namespace = dict(vars(carthage.modeling))
+    start = time.perf_counter()
+    exec(layout_source(machines), namespace)
+    define = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as state_dir:
+        instantiate_time, models = asyncio.run(instantiate(namespace['layout'], state_dir))
+    print(f'{machines} machines: define {define:.3f}s; instantiate {instantiate_time:.3f}s ({models} models)')
+    print(f'{len(InjectionKey._interned_keys)} interned constrained keys')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
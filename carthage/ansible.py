@@ -7,13 +7,19 @@
 # LICENSE for details.
 
 from __future__ import annotations
+import asyncio
 import contextlib
 import dataclasses
+import hashlib
 import json
 import os
 import os.path
+import shlex
+import shutil
 import tempfile
+import time
 import typing
+import weakref
 import yaml
 import importlib.resources
 from abc import ABC, abstractmethod
@@ -24,7 +30,7 @@ from . import sh, Machine, machine
 from .container import Container
 from .config import ConfigLayout
 from .ssh import SshKey, SshAgent
-from .utils import validate_shell_safe
+from .utils import memoproperty, validate_shell_safe
 from types import SimpleNamespace
 from .network import access_ssh_origin
 from . import setup_tasks
@@ -111,6 +117,8 @@ class AnsibleInventory(AsyncInjectable):
 
     def __init__(self, destination, **kwargs):
         self.destination = destination
+        #: Seconds spent in each plugin's calls while generating the inventory, keyed by plugin name.  Calls run concurrently, so the times may add up to more than the generation took.
+        self.plugin_timings: dict[str, float] = {}
         super().__init__(**kwargs)
 
     async def async_ready(self):
@@ -121,17 +129,44 @@ class AnsibleInventory(AsyncInjectable):
     async def collect_machines(self):
         self.machines = await self.ainjector.filter_instantiate_async(Machine, ['host'], ready=False)
 
+    @memoproperty
+    def _plugin_limit(self):
+        limit = self.injector(ConfigLayout).ansible.inventory_concurrency
+        if limit > 0: return asyncio.Semaphore(limit)
+        return contextlib.nullcontext()
+
+    async def _call_plugin(self, plugin, method, *args):
+        # Calls into plugins are bounded by _plugin_limit and timed.
+        async with self._plugin_limit:
+            start = time.monotonic()
+            try:
+                return await self.ainjector(method, *args)
+            finally:
+                self.plugin_timings[plugin.name] = self.plugin_timings.get(plugin.name, 0.0) + time.monotonic()-start
+
+    @staticmethod
+    async def _gather(coros):
+        tasks = [asyncio.ensure_future(c) for c in coros]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks: t.cancel()
+            raise
+
     async def collect_groups(self):
         plugins = await self.ainjector.filter_instantiate_async(AnsibleGroupPlugin, ['name'], ready=True)
         plugins = sorted(plugins, key=lambda x: getattr(x[0], 'priority', 100), reverse=True)
         self.group_plugins = [p[1] for p in plugins]
-        group_info: dict[str, dict] = {}
-        for k, p in plugins:
+        async def call(p):
             try:
-                result = await self.ainjector(p.group_info)
-            except BaseException:
+                return await self._call_plugin(p, p.group_info)
+            except Exception:
                 logger.exception(f"Error getting group variables from {p.name} plugin:")
                 raise
+        results = await self._gather(call(p) for k, p in plugins)
+        group_info: dict[str, dict] = {}
+        # Merge in priority order regardless of which plugin finished first
+        for result in results:
             for group, result_info in result.items():
                 group_info.setdefault(group, {})
                 for info_type, info_type_dict in result_info.items():
@@ -147,18 +182,38 @@ class AnsibleInventory(AsyncInjectable):
         plugins = [p[1] for p in plugin_filtered]
         all = result_dict.setdefault('all', {})
         hosts_dict = all.setdefault('hosts', {})
-        for ignore_key, m in self.machines:
+
+        async def host_vars(p, m, machine_name):
+            try:
+                return await self._call_plugin(p, p.host_vars, m)
+            except Exception:
+                logger.exception(f"Error getting variables for {machine_name} from {p.name} plugin:")
+                raise
+
+        async def groups_for(p, m, machine_name):
+            try:
+                return await self._call_plugin(p, p.groups_for, m)
+            except Exception:
+                logger.exception(f"Error determining groups for {machine_name} from group plugin {p.name}")
+                raise
+
+        async def collect(m):
             try:
                 machine_name = m.ansible_inventory_name
             except AttributeError:
                 machine_name = m.name
+            results = await self._gather(
+                [host_vars(p, m, machine_name) for p in plugins]
+                + [groups_for(p, m, machine_name) for p in self.group_plugins])
+            return machine_name, results[:len(plugins)], results[len(plugins):]
+
+        collected = await self._gather(collect(m) for ignore_key, m in self.machines)
+        # Merge in machine and plugin priority order so the inventory
+        # does not depend on which calls finished first.
+        for (ignore_key, m), (machine_name, var_results, group_results) in zip(self.machines, collected):
             var_dict: dict[str, dict] = {}
-            for p in plugins:
-                try:
-                    var_dict.update(await self.ainjector(p.host_vars, m))
-                except BaseException:
-                    logger.exception(f"Error getting variables for {machine_name} from {p.name} plugin:")
-                    raise
+            for result in var_results:
+                var_dict.update(result)
             if 'ansible_host' not in var_dict:
                 try:
                     var_dict['ansible_host'] = m.ip_address
@@ -166,7 +221,18 @@ class AnsibleInventory(AsyncInjectable):
                     pass
             if 'ansible_ssh_common_args' not in var_dict:
                 try:
-                    if ssh_options := m.ssh_options:
+                    ssh_options = tuple(m.ssh_options)
+                    try:
+                        # Reuse the machine's master connection if it
+                        # is running.  Otherwise leave ControlPath out
+                        # so that ansible does not start a master
+                        # carthage would not clean up.
+                        control_master = m.ssh_control_master
+                        if control_master and await control_master.running():
+                            ssh_options += control_master.ssh_options
+                    except Exception:
+                        logger.warning('Unable to check ssh master connection for %s', machine_name, exc_info=True)
+                    if ssh_options:
                         var_dict['ansible_ssh_common_args'] = " ".join(ssh_options)
                 except Exception:
                     pass
@@ -178,41 +244,93 @@ class AnsibleInventory(AsyncInjectable):
                     pass
             hosts_dict[machine_name] = var_dict
             groups = []
-            for p in self.group_plugins:
-                try:
-                    groups += await self.ainjector(p.groups_for, m)
-                except BaseException:
-                    logger.exception(f"Error determining groups for {machine_name} from group plugin {p.name}")
-                    raise
+            for result in group_results:
+                groups += result
             for g in groups:
                 result_dict.setdefault(g, {})
                 result_dict[g].setdefault('hosts', {})
                 result_dict[g]['hosts'].setdefault(machine_name, {})
 
     async def generate_inventory(self):
+        self.plugin_timings = {}
         await self.collect_machines()
         result = await self.collect_groups()
         await self.collect_hosts(result)
         self.inventory = result
+        if self.plugin_timings:
+            logger.debug('Ansible inventory plugin times: %s', ', '.join(
+                f'{name}: {seconds:.2f}s' for name, seconds in sorted(
+                    self.plugin_timings.items(), key=lambda i: i[1], reverse=True)))
+        return result
+
+    def inventory_files(self, inventory: dict[str, dict]):
+        '''
+        :returns: A dict mapping paths relative to the directory containing the inventory to file contents.  The inventory itself is ``hosts.yml``.  If *ansible.inventory_host_vars* is true, host variables are moved to ``host_vars/<host>.yml``.
+        '''
+        if not self.injector(ConfigLayout).ansible.inventory_host_vars:
+            return {'hosts.yml': yaml.dump(inventory, default_flow_style=False)}
+        result = {}
+        hosts = inventory.get('all', {}).get('hosts', {})
+        for host, host_vars in hosts.items():
+            result[f'host_vars/{host}.yml'] = yaml.dump(host_vars, default_flow_style=False)
+        inventory = dict(inventory)
+        inventory['all'] = dict(inventory['all'])
+        inventory['all']['hosts'] = {host: {} for host in hosts}
+        result['hosts.yml'] = yaml.dump(inventory, default_flow_style=False)
         return result
 
     async def write_inventory(self, destination, inventory: dict[str, dict]):
+        '''
+        Write *inventory* (see :meth:`inventory_files`) to *destination*.  Files whose contents have not changed are left alone.  If *ansible.inventory_host_vars* is false, any ``host_vars`` directory next to the inventory is removed.  If *destination* is a :class:`~carthage.ssh.RsyncPath`, the files are kept in *cache_dir* and transferred with ``rsync -t``, so unchanged files are not copied again.
+
+        :returns: True if anything was written locally.  For remote destinations, the transfer always happens.
+        '''
         from . import ssh
-        with contextlib.ExitStack() as stack:
-            if not isinstance(destination, ssh.RsyncPath):
-                local_path = Path(destination)
-                os.makedirs(local_path.parent, exist_ok=True)
-            else:
-                dir = stack.enter_context(
-                    TemporaryDirectory(
-                        dir=self.config_layout.state_dir,
-                        prefix="ansible-inventory"))
-                local_path = os.path.join(dir, "hosts.yml")
-            with open(local_path, "wt") as f:
-                f.write(yaml.dump(inventory, default_flow_style=False))
-                if isinstance(destination, ssh.RsyncPath):
-                    key = await self.ainjector.get_instance_async(ssh.SshKey)
-                    await key.rsync(local_path, destination)
+        files = self.inventory_files(inventory)
+        remote = isinstance(destination, ssh.RsyncPath)
+        if remote:
+            local_dir = Path(self.injector(ConfigLayout).cache_dir)/'ansible_inventory'/hashlib.sha256(
+                str(destination).encode()).hexdigest()[:16]
+        else:
+            local_dir = Path(destination).parent
+        changed = False
+        for name, contents in files.items():
+            path = local_dir/name
+            if name == 'hosts.yml' and not remote:
+                path = Path(destination)
+            changed |= _write_if_changed(path, contents)
+        host_vars_dir = local_dir/'host_vars'
+        if self.injector(ConfigLayout).ansible.inventory_host_vars:
+            for stale in host_vars_dir.glob('*.yml'):
+                if f'host_vars/{stale.name}' not in files:
+                    stale.unlink()
+                    changed = True
+        elif host_vars_dir.exists() and (not remote or any(host_vars_dir.iterdir())):
+            shutil.rmtree(host_vars_dir)
+            changed = True
+        if not remote:
+            return changed
+        key = await self.ainjector.get_instance_async(ssh.SshKey)
+        await key.rsync('-t', local_dir/'hosts.yml', destination)
+        # An empty host_vars removes stale host variables from the remote inventory
+        host_vars_dir.mkdir(exist_ok=True)
+        await key.rsync(
+            '-rt', '--delete', str(host_vars_dir)+'/',
+            ssh.RsyncPath(destination.machine,
+                          os.path.join(os.path.dirname(destination.path), 'host_vars')+'/',
+                          destination.runas_user))
+        return changed
+
+
+def _write_if_changed(path: Path, contents: str):
+    try:
+        if path.read_text() == contents: return False
+    except (FileNotFoundError, UnicodeDecodeError): pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(path.name + '.tmp')
+    temp.write_text(contents)
+    os.replace(temp, path)
+    return True
 
 
 class AnsibleGroupPlugin(Injectable, ABC):
@@ -436,6 +554,7 @@ async def run_play(hosts, play,
                    vars=None, inventory=None,
                    log=None,
                    origin=None,
+                   extra_args=[],
                    ainjector):
     '''
     Run a single Ansible play, specified as a python dictionary.
@@ -493,6 +612,7 @@ async def run_play(hosts, play,
                                inventory=inventory,
                                raise_on_failure=raise_on_failure,
                                log=log,
+                               extra_args=extra_args,
                                origin=dependency_quote(origin))
 
 __all__ += ['run_play']
@@ -608,6 +728,8 @@ class AnsibleResult:
         self.tasks = {}
         for p in res['plays']:
             for t in p['tasks']:
+                # Copy so that self.json remains the ansible output
+                t = dict(t)
                 t.update(t['task'])
                 del t['task']
                 t['duration'] = SimpleNamespace(**t['duration'])
@@ -622,6 +744,21 @@ class AnsibleResult:
     def success(self):
         return (self.unreachable == 0) and (self.failures == 0)
 
+    def for_host(self, host: str):
+        '''
+        :returns: An :class:`AnsibleResult` with only the results for the inventory host *host*, as if the playbook had been run against *host* alone.  If no play matched *host*, the result is empty and successful.
+        '''
+        res = dict(self.json)
+        res['stats'] = {host: self.json['stats'][host]} if host in self.json['stats'] else {}
+        plays = []
+        for p in self.json['plays']:
+            p = dict(p)
+            p['tasks'] = [dict(t, hosts={host: t['hosts'][host]})
+                          for t in p['tasks'] if host in t['hosts']]
+            plays.append(p)
+        res['plays'] = plays
+        return AnsibleResult(res)
+
     def __repr__(self):
         res = f"<AnsibleResult: \
 failures: {self.failures}; unreachable: {self.unreachable}; ok: {self.ok}; changed: {self.changed};\
@@ -658,6 +795,77 @@ def _handle_host_origin(host, origin):
     return host, dict(origin=dependency_quote(host)), base_vars
 
 
+def _ansible_host_name(host):
+    if hasattr(host, 'ansible_inventory_name'):
+        return host.ansible_inventory_name
+    return host.name
+
+@dataclasses.dataclass
+class _AnsibleBatch:
+    hosts: list
+    future: asyncio.Future
+
+#: For each injector that runs batches of ansible, the batches being collected there, keyed by everything else that must match for hosts to share a run
+_ansible_batches: weakref.WeakKeyDictionary[Injector, dict[tuple, _AnsibleBatch]] = weakref.WeakKeyDictionary()
+
+#: Dependencies of :func:`run_playbook`; a batch is run by the nearest injector providing any of them
+_batch_dependencies = (AnsibleInventory, AnsibleConfig, ConfigLayout, SshKey, SshAgent, ansible_origin, ansible_log)
+
+async def _batch_key(ainjector, host, *key, origin, extra_args=()):
+    # Returns None if the run for *host* cannot be batched; otherwise
+    # the injector to run the batch with and the batch key.
+    config = ainjector.injector(ConfigLayout)
+    if config.ansible.batch_window <= 0 or origin or not isinstance(host, Machine):
+        return None
+    if await ainjector.get_instance_async(InjectionKey(ansible_log, _optional=True)):
+        # Ansible output is only parsed per host without a log
+        return None
+    # The nearest injector providing any of these resolves them all the same way as *ainjector*
+    batch_injector = ainjector.injector
+    while not any(k in batch_injector for k in _batch_dependencies):
+        batch_injector = batch_injector.parent_injector
+    return batch_injector, (*key, tuple(extra_args))
+
+async def _run_batched(injector, key, host, run):
+    '''
+    Run ansible for *host* together with any other hosts submitted with the same *injector* and *key* within *ansible.batch_window* seconds.
+
+    :param run: A coroutine function that runs ansible with a given :class:`AsyncInjector` for a list of hosts (with *raise_on_failure* False) and returns an :class:`AnsibleResult`.
+
+    :returns: The :class:`AnsibleResult` for *host*.
+    '''
+    batches = _ansible_batches.setdefault(injector, {})
+    batch = batches.get(key)
+    if batch is None:
+        batch = _AnsibleBatch(hosts=[], future=asyncio.get_running_loop().create_future())
+        batches[key] = batch
+        asyncio.ensure_future(_flush_batch(injector, key, batch, run))
+    if host not in batch.hosts:
+        batch.hosts.append(host)
+    result = await asyncio.shield(batch.future)
+    return result.for_host(_ansible_host_name(host))
+
+async def _flush_batch(injector, key, batch, run):
+    config = injector(ConfigLayout)
+    await asyncio.sleep(config.ansible.batch_window)
+    batches = _ansible_batches.get(injector, {})
+    if batches.get(key) is batch:
+        del batches[key]
+    forks = max(1, min(len(batch.hosts), config.ansible.batch_forks))
+    logger.debug('Running ansible for %d hosts in one batch', len(batch.hosts))
+    try:
+        batch.future.set_result(await run(injector(AsyncInjector), batch.hosts, ['-f', str(forks)]))
+    except BaseException as e:
+        batch.future.set_exception(e)
+        # Avoid warnings if every waiter has been cancelled
+        batch.future.exception()
+
+def _check_batched_result(result, description, host):
+    if not result.success:
+        raise AnsibleFailure(f'Failed running {description} on {_ansible_host_name(host)}', result)
+    return result
+
+
 class ansible_playbook_task(setup_tasks.TaskWrapper):
 
     extra_attributes = frozenset({'dir', 'playbook'})
@@ -668,10 +876,19 @@ class ansible_playbook_task(setup_tasks.TaskWrapper):
             args = []
             if base_vars:
                 for k,v in base_vars.items():
-                    args.append(shlex.join(f'-e{k}={v}'))
-                    
-            return await inst.ainjector(run_playbook, host, self.dir.joinpath(self.playbook),  extra_args=args,
-                                        **extra_args)
+                    args.append(shlex.quote(f'-e{k}={v}'))
+            playbook_path = self.dir.joinpath(self.playbook)
+            batch = await _batch_key(inst.ainjector, host, 'playbook', str(playbook_path),
+                                     origin=extra_args.get('origin'), extra_args=args)
+            if batch is None:
+                return await inst.ainjector(run_playbook, host, playbook_path,  extra_args=args,
+                                            **extra_args)
+            async def run(ainjector, hosts, batch_args):
+                return await ainjector(
+                    run_playbook, hosts, playbook_path,
+                    extra_args=args+batch_args, raise_on_failure=False)
+            result = await _run_batched(*batch, host, run)
+            return _check_batched_result(result, playbook_path, host)
         super().__init__(
             func=func,
             description=f'Run {playbook} playbook',
@@ -716,14 +933,31 @@ def ansible_role_task(roles, vars=None,
             play.append(dict(
                 import_role=r_dict))
 
-        return await ainjector(
-            run_play,
-            hosts=[host],
-            play=play,
-            vars=vars,
-            base_vars=base_vars,
-            **extra_args
-        )
+        try:
+            # vars that need resolving may differ per machine, so are not batched
+            batch = await _batch_key(
+                ainjector, host, 'roles',
+                yaml.safe_dump(dict(play=play, vars=vars, base_vars=base_vars)),
+                origin=extra_args.get('origin'))
+        except yaml.representer.RepresenterError:
+            batch = None
+        if batch is None:
+            return await ainjector(
+                run_play,
+                hosts=[host],
+                play=play,
+                vars=vars,
+                base_vars=base_vars,
+                **extra_args
+            )
+        async def run(batch_ainjector, hosts, batch_args):
+            return await batch_ainjector(
+                run_play, hosts=hosts, play=play,
+                vars=vars, base_vars=dict(base_vars),
+                raise_on_failure=False,
+                extra_args=batch_args)
+        result = await _run_batched(*batch, host, run)
+        return _check_batched_result(result, f'{roles} roles', host)
     if isinstance(roles, (str, dict)):
         roles = [roles]
     return apply_roles
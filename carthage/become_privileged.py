@@ -58,6 +58,7 @@ class BecomePrivilegedMixin(machine.Machine):
             _user = self.runas_user
         if not self.become_privileged(_user):
             return await super().run_command(*args, _user=_user, **kwargs)
+        await self.ssh_multiplex()
         return await self.ssh(
             'cd / &&',
             *self.become_privileged_command(_user),
@@ -89,6 +90,7 @@ async def sshfs_sftp_finder(
 
     '''
     agent = await machine.ainjector.get_instance_async(SshAgent)
+    await machine.ssh_multiplex()
     sftp_command_list = become_privileged_command + [
         '/bin/sh', '-c',
         SFTP_SERVER_COMMAND(prefix)]
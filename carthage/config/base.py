@@ -60,6 +60,45 @@ class TasksConfig(ConfigSchema, prefix="tasks"):
     #: If True, then do not actually execute tasks
     dry_run: bool = False
 
+    #: Where setup task completion stamps are kept: ``files`` for a ``.stamp-*`` file per task, or ``sqlite`` for a single index in *cache_dir* (see :mod:`carthage.stamp_index`)
+    stamp_backend: str = "files"
+
+
+class DeploymentConfig(ConfigSchema, prefix="deployment"):
+
+    #: The maximum number of deployables operated on at once by a deployment or destroy; 0 means no limit
+    max_concurrency: int = 0
+
+    #: If True, run_deployment deploys deployables after their dependencies rather than all at once
+    dependency_order: bool = False
+
+    #: The maximum number of existence checks run at once while looking for orphans; 0 means no limit
+    probe_concurrency: int = 16
+
+
+class SshConfig(ConfigSchema, prefix="ssh"):
+
+    #: If True, ssh connections to a machine share one multiplexed master connection (ssh ControlMaster) rather than each connecting and authenticating separately
+    multiplex: bool = False
+
+    #: Seconds a multiplexed master connection persists once no connections are using it
+    control_persist: int = 300
+
+
+class AnsibleSchema(ConfigSchema, prefix="ansible"):
+
+    #: The maximum number of ansible inventory plugin calls (host_vars, groups_for, group_info) in progress at once; 0 means no limit
+    inventory_concurrency: int = 32
+
+    #: If True, AnsibleInventory writes each host's variables to ``host_vars/<host>.yml`` beside the inventory rather than into it, so that only changed hosts are rewritten and transferred
+    inventory_host_vars: bool = False
+
+    #: Seconds during which ansible_role_task and ansible_playbook_task runs with the same roles or playbook on different machines are collected into one ansible-playbook run; 0 runs each machine separately
+    batch_window: float = 0.0
+
+    #: The maximum number of forks (hosts in parallel) for a batched ansible-playbook run
+    batch_forks: int = 20
+
 
 class DebianConfig(ConfigSchema, prefix="debian"):
     mirror: ConfigString = "http://deb.debian.org/debian"
@@ -86,4 +125,10 @@ class LibvirtSchema(ConfigSchema, prefix='libvirt'):
     #it is better to use OS-level facilities like reflinks to obtain
     #copy-on-write.
     use_backing_file: bool = False
+
+    #: When creating an image that is a plain copy of a base image in
+    #the same format, try a whole-file copy-on-write clone (FICLONE)
+    #first.  Support is probed once per filesystem; if cloning is not
+    #possible, images are copied as before.
+    reflink: bool = True
     
@@ -0,0 +1,228 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+A persistent manifest of a directory tree such as a container build context.
+
+A :class:`ContextManifest` records the size, modification time and inode of every entry below a root, along with a hash of each file's contents.  A later :meth:`~ContextManifest.scan` only reads files whose size, modification time or inode changed, so it gives an exact answer to whether the tree changed at the cost of a *stat* per entry.  :meth:`~ContextManifest.sync` uses a scan to bring a copy of the tree up to date, copying only changed entries.
+
+'''
+
+from __future__ import annotations
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+__all__ = ['ContextManifest', 'ContextScan']
+
+logger = logging.getLogger('carthage.context_manifest')
+
+#: Version of the manifest file format; manifests with another version are ignored.
+manifest_version = 1
+
+
+def _hash_file(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_exclude(relpath):
+    '''Exclude the setup task stamps and manifests that live beside a copied context.
+    '''
+    return '/' not in relpath and relpath.startswith(('.stamp-', '.context-manifest'))
+
+
+@dataclasses.dataclass
+class ContextScan:
+
+    '''The result of :meth:`ContextManifest.scan`.
+    '''
+
+    #: Maps each relative path to a list of type (``f``, ``d`` or ``l``), size, modification time in nanoseconds, inode, mode, a hash of the contents (the link target for symbolic links), and the size, modification time and inode of the copy made by :meth:`ContextManifest.sync`
+    entries: dict
+    #: Relative paths that are new or changed since the manifest was saved
+    changed: list
+    #: Relative paths in the manifest that no longer exist
+    removed: list
+
+    @property
+    def modified(self):
+        return bool(self.changed or self.removed)
+
+    @property
+    def digest(self):
+        '''A digest of the names, types, modes and contents of the tree.  Unlike :attr:`modified`, this does not depend on modification times or inodes.
+        '''
+        h = hashlib.blake2b(digest_size=20)
+        for path in sorted(self.entries):
+            kind, size, mtime, ino, mode, content, copied = self.entries[path]
+            h.update(f'{path}\0{kind}\0{mode:o}\0{content}\0'.encode('utf-8', 'surrogateescape'))
+        return h.hexdigest()
+
+
+class ContextManifest:
+
+    '''
+    The manifest of the tree below *root*, stored in the JSON file *path*.
+
+    :param exclude: A function of a path relative to *root* returning True if that entry (and anything below it) should be ignored.
+    '''
+
+    def __init__(self, path, root, exclude=default_exclude):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.exclude = exclude
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if data.get('version') != manifest_version or data.get('root') != str(self.root):
+            return {}
+        return data['entries']
+
+    def save(self, entries=None):
+        if entries is not None:
+            self.entries = entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'wt') as f:
+            json.dump(dict(version=manifest_version, root=str(self.root), entries=self.entries), f)
+        os.replace(tmp, self.path)
+
+    def scan(self):
+        '''
+        Walk *root*, hashing only the files that differ in size, modification time or inode from the manifest.
+
+        The manifest itself is not updated; pass :attr:`ContextScan.entries` to :meth:`save` once the scan has been acted on.
+
+        :returns: A :class:`ContextScan`.
+        '''
+        entries = {}
+        changed = []
+        old_entries = self.entries
+
+        def visit(relpath, path):
+            try:
+                stat = os.lstat(path)
+            except FileNotFoundError:
+                return
+            mode = stat.st_mode & 0o7777
+            if os.path.islink(path):
+                kind, content = 'l', os.readlink(path)
+            elif os.path.isdir(path):
+                kind, content = 'd', ''
+            else:
+                kind = 'f'
+                old = old_entries.get(relpath)
+                if old and old[:4] == ['f', stat.st_size, stat.st_mtime_ns, stat.st_ino]:
+                    content = old[5]
+                else:
+                    content = _hash_file(path)
+            entry = [kind, stat.st_size if kind == 'f' else 0, stat.st_mtime_ns, stat.st_ino, mode, content, None]
+            entries[relpath] = entry
+            old = old_entries.get(relpath)
+            if old is None or old[0] != kind or old[4:6] != entry[4:6]:
+                changed.append(relpath)
+            else:
+                entry[6] = old[6]
+            if kind == 'd':
+                for name in sorted(os.listdir(path)):
+                    child = f'{relpath}/{name}' if relpath else name
+                    if self.exclude(child): continue
+                    visit(child, os.path.join(path, name))
+
+        visit('', self.root)
+        entries.pop('', None)
+        if changed and changed[0] == '':
+            del changed[0]
+        removed = [p for p in old_entries if p not in entries]
+        return ContextScan(entries=entries, changed=changed, removed=removed)
+
+    def sync(self, destination):
+        '''
+        Make *destination* a copy of *root*, copying only entries that changed since the last sync and removing entries that were removed from *root*.  Copies that were modified in *destination* since the last sync are copied again.  Other entries in *destination* are removed unless *exclude* is true for them, so setup task stamps and manifests kept beside the copy survive.  If *destination* does not exist, everything is copied.
+
+        :returns: The :class:`ContextScan` used; the manifest has been saved.
+        '''
+        destination = Path(destination)
+        if not destination.exists():
+            self.entries = {}
+        scan = self.scan()
+        # Remove the deepest entries first
+        for relpath in sorted(scan.removed, reverse=True):
+            _remove(destination/relpath)
+        destination.mkdir(parents=True, exist_ok=True)
+        changed = set(scan.changed)
+        copied = 0
+        for relpath, entry in scan.entries.items():
+            kind, size, mtime, ino, mode, content, copy_stat = entry
+            target = destination/relpath
+            if relpath not in changed:
+                try:
+                    stat = os.lstat(target)
+                except FileNotFoundError:
+                    stat = None
+                if stat is not None and (
+                        kind == 'd' and os.path.isdir(target) and not os.path.islink(target)
+                        or kind == 'l' and os.path.islink(target) and os.readlink(target) == content
+                        or kind == 'f' and copy_stat == [stat.st_size, stat.st_mtime_ns, stat.st_ino]):
+                    continue
+            old = self.entries.get(relpath)
+            if old and old[0] != kind or kind != 'd' or os.path.islink(target):
+                _remove(target)
+            copied += 1
+            if kind == 'd':
+                target.mkdir(exist_ok=True)
+                os.chmod(target, mode)
+            elif kind == 'l':
+                os.symlink(content, target)
+            else:
+                tmp = target.with_name(target.name + '.context-tmp')
+                shutil.copy2(self.root/relpath, tmp, follow_symlinks=False)
+                os.replace(tmp, target)
+                stat = os.lstat(target)
+                entry[6] = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        removed = len(scan.removed) + self._remove_extra(destination, scan.entries)
+        if copied or removed:
+            logger.debug('synchronized %s to %s: %d copied, %d removed',
+                         self.root, destination, copied, removed)
+        self.save(scan.entries)
+        return scan
+
+    def _remove_extra(self, destination, entries):
+        # Remove entries in *destination* that are not in *entries*;
+        # returns the number removed.
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(destination):
+            reldir = os.path.relpath(dirpath, destination)
+            for name in dirnames + filenames:
+                relpath = name if reldir == '.' else f'{reldir}/{name}'
+                if relpath in entries or self.exclude(relpath): continue
+                _remove(Path(dirpath)/name)
+                removed += 1
+                if name in dirnames: dirnames.remove(name)
+        return removed
+
+
+def _remove(path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try: path.unlink()
+        except FileNotFoundError: pass
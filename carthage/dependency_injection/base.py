@@ -23,6 +23,7 @@ import sys
 from dataclasses import dataclass
 from .. import tb_utils, event
 from .introspection import *
+from . import introspection
 from ..utils import NotPresent
 
 _chatty_modules = {asyncio.futures, asyncio.tasks, sys.modules[__name__]}
@@ -170,6 +171,7 @@ class DependencyProvider:
                  'instantiation_contexts',
                  'keys',
                  '_creation_tb',
+                 '__weakref__',
                  )
 
     def __init__(self, provider, allow_multiple=False, close=True):
@@ -197,9 +199,11 @@ class DependencyProvider:
 
 
     def record_instantiation(self, instance, k, satisfy_against, final):
-        dp = satisfy_against._providers.setdefault(
-            k, DependencyProvider(
-                instance, self.allow_multiple, close=self.close))
+        dp = satisfy_against._providers.get(k)
+        if dp is None:
+            dp = DependencyProvider(
+                instance, self.allow_multiple, close=self.close)
+            satisfy_against._store_provider(k, dp)
         assert dp.needs_quote or dp.provider is instance
         dp.provider = instance
         if final:
@@ -257,6 +261,25 @@ class Injector(Injectable, event.EventListener):
     def __init__(self, *providers,
                  parent_injector=None):
         self._providers = {}
+        # Bumped whenever _providers changes.
+        self._generation = 0
+        # Bumped whenever _providers of this injector or any of its
+        # parents change; _invalidate pushes changes down through
+        # _children so that validating a cache entry is constant time.
+        self._chain_generation = 0
+        self._children = weakref.WeakSet()
+        # Maps InjectionKey to (chain generation, weak provider, weak
+        # instantiation target) or (chain generation, None, None) if
+        # the key was not found.
+        self._resolution_cache = {}
+        # Indices used by filter.  Each maps to a dict used as an
+        # ordered set of keys in the order they were added to
+        # _providers.
+        self._target_index = {}
+        self._constraint_index = {}
+        # Maps (target, constraints, stop_at) to (generation, parent
+        # filter result, filter result)
+        self._filter_cache = {}
         self._pending = weakref.WeakSet()
         self.closed = False
         self._closing = False
@@ -268,6 +291,7 @@ class Injector(Injectable, event.EventListener):
         self.parent_injector = parent_injector
         self.claimed_by = None
         if self.parent_injector:
+            parent_injector._children.add(self)
             event_scope = self.parent_injector._event_scope
             event_scope.add_child(parent_injector, self)
         else:
@@ -326,17 +350,16 @@ class Injector(Injectable, event.EventListener):
                 return k
             existing_provider = self._get(k)
             if replace:
+                self._invalidate()
                 existing_provider.provider = p.provider
                 existing_provider.keys.add(k)
             else:
                 raise ExistingProvider(k, existing_provider, p)
         else:
-            self._providers[k] = p
-            p.keys.add(k)
+            self._store_provider(k, p)
         for k2 in k.supplementary_injection_keys(p.provider):
             if k2 not in self:
-                self._providers[k2] = p
-                p.keys.add(k2)
+                self._store_provider(k2, p)
         self.emit_event(
             k, "add_provider",
             p.provider,
@@ -353,21 +376,60 @@ class Injector(Injectable, event.EventListener):
     def _get(self, k):
         return self._providers[k]
 
+    def _store_provider(self, k, p):
+        # All additions to _providers go through here so that the
+        # filter indices and the generations stay in sync.
+        self._invalidate()
+        self._providers[k] = p
+        p.keys.add(k)
+        self._target_index.setdefault(k.target, {})[k] = True
+        for c in k.constraints:
+            self._constraint_index.setdefault((k.target, c), {})[k] = True
+
+    def _invalidate(self):
+        # Called whenever _providers changes.  Resolutions cached by
+        # this injector or any of its descendants may now be stale.
+        self._generation += 1
+        pending = [self]
+        while pending:
+            injector = pending.pop()
+            injector._chain_generation += 1
+            pending.extend(injector._children)
+
     def _get_parent(self, k):
         # Returns  DependencyProvider, instantiation_target
+        # Repeated lookups are answered from _resolution_cache until
+        # this injector or one of its parents changes providers.
+        cached = self._resolution_cache.get(k)
+        if cached is not None and cached[0] == self._chain_generation:
+            generation, provider_ref, target_ref = cached
+            if provider_ref is None:
+                raise KeyError("{} not found".format(k))
+            provider, target = provider_ref(), target_ref()
+            if provider is not None and target is not None:
+                return provider, target
+        generation = self._chain_generation
+        result = self._find_provider(k)
+        if result is None:
+            self._resolution_cache[k] = (generation, None, None)
+            raise KeyError("{} not found".format(k))
+        self._resolution_cache[k] = (generation, weakref.ref(result[0]), weakref.ref(result[1]))
+        return result
+
+    def _find_provider(self, k):
+        # Returns (DependencyProvider, instantiation_target) or None
         injector = self
         while injector is not None:
-            try:
+            p = injector._providers.get(k)
+            if p is not None:
                 # If the key allows multiple providers, then
                 # satisfy against ourself and store the result in
                 # ourself.  Otherwise if a single provider is
                 # required, then satisfy against the injector
                 # where the key is introduced and store there.
-                p = injector._providers[k]
                 return p, (self if p.allow_multiple else injector)
-            except KeyError:
-                injector = injector.parent_injector
-        raise KeyError("{} not found".format(k))
+            injector = injector.parent_injector
+        return None
 
     def injector_containing(self, k):
         '''
@@ -426,24 +488,57 @@ Return the first injector in our parent chain containing *k* or None if there is
             plugin_keys =injector.filter(CarthagePlugin, ['name'])
 
         '''
-        def filter_for_constraints(k):
-            return all(map(lambda c: c in k.constraints, constraints))
-        if isinstance(predicate, list):
-            constraints = predicate
-            predicate = filter_for_constraints
         if isinstance(stop_at, AsyncInjector):
             stop_at = stop_at.injector
         assert isinstance(stop_at, (Injector, type(None)))
-        if stop_at == self:
-            result = {}  # stop here
+        if isinstance(predicate, list):
+            return list(self._filter_constraints(target, tuple(predicate), stop_at))
+        return list(self._filter_predicate(target, predicate, stop_at))
+
+    def _filter_parent(self, stop_at):
+        # Returns the injector whose results should be merged ahead of ours or None
+        if stop_at is self:
+            return None
         elif stop_at and not self.parent_injector:
             raise ValueError(f'{stop_at} was not in the parent chain')
-        elif self.parent_injector:
-            result = {k: True for k in self.parent_injector.filter(target, predicate, stop_at=stop_at)}
-        else:  # no stop_at; ended chain
+        return self.parent_injector
+
+    def _filter_constraints(self, target, constraints, stop_at):
+        # Results are memoized until our providers or the parent's
+        # result change, so repeated filters only pay for merging
+        # once.  Candidates come from the target and constraint
+        # indices rather than from every key in _providers.
+        cache_key = (target, constraints, stop_at)
+        parent = self._filter_parent(stop_at)
+        parent_result = parent._filter_constraints(target, constraints, stop_at) if parent else ()
+        cached = self._filter_cache.get(cache_key)
+        if cached is not None and cached[0] == self._generation and cached[1] is parent_result:
+            return cached[2]
+        result = dict.fromkeys(parent_result, True)
+        if not target:
+            candidates = self._providers
+            remaining = constraints
+        elif constraints:
+            candidates = self._constraint_index.get((target, constraints[0]), {})
+            remaining = constraints[1:]
+        else:
+            candidates = self._target_index.get(target, {})
+            remaining = ()
+        result.update((k, True) for k in candidates
+                      if all(c in k.constraints for c in remaining))
+        result = tuple(result.keys())
+        self._filter_cache[cache_key] = (self._generation, parent_result, result)
+        return result
+
+    def _filter_predicate(self, target, predicate, stop_at):
+        parent = self._filter_parent(stop_at)
+        if parent:
+            result = parent._filter_predicate(target, predicate, stop_at)
+        else:
             result = {}
-        result.update({k: True for k in self._providers.keys() if ((not target) or   k.target is target ) and predicate(k)})
-        return list(result.keys())
+        candidates = self._target_index.get(target, {}) if target else self._providers
+        result.update((k, True) for k in candidates if predicate(k))
+        return result
 
     def filter_instantiate(self, target, predicate, *, stop_at=None, ready=False):
         '''
@@ -555,7 +650,21 @@ Return the first injector in our parent chain containing *k* or None if there is
             res = DeferredInjection(injector=self, key=k)
             if placement:
                 placement(res)
-                return res
+            return res
+        if not introspection.introspection_enabled:
+            # Fast path for providers that are already final.
+            result = provider.provider
+            final = True
+            if isinstance(result, dependency_quote):
+                result = result.value
+            elif isinstance(result, asyncio.Future) or provider.is_factory:
+                final = False
+            elif not is_obj_ready(result):
+                final = not (k.ready if (k.ready is not None) else instantiate_to_ready.get())
+            if final:
+                if placement:
+                    placement(result)
+                return result
         with InstantiationContext(
                 satisfy_against, self, k, provider,
                 k.ready if (k.ready is not None) else instantiate_to_ready.get()) as instantiation_context:
@@ -691,7 +800,10 @@ Return the first injector in our parent chain containing *k* or None if there is
         async def callback(futures):
             try:
                 await asyncio.gather(*futures)
-                # since that succeeded, allkwargs are placed
+                for k, future in pending:
+                    res = future.result()
+                    if res is not NotPresent:
+                        kwargs[k] = res
                 res = handle_result(mark_instantiation_done=False)
                 if isinstance(res, asyncio.Future):
                     return await res
@@ -700,22 +812,13 @@ Return the first injector in our parent chain containing *k* or None if there is
                 if _instantiation_context:
                     _instantiation_context.done()
 
-        def kwarg_place(k):
-            def collect(res):
-                if res is not NotPresent:
-                    kwargs[k] = res
-            return collect
-        try:
-            futures = []
-
-            dks = set(filter(
-                lambda k: cls._injection_dependencies[k] is not None,
-                cls._injection_dependencies.keys()))
-        except AttributeError:
-            dks = set()
+        plan = _injection_plan(cls)
+        futures = []
+        # (kwarg, future) for dependencies that are not yet available
+        pending = []
         injector = self  # or sub_injector if created
         sub_injector = None
-        kwarg_dependencies = set(kwargs.keys()) & dks
+        kwarg_dependencies = plan.names.intersection(kwargs) if kwargs else None
         try:  # clean up sub_injector
             if kwarg_dependencies:
                 sub_injector = (type(self))(self)
@@ -728,13 +831,15 @@ Return the first injector in our parent chain containing *k* or None if there is
                     if isinstance(provider, Injectable) and not provider.satisfies_injection_key(dependency):
                         raise UnsatisfactoryDependency(dependency, provider)
                     sub_injector.add_provider(dependency, provider, close=False)
-            for k, d in (cls._injection_dependencies.items()) if dks else []:
-                if d is None:
-                    continue
+            for k, d in plan.dependencies:
                 try:
-                    injector.get_instance(d, placement=kwarg_place(k),
-                                          loop=_loop, futures=futures,
-                                          defer_dependencies=True)
+                    futures_len = len(futures)
+                    res = injector.get_instance(d, loop=_loop, futures=futures,
+                                                defer_dependencies=True)
+                    if len(futures) > futures_len:
+                        pending.append((k, res))
+                    elif res is not NotPresent:
+                        kwargs[k] = res
                 except KeyError as e:
                     if _instantiation_context:
                         raise InjectionFailed(current_instantiation()) from e
@@ -885,6 +990,13 @@ Return the first injector in our parent chain containing *k* or None if there is
         self.closed = True
         del providers
         self._providers.clear()
+        self._resolution_cache.clear()
+        self._target_index.clear()
+        self._constraint_index.clear()
+        self._filter_cache.clear()
+        self._invalidate()
+        if self.parent_injector is not None:
+            self.parent_injector._children.discard(self)
         self.parent_injector = None
 
     def __del__(self):
@@ -949,6 +1061,11 @@ class InjectionKey:
 
     _target_injection_keys = weakref.WeakKeyDictionary()
 
+    #: Constrained keys are interned here so that rebuilding an equal key returns the same object.
+    _interned_keys = weakref.WeakValueDictionary()
+
+    __slots__ = ('target', 'constraints', '_hash', '__weakref__') + tuple(_INJECTION_KEY_DEFAULTS)
+
     def __new__(cls, target_, *, require_type=False, **constraints):
         assert (cls is InjectionKey) or set(constraints) - \
             cls.POSSIBLE_PARAMETERS, "You cannot subclass InjectionKey with empty constraints"
@@ -967,29 +1084,48 @@ class InjectionKey:
         if (not constraints):
             if target_ in cls._target_injection_keys:
                 return cls._target_injection_keys[target_]
-        self = super().__new__(cls)
         customized = bool(constraints)
         if '_optional' not in constraints:
             try:
                 constraints['_optional'] = constraints.pop('optional')
             except KeyError:
                 pass
-        for k in _INJECTION_KEY_DEFAULTS:
-            self.__dict__[k] = constraints.pop(
-                '_' + k, _INJECTION_KEY_DEFAULTS[k])
-
-        self.__dict__['constraints'] = dict(constraints)
-        self.__dict__['target'] = target_
+        parameters = tuple(constraints.pop('_' + k, default) for k, default in _INJECTION_KEY_DEFAULTS.items())
+        # Values are interned along with their types so that for
+        # example name=1 and name=True produce different keys.
+        intern_key = (cls, target_,
+                      tuple((v, type(v)) for v in parameters),
+                      tuple((k, v, type(v)) for k, v in constraints.items()))
+        try:
+            self = cls._interned_keys.get(intern_key)
+        except TypeError:
+            # Some constraint is not hashable.
+            self = intern_key = None
+        if self is not None:
+            return self
+        self = super().__new__(cls)
+        for k, v in zip(_INJECTION_KEY_DEFAULTS, parameters):
+            object.__setattr__(self, k, v)
+        object.__setattr__(self, 'constraints', constraints)
+        object.__setattr__(self, 'target', target_)
+        try:
+            key_hash = hash(target_) + sum(hash(k) for k in constraints.keys()) + \
+                sum(hash(v) for v in constraints.values())
+        except TypeError:
+            key_hash = None
+        object.__setattr__(self, '_hash', key_hash)
+        if intern_key is not None:
+            cls._interned_keys[intern_key] = self
         if (not customized) and not isinstance(target_, (str, int, float)):
             cls._target_injection_keys[target_] = self
         return self
 
     def __getattr__(self, k):
-        if k in self.__dict__:
-            return self.__dict__[k]
-        if k in self.__dict__['constraints']:
-            return self.__dict__['constraints'][k]
-        raise AttributeError
+        # Only called for constraints; parameters are slots.
+        try:
+            return object.__getattribute__(self, 'constraints')[k]
+        except (KeyError, AttributeError):
+            raise AttributeError(k) from None
 
     def __repr__(self):
         r = "InjectionKey({}".format(
@@ -1004,19 +1140,20 @@ class InjectionKey:
         raise TypeError('InjectionKeys are immutable')
 
     def __hash__(self):
-        return hash(self.target) + sum([hash(k) for k in self.constraints.keys()]) + \
-            sum([hash(v) for v in self.constraints.values()])
+        if self._hash is None:
+            # Raises the appropriate TypeError for an unhashable constraint
+            return hash(self.target) + sum(hash(v) for v in self.constraints.values())
+        return self._hash
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, type(self)):
             return False
-        if self.target != other.target:
-            return False
-        if len(self.constraints) != len(other.constraints):
+        if self._hash is not None and other._hash is not None \
+           and self._hash != other._hash:
             return False
-        if all(map(lambda k: k in other.constraints and self.constraints[k] == other.constraints[k], self.constraints.keys())):
-            return True
-        return False
+        return self.target == other.target and self.constraints == other.constraints
 
     def supplementary_injection_keys(self, p):
         if (isinstance(p, type) and issubclass(p, Injectable)) or \
@@ -1100,6 +1237,41 @@ class UnsatisfactoryDependency(RuntimeError):
     reason: str = None
 
 
+class _InjectionPlan:
+
+    '''
+    The dependencies of a class or function compiled into the form :meth:`Injector._instantiate` consumes.  Plans are cached on the injected object and are rebuilt whenever :func:`inject` changes the dependencies.
+    '''
+
+    __slots__ = ('source', 'dependencies', 'names')
+
+    def __init__(self, source):
+        #: The *_injection_dependencies* this plan was compiled from
+        self.source = source
+        #: Ordered tuple of (kwarg, InjectionKey) for dependencies that are not None
+        self.dependencies = tuple((k, d) for k, d in source.items() if d is not None)
+        self.names = frozenset(k for k, d in self.dependencies)
+
+
+_empty_injection_plan = _InjectionPlan({})
+
+
+def _injection_plan(fn):
+    try:
+        dependencies = fn._injection_dependencies
+    except AttributeError:
+        return _empty_injection_plan
+    plan = getattr(fn, '_injection_plan', None)
+    if plan is not None and plan.source is dependencies:
+        return plan
+    plan = _InjectionPlan(dependencies)
+    try:
+        fn._injection_plan = plan
+    except (AttributeError, TypeError):
+        pass
+    return plan
+
+
 def inject(**dependencies):
     '''A decorator to indicate that a function requires dependencies:
 
@@ -1163,6 +1335,7 @@ def inject(**dependencies):
                 # So autokwargs doesn't include it
                 fn._injection_this_level.add(k)
             fn._injection_dependencies[k] = v
+        fn._injection_plan = None
         return fn
     return wrap
 
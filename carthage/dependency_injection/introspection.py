@@ -34,6 +34,19 @@ instantiation_roots = GetItemSet()
 
 __all__ += ['instantiation_roots']
 
+#: If False, :meth:`~carthage.dependency_injection.Injector.get_instance` returns dependencies that are already final without creating an :class:`InstantiationContext`.  Such contexts never report progress, so they are only interesting to instrumentation that wants to see every lookup.
+introspection_enabled = False
+
+
+def enable_introspection():
+    '''Track every dependency lookup with an :class:`InstantiationContext`, including lookups of constant values.  Called when instrumentation such as :class:`carthage.entanglement.instrumentation.CarthageRegistry` is attached to an injector.
+    '''
+    global introspection_enabled
+    introspection_enabled = True
+
+
+__all__ += ['enable_introspection']
+
 
 class BaseInstantiationContext:
 
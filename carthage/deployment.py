@@ -9,12 +9,17 @@
 from __future__ import annotations
 import asyncio
 import contextlib
+import contextvars
 import dataclasses
 import enum
+import functools
 import logging
 import re
+import time
 import typing
 import warnings
+import weakref
+from .config import ConfigLayout
 from .dependency_injection import *
 from .dependency_injection import introspection as dependency_introspection, is_obj_ready
 
@@ -104,10 +109,48 @@ class FailureList(list):
 
     '''
 
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._reindex()
+
+    def _reindex(self):
+        # Deployables of members, so that membership does not scan the list
+        self._deployables = {x.deployable for x in self}
+
     def __contains__(self, item):
         if isinstance(item, DeployableProtocol):
-            return any(x.deployable == item for x in self)
+            return item in self._deployables
         return super().__contains__(item)
+
+    def append(self, item):
+        super().append(item)
+        self._deployables.add(item.deployable)
+
+    def extend(self, items):
+        items = list(items)
+        super().extend(items)
+        self._deployables.update(x.deployable for x in items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def insert(self, index, item):
+        super().insert(index, item)
+        self._deployables.add(item.deployable)
+
+    def _reindexing(method):
+        def wrapper(self, *args, **kwargs):
+            try: return method(self, *args, **kwargs)
+            finally: self._reindex()
+        return functools.wraps(method)(wrapper)
+
+    __setitem__ = _reindexing(list.__setitem__)
+    __delitem__ = _reindexing(list.__delitem__)
+    pop = _reindexing(list.pop)
+    remove = _reindexing(list.remove)
+    clear = _reindexing(list.clear)
+    del _reindexing
     
     
 @dataclasses.dataclass(frozen=True)
@@ -169,6 +212,26 @@ class DeploymentResult:
     #: Orphans that will be/have been deleted.  If deleting an orphan
     #fails, it will appear in failures not orphans.
     orphans:list[Deployable] = dataclasses.field(default_factory=lambda: [])
+
+    #: For operations run in dependency order, maps each level of the
+    #dependency graph to the wall-clock seconds from the first
+    #operation in that level starting to the last one finishing.
+    #Level 0 is the deployables that can be handled first.
+    level_timings: dict[int, float] = dataclasses.field(default_factory=lambda: {})
+    #: Seconds each :class:`DeployableFinder` spent finding orphans, keyed by finder name
+    finder_timings: dict[str, float] = dataclasses.field(default_factory=lambda: {})
+
+    _level_bounds: dict[int, list[float]] = dataclasses.field(default_factory=lambda: {}, repr=False, compare=False)
+
+    def _level_timer(self, level):
+        # Returns a function to call when an operation at *level* finishes
+        started = time.time()
+        bounds = self._level_bounds.setdefault(level, [started, started])
+        bounds[0] = min(bounds[0], started)
+        def done():
+            bounds[1] = max(bounds[1], time.time())
+            self.level_timings[level] = bounds[1]-bounds[0]
+        return done
     
     def is_successful(self):
         return self.successes and  not (self.failures or self.dependency_failures or self.instantiation_failure_leaves)
@@ -217,6 +280,14 @@ Ran {self.method} on the following objects successfully:
             result += "\n## Objects Ignored\n\n"
             for ign in self.ignored:
                 result += f"* {ign}\n"
+        if self.level_timings and not dry_run:
+            result += "\n## Time per Dependency Level\n\n"
+            for level, seconds in sorted(self.level_timings.items()):
+                result += f"* level {level}: {seconds:.2f}s\n"
+        if self.finder_timings:
+            result += "\n## Time Finding Orphans\n\n"
+            for name, seconds in sorted(self.finder_timings.items()):
+                result += f"* {name}: {seconds:.2f}s\n"
         result += "\n"
         result += self.summary(dry_run=dry_run)
         return result
@@ -439,10 +510,75 @@ class Deployable(DeployableProtocol):
         Consider classes like :class:`~carthage.machine.Machine` where deployment should include a call to *start_machine*.
         '''
         raise NotIplementedError
+
+    async def deployment_limit(self):
+        '''
+        Optional.  Returns an asynchronous context manager, typically an :class:`asyncio.Semaphore` from :func:`resource_limit`, that a dependency-ordered :func:`run_deployment` holds while deploying this object; or None.  Deployables that contend for the same resource, such as containers on one container host, return the same semaphore so that only a limited number of them are deployed at once.
+        '''
+        return None
     
 
 __all__ += ['Deployable']
 
+def resource_limit(resource, limit: int):
+    '''
+    Returns an :class:`asyncio.Semaphore` allowing *limit* holders that is shared by every caller passing the same *resource* and *limit* during the current :class:`DeploymentPass`; used to implement :meth:`Deployable.deployment_limit`.  Outside a pass, each call returns a new semaphore.  Returns None if *limit* is 0.
+    '''
+    if not limit: return None
+    current = current_deployment_pass()
+    if current is None:
+        return asyncio.Semaphore(limit)
+    limits = current.resource_limits.setdefault(resource, {})
+    try: return limits[limit]
+    except KeyError: pass
+    limits[limit] = asyncio.Semaphore(limit)
+    return limits[limit]
+
+__all__ += ['resource_limit']
+
+class DeploymentPass:
+
+    '''
+    Identifies one call to :func:`find_deployables`, :func:`find_orphan_deployables`, :func:`run_deployment` or :func:`run_deployment_destroy`.  Caches of external state, such as the inventory of objects on a :class:`~carthage.podman.PodmanContainerHost`, may be kept for the duration of a pass; state observed in an earlier pass is never trusted.  A pass started within another pass (for example the :func:`find_deployables` call made by :func:`run_deployment`) is part of the outer pass.
+    '''
+
+    def __init__(self):
+        #: Maps a resource to a dict of limit: semaphore for :func:`resource_limit`
+        self.resource_limits = weakref.WeakKeyDictionary()
+
+_deployment_pass = contextvars.ContextVar('carthage.deployment.deployment_pass', default=None)
+
+def current_deployment_pass():
+    '''
+    :returns: The :class:`DeploymentPass` in progress or None.
+    '''
+    return _deployment_pass.get()
+
+@contextlib.contextmanager
+def deployment_pass():
+    '''
+    A context manager that runs its body within a new :class:`DeploymentPass`, or within the current pass if one is in progress.
+    '''
+    current = _deployment_pass.get()
+    if current is not None:
+        yield current
+        return
+    current = DeploymentPass()
+    token = _deployment_pass.set(current)
+    try:
+        yield current
+    finally:
+        _deployment_pass.reset(token)
+
+__all__ += ['DeploymentPass', 'current_deployment_pass', 'deployment_pass']
+
+def _in_deployment_pass(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with deployment_pass():
+            return await func(*args, **kwargs)
+    return wrapper
+
 class DeployableFinder(AsyncInjectable):
 
     '''
@@ -530,6 +666,7 @@ class MachineDeployableFinder(DeployableFinder):
 @inject(
     ainjector=AsyncInjector,
     )
+@_in_deployment_pass
 async def find_deployables(
         *, ainjector,
         readonly=False,
@@ -626,10 +763,20 @@ async def find_deployable(deployable: Deployable, required:bool = False):
 
 __all__ += ['find_deployable']
 
+async def _gather_limited(limit, coros):
+    # Like asyncio.gather, but at most *limit* at once
+    async def run(coro):
+        async with limit:
+            return await coro
+    return await asyncio.gather(*(run(c) for c in coros))
+
 @inject(ainjector=AsyncInjector)
+@_in_deployment_pass
 async def find_orphan_deployables(
         deployables:list[Deployable] = None,
         *,
+        max_concurrency: int = None,
+        finder_timings: dict[str, float] = None,
         ainjector):
     '''Find any orphans in a set of Deployables. An orphan is a
     deployable that used to be deployed by a layout, but is no longer
@@ -638,49 +785,71 @@ async def find_orphan_deployables(
 
     :param deployments: If slpecified, this should be the result of :func:`find_deployments` with recurse set to True. If None, then find_deployments will be called with recursive and readonly set to True.
 
+    :param max_concurrency: The maximum number of existence probes (calls to :func:`find_deployable`) and :meth:`~Deployable.dynamic_dependencies` calls in progress at once.  Defaults to *deployment.probe_concurrency* from the configuration.
+
+    :param finder_timings: If supplied, a dict that is updated with the seconds each :class:`DeployableFinder` spent in :meth:`~DeployableFinder.find_orphans`, keyed by finder name.
+
     '''
+    if max_concurrency is None:
+        max_concurrency = ainjector.get_instance(ConfigLayout).deployment.probe_concurrency
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
     if deployables is None:
         deployables = await ainjector(find_deployables, readonly=True, recurse=True)
     else:
         deployables = list(deployables)
     try:
         #handle dynamic_dependencies
-        dynamic_dependencies: list[Deployable] = []
         set_as_readonly:list[Deployable] = []
+        async def dynamic_dependencies_for(d):
+            result = []
+            if not hasattr(d, 'dynamic_dependencies'):
+                return result
+            with instantiation_not_ready():
+                for dynamic in await d.dynamic_dependencies():
+                    if isinstance(dynamic, InjectionKey):
+                        dynamic = await d.ainjector.get_instance_async(dynamic)
+                    result.append(dynamic)
+            return result
         this_round = deployables
         while this_round:
-            for d in this_round:
-                if not hasattr(d, 'dynamic_dependencies'):
-                    continue
-                with instantiation_not_ready():
-                    for dynamic in await d.dynamic_dependencies():
-                        if isinstance(dynamic, InjectionKey):
-                            dynamic = await d.ainjector.get_instance_async(dynamic)
-                        dynamic_dependencies.append(dynamic)
+            round_results = await _gather_limited(
+                limit, [dynamic_dependencies_for(d) for d in this_round])
             this_round = []
-            for d in dynamic_dependencies:
-                if d not in deployables:
-                    if not d.readonly and not is_obj_ready(d):
-                        d.readonly = DryRun
-                        set_as_readonly.append(d)
-                    deployables.append(d)
-                    this_round.append(d)
-        deployables = [ d for d in deployables
-                        if await ainjector(find_deployable, d)]
+            for dynamic_dependencies in round_results:
+                for d in dynamic_dependencies:
+                    if d not in deployables:
+                        if not d.readonly and not is_obj_ready(d):
+                            d.readonly = DryRun
+                            set_as_readonly.append(d)
+                        deployables.append(d)
+                        this_round.append(d)
+        found = await _gather_limited(
+            limit, [ainjector(find_deployable, d) for d in deployables])
+        deployables = [d for d, f in zip(deployables, found) if f]
         res = ainjector.filter_instantiate(DeployableFinder, ['name'])
         finders = [x[1] for x in res]
+        async def timed_find_orphans(finder):
+            started = time.time()
+            try:
+                return await ainjector(finder.find_orphans, deployables)
+            finally:
+                elapsed = time.time()-started
+                logger.debug('%s finder spent %.2fs finding orphans', finder.name, elapsed)
+                if finder_timings is not None:
+                    finder_timings[finder.name] = finder_timings.get(finder.name, 0.0)+elapsed
         orphans = []
-        for finder in finders:
-            orphans.extend(await ainjector(finder.find_orphans, deployables))
-            for d in orphans:
-                d.readonly = DryRun
+        for finder_orphans in await asyncio.gather(*(timed_find_orphans(f) for f in finders)):
+            orphans.extend(finder_orphans)
+        for d in orphans:
+            d.readonly = DryRun
         async def orphan_filter(o):
             if await ainjector(find_deployable, o):
                 return True
             else:
                 logger.debug(f'{o} is not an orphan because it does not exist')
                 return False
-        orphans =  [o for o in orphans if await orphan_filter(o)]
+        exists = await _gather_limited(limit, [orphan_filter(o) for o in orphans])
+        orphans =  [o for o, e in zip(orphans, exists) if e]
         return orphans
     finally:
         for d in set_as_readonly:
@@ -688,6 +857,106 @@ async def find_orphan_deployables(
 
 __all__ += ['find_orphan_deployables']
 
+class _DependencyScheduler:
+
+    '''
+    Calls *handle* for each deployable once the deployables it waits for have been handled successfully, with at most *max_concurrency* handles running at once.  If handling a deployable raises, everything waiting on it is never handled; once the run finishes, each such deployable is passed to *dependency_failed* along with the list of every deployable it waits for that failed.
+
+    :param waits_for: Maps each deployable to be handled to the deployables that must be handled first.  A deployable waiting for something not in *waits_for* is never handled.
+
+    :param callbacks: A function returning done callbacks to add to the future handling a deployable.
+
+    :param limit_for: An optional coroutine function returning an asynchronous context manager (or None) to hold while handling a deployable; see :meth:`Deployable.deployment_limit`.
+
+    '''
+
+    def __init__(self, result: DeploymentResult, waits_for: dict,
+                 handle, dependency_failed, *,
+                 max_concurrency: int = 0,
+                 callbacks=lambda d: [],
+                 limit_for=None):
+        self.result = result
+        self.handle = handle
+        self.limit_for = limit_for
+        self.dependency_failed = dependency_failed
+        self.callbacks = callbacks
+        self.limit = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+        #: For each deployable, the number of deployables it waits for that are not yet handled
+        self.remaining = {}
+        #: Maps a deployable to the deployables waiting for it
+        self.waiting_on = {}
+        for d, waits in waits_for.items():
+            self.remaining[d] = len(waits)
+            for w in waits:
+                self.waiting_on.setdefault(w, []).append(d)
+        self.levels = {d: 0 for d in waits_for}
+        self.resolved = set()
+        #: Maps deployables that will not be handled to the failed deployables they wait for
+        self.failing = {}
+        self.futures = []
+
+    async def _handle(self, d):
+        # The per-deployable limit is acquired first so that deployables
+        # waiting on a busy resource do not hold global slots.
+        limit = None
+        if self.limit_for:
+            limit = await self.limit_for(d)
+        async with limit or contextlib.nullcontext():
+            async with self.limit:
+                timer = self.result._level_timer(self.levels[d])
+                try: return await self.handle(d)
+                finally: timer()
+
+    def submit(self, d):
+        self.resolved.add(d)
+        future = asyncio.ensure_future(self._handle(d))
+        future.set_name(f'{self.result.method} {d}')
+        for cb in self.callbacks(d):
+            future.add_done_callback(cb)
+        future.add_done_callback(lambda f: self.handled(d, f))
+        self.futures.append(future)
+
+    def handled(self, d, future):
+        if future.cancelled() or future.exception():
+            return self.failed(d)
+        for p in self.waiting_on.get(d, []):
+            if p in self.resolved: continue
+            self.levels[p] = max(self.levels[p], self.levels[d]+1)
+            self.remaining[p] -= 1
+            if self.remaining[p] == 0:
+                self.submit(p)
+
+    def failed(self, d):
+        to_fail = [d]
+        while to_fail:
+            r = to_fail.pop()
+            for p in self.waiting_on.get(r, []):
+                if p in self.failing:
+                    self.failing[p].append(r)
+                    continue
+                if p in self.resolved: continue
+                self.resolved.add(p)
+                self.failing[p] = [r]
+                to_fail.append(p)
+
+    def unresolved(self):
+        '''Deployables never handled because they wait (possibly in a cycle) on something never handled.'''
+        return [d for d in self.remaining if d not in self.resolved]
+
+    async def run(self):
+        for d, count in self.remaining.items():
+            if count == 0:
+                self.submit(d)
+        while self.futures:
+            futures_last_round = self.futures
+            self.futures = []
+            done, pending_futures = await asyncio.wait(futures_last_round)
+            assert not pending_futures
+        # Reported only now so each list of failed dependencies is complete
+        for p, failing in self.failing.items():
+            self.dependency_failed(p, failing)
+
+
 def clear_dry_run_marker(deployables):
     for d in deployables:
         if d.readonly is DryRun:
@@ -697,6 +966,7 @@ def clear_dry_run_marker(deployables):
                 
 
 @inject(ainjector=AsyncInjector)
+@_in_deployment_pass
 async def run_deployment(
         *,
         dry_run=False,
@@ -704,6 +974,8 @@ async def run_deployment(
         filter=lambda d:None,
         delete_orphans: bool=False,
         orphans:list[Deployable]=None,
+        dependency_order: bool = None,
+        max_concurrency: int = None,
         ainjector):
     '''Run a deployment.
 
@@ -730,6 +1002,10 @@ async def run_deployment(
     will be used.  Otherwise, :func:`find_orphan_deployables` will be
     called.
 
+    :param dependency_order: If True, deploy each Deployable only after the Deployables it depends on (as found by :func:`find_deployables_reverse_dependencies`) have deployed, and skip the dependents of a failure without attempting them.  Deployables are also limited by their :meth:`Deployable.deployment_limit`, for example so that only a few containers are created at once on one container host.  If False, all deployments start at once and dependencies are brought to ready implicitly.  Defaults to *deployment.dependency_order* from the configuration.
+
+    :param max_concurrency: The maximum number of Deployables deployed at once.  Defaults to *deployment.max_concurrency* from the configuration; 0 means no limit.
+
     '''
     async def callback(d):
         future = None
@@ -770,15 +1046,33 @@ async def run_deployment(
                 readonly=find_readonly,
                 recurse=delete_orphans
             )
+    finder_timings = {}
     if delete_orphans and orphans is None:
-        orphans = await ainjector(find_orphan_deployables, deployables=deployables_list)
+        orphans = await ainjector(find_orphan_deployables, deployables=deployables_list, finder_timings=finder_timings)
     to_ignore = await find_to_ignore(deployables_list, filter, dry_run=dry_run)
+    config = ainjector.get_instance(ConfigLayout)
+    if dependency_order is None:
+        dependency_order = config.deployment.dependency_order
+    if max_concurrency is None:
+        max_concurrency = config.deployment.max_concurrency
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+    async def limited_callback(d):
+        async with limit:
+            await callback(d)
     result = DeploymentResult('deploy')
+    result.finder_timings = finder_timings
     futures = []
     with DeploymentIntrospection(ainjector.injector, result):
         try:
-            for d in deployables_list:
-                futures.append(asyncio.ensure_future(callback(d)))
+            if dependency_order:
+                unordered = await _run_deployment_ordered(
+                    ainjector, deployables_list, callback, result,
+                    dry_run=dry_run, to_ignore=to_ignore,
+                    max_concurrency=max_concurrency)
+            else:
+                unordered = deployables_list
+            for d in unordered:
+                futures.append(asyncio.ensure_future(limited_callback(d)))
             if futures:
                 await asyncio.wait(futures) # We should already have captured in result
         finally:
@@ -799,6 +1093,61 @@ async def run_deployment(
 
 __all__ += ['run_deployment']
 
+async def _run_deployment_ordered(ainjector, deployables_list, callback, result, *,
+                                  dry_run, to_ignore, max_concurrency):
+    '''
+    Deploy *deployables_list* in dependency order for :func:`run_deployment`.  Returns Deployables that could not be ordered (because of a dependency cycle); the caller deploys them unordered.
+    '''
+    class DependencyNotDeployed(Exception): pass
+
+    async def handle(d):
+        await callback(d)
+        if d in result.failures or d in result.dependency_failures:
+            raise DependencyNotDeployed
+
+    async def limit_for(d):
+        if dry_run or d.readonly or d in to_ignore or not hasattr(d, 'deployment_limit'):
+            return None
+        try: return await d.deployment_limit()
+        except Exception as e:
+            result.failures.append(DeploymentFailure(deployable=d, exception=e))
+            raise
+
+    def dependency_failed(p, failing):
+        if p in result: return
+        result.dependency_failures.append(
+            DeploymentFailure(deployable=p,
+                              exception=None,
+                              depended_deployables=failing))
+
+    reverse_dependencies = await ainjector(
+        find_deployables_reverse_dependencies,
+        deployables=deployables_list)
+    members = set(deployables_list)
+    waits_for = {d: set() for d in deployables_list}
+    for dependency in deployables_list:
+        # Follow reverse dependencies through objects that are not
+        # being deployed to the Deployables that need *dependency*.
+        seen = set()
+        to_visit = list(reverse_dependencies.get(dependency, []))
+        while to_visit:
+            dependent = to_visit.pop()
+            if dependent in seen or dependent is dependency: continue
+            seen.add(dependent)
+            if dependent in members:
+                waits_for[dependent].add(dependency)
+            else:
+                to_visit.extend(reverse_dependencies.get(dependent, []))
+    scheduler = _DependencyScheduler(
+        result, waits_for, handle, dependency_failed,
+        max_concurrency=max_concurrency,
+        limit_for=limit_for)
+    await scheduler.run()
+    unresolved = scheduler.unresolved()
+    if unresolved:
+        logger.warning('Deploying %s without ordering: dependency cycle', ', '.join(str(d) for d in unresolved))
+    return unresolved
+
 @inject(ainjector=AsyncInjector)
 async def find_deployables_reverse_dependencies(*, readonly=False,
                                                 deployables: list[Deployable]=None,
@@ -945,11 +1294,13 @@ __all__ += ['deployable_name_filter']
 
 
 @inject(ainjector=AsyncInjector)
+@_in_deployment_pass
 async def run_deployment_destroy(
         *,
         dry_run=False,
         deployables: typing.Union[DeploymentResult, list[Deployable]] = None,
         filter=lambda d:None,
+        max_concurrency: int = None,
         _policy_key: InjectionKey=destroy_policy,
         ainjector):
     '''Run a deployment destroy operation, calling :meth:`delete` on Deployables.
@@ -983,6 +1334,8 @@ async def run_deployment_destroy(
     the orphans as *deployables* while setting *_policy_key* to
     *orphan_policy*.
 
+    :param max_concurrency: The maximum number of deployables to find and delete at once.  Defaults to *deployment.max_concurrency* from the configuration; 0 means no limit.  Time spent on each level of the dependency graph is reported in :attr:`DeploymentResult.level_timings`.
+
     :param _policy_key:  An internal parameter that allows :func:`run_deployment` to adjust which deletion policy is used when deleting orphans.
 
     '''
@@ -1006,87 +1359,59 @@ async def run_deployment_destroy(
         find_deployables_reverse_dependencies,
         deployables=deployables_list,
         )
+    if max_concurrency is None:
+        max_concurrency = ainjector.get_instance(ConfigLayout).deployment.max_concurrency
+
     async def handle(d: Deployable):
         '''Called once for each deployable whose  reverse dependencies have been handled. Responsible for filtering and deleting the object.
         '''
-        try:
-            found = await find_deployable(d)
-            if not found:
-                # if the object is not found it should not block reverse dependencies
-                good_to_go.add(d)
-                more_work()
-                return False
-            if d in to_ignore:
-                logger.debug('Ignoring %s and its reverse dependencies', d)
-                raise IgnoreDeployable
-            policy = d.injector.get_instance(InjectionKey(_policy_key, _optional=True))
-            if not dry_run:
-                match policy:
-                    case DeletionPolicy.retain:
-                        logger.debug("%s not deleted: deletion policy retain", d)
-                        raise IgnoreDeployable
-                    case DeletionPolicy.warn:
-                        logger.warn("%s retained per deletion policy", d)
-                        raise IgnoreDeployable
-                    case None| DeletionPolicy.delete:
-                        logger.info('Deleting %s', d)
-                        await d.delete()
-                    case _:
-                        logger.error("Illegal destroy policy for %s: %s", d, policy)
-            else:
-                if policy in (DeletionPolicy.retain, DeletionPolicy.warn):
+        found = await find_deployable(d)
+        if not found:
+            # if the object is not found it should not block reverse dependencies
+            return False
+        if d in to_ignore:
+            logger.debug('Ignoring %s and its reverse dependencies', d)
+            raise IgnoreDeployable
+        policy = d.injector.get_instance(InjectionKey(_policy_key, _optional=True))
+        if not dry_run:
+            match policy:
+                case DeletionPolicy.retain:
+                    logger.debug("%s not deleted: deletion policy retain", d)
                     raise IgnoreDeployable
-                logger.debug("Dry run; would delete %s", d)
-            good_to_go.add(d)
-            more_work()
-            return True
-        finally:
-            pending.remove(d)
-
-
-    def more_work():
-        # This is horribly inefficient
-        failures = submitted - pending - good_to_go
-        possibles = set(reverse_dependencies) - submitted 
-        for p in possibles:
-            rdeps = reverse_dependencies[p]
-            if failing_rdeps := (rdeps & failures):
-                submitted.add(p)
-                if p in to_ignore:
-                    result.ignored.append(p)
-                else:
-                    result.dependency_failures.append(
-                        DeploymentFailure(deployable=p,
-                                          exception=None,
-                                          depended_deployables=list(failing_rdeps)))
-                continue
-            elif  rdeps - good_to_go:
-                continue
-            else:
-                # All the rdeps are in good_to_go
-                # And it hasn't been submitted yet
-                submitted.add(p)
-                pending.add(p)
-                future = asyncio.ensure_future(handle(p))
-                future.set_name('handle delete for '+str(p))
-                future.add_done_callback(result.find_callback(p))
-                futures.append(future)
-
-    pending = set()
-    submitted = set()
-    futures = []
-    good_to_go = set()
+                case DeletionPolicy.warn:
+                    logger.warn("%s retained per deletion policy", d)
+                    raise IgnoreDeployable
+                case None| DeletionPolicy.delete:
+                    logger.info('Deleting %s', d)
+                    await d.delete()
+                case _:
+                    logger.error("Illegal destroy policy for %s: %s", d, policy)
+        else:
+            if policy in (DeletionPolicy.retain, DeletionPolicy.warn):
+                raise IgnoreDeployable
+            logger.debug("Dry run; would delete %s", d)
+        return True
+
+    def dependency_failed(p, failing):
+        # Nothing p depends on can be deleted either
+        if p in to_ignore:
+            result.ignored.append(p)
+        else:
+            result.dependency_failures.append(
+                DeploymentFailure(deployable=p,
+                                  exception=None,
+                                  depended_deployables=failing))
+
     result = DeploymentResult('destroy')
     with DeploymentIntrospection(ainjector.injector, result):
         try:
             to_ignore = await find_to_ignore(deployables_list,  filter, dry_run=dry_run)
-            more_work()
-            while futures:
-                futures_last_round = futures
-                futures = []
-                done, pending_futures = await asyncio.wait(futures_last_round)
-                assert not pending_futures
-                assert len(pending) == len([f for f in futures if not f.done()])
+            # Reverse dependencies are deleted first
+            scheduler = _DependencyScheduler(
+                result, reverse_dependencies, handle, dependency_failed,
+                max_concurrency=max_concurrency,
+                callbacks=lambda d: [result.find_callback(d)])
+            await scheduler.run()
         finally:
             if not dry_run: clear_dry_run_marker(deployables_list)
     return result
@@ -52,6 +52,17 @@ class DeploymentCommand(CarthageRunnerCommand):
         subparser.add_argument('--report-out', '-o',
                                type=argparse.FileType('wt'),
                                help='Where to write output report for the final deployment report')
+        subparser.add_argument('--max-concurrency',
+                               type=int,
+                               help='Maximum number of deployables to operate on at once; 0 for no limit')
+
+    def method_kwargs(self, args):
+        '''Keyword arguments from *args* to pass to the deployment method.
+        '''
+        result = {}
+        if args.max_concurrency is not None:
+            result['max_concurrency'] = args.max_concurrency
+        return result
         
     async def run(self, args):
         '''Execute deployment with optional dry run step
@@ -65,7 +76,7 @@ class DeploymentCommand(CarthageRunnerCommand):
                                       recurse=(self.method == 'run_deployment_destroy'))
         method_func = getattr(carthage.deployment, self.method)
         if not args.force_confirm:
-            dry_run_results = await ainjector(method_func, dry_run=True, deployables=deployables, filter=filter)
+            dry_run_results = await ainjector(method_func, dry_run=True, deployables=deployables, filter=filter, **self.method_kwargs(args))
             print(dry_run_results.report(dry_run=True))
             if not args.dry_run:
                 # If we are just doing a dry run, that's all
@@ -78,7 +89,7 @@ class DeploymentCommand(CarthageRunnerCommand):
         # By this point either the deployment has been confirmed by
         # the user or by args.force_confirmation
         if not args.dry_run:
-            result = await ainjector(method_func, deployables=deployables, filter=filter)
+            result = await ainjector(method_func, deployables=deployables, filter=filter, **self.method_kwargs(args))
             print(result.report(), file=args.report_out, flush=True)
             if args.report_out:
                 # summary to stdout if main report to file
@@ -93,6 +104,18 @@ class DeployCommand(DeploymentCommand):
     subparser_kwargs = {
         'help': 'Deploy all deployables in the layout',
         }
+
+    def setup_subparser(self, subparser):
+        super().setup_subparser(subparser)
+        subparser.add_argument('--dependency-order',
+                               action=argparse.BooleanOptionalAction,
+                               help='Deploy deployables after their dependencies rather than all at once')
+
+    def method_kwargs(self, args):
+        result = super().method_kwargs(args)
+        if args.dependency_order is not None:
+            result['dependency_order'] = args.dependency_order
+        return result
     
 class DestroyCommand(DeploymentCommand):
 
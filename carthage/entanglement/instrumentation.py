@@ -22,7 +22,7 @@ from entanglement.filter import *
 from entanglement.types import register_type, register_enum
 
 
-from ..dependency_injection import InjectionKey, Injector, is_obj_ready, get_dependencies_for
+from ..dependency_injection import InjectionKey, Injector, is_obj_ready, get_dependencies_for, enable_introspection
 from ..setup_tasks import SetupTaskMixin, _iso_time
 
 __all__ = []
@@ -158,6 +158,7 @@ class CarthageRegistry(SyncStoreRegistry):
         
 
     def instrument_injector(self, injector):
+        enable_introspection()
         injector.add_event_listener(InjectionKey(Injector), {'add_provider'}, self.on_add_provider)
         injector.add_event_listener(
             InjectionKey(Injector), {'dependency_progress', 'dependency_final'}, self.on_update)
@@ -9,20 +9,28 @@
 from __future__ import annotations
 import asyncio
 import contextlib
+import functools
 import weakref
-from .utils import possibly_async
 
 
 class EventScope:
 
     '''
     Typically most objects that have event listener support never have listeners attached.  So it is desirable to separate the ability to listen for events from the data structures associated with actually doing so.  An *EventScope* is attached to a *target* when a *target* gains the first event subscription.  When an object lower in the hierarchy gains an event subscription, then :meth:`.break_at` is called to create a new *EventScope* and reparent targets lower in the tree to that new scope.
+
+    Each scope keeps an index of (key, event) to the listeners of that scope and all its parents, so an event that nothing listens for is dispatched without walking the parent chain.  The index is rebuilt lazily whenever a listener is added or removed or a scope is reparented anywhere.
     '''
 
+    #: Incremented whenever listeners or the parent chain of any scope change; scopes discard their index when it no longer matches.
+    _listener_generation = 0
+
     def __init__(self, target, parent: EventScope = None):
         self.target = weakref.ref(target)
         self.listeners = {}
         self.parent = parent
+        self._index = {}
+        self._index_generation = -1
+        EventScope._listener_generation += 1
         if parent:
             self.children, self.finalizers = parent.find_prune_children(target)
         else:
@@ -96,6 +104,7 @@ class EventScope:
                 return
             if p.parent is old_parent:
                 p.parent = new_parent
+                EventScope._listener_generation += 1
                 return
             p = p.parent
         raise ValueError('old_parent is not  in the parent chain')
@@ -103,60 +112,89 @@ class EventScope:
     def add_listener(self, k, event, callback):
         d = self.listeners.setdefault(k, {})
         d[callback] = (event, set())
+        EventScope._listener_generation += 1
 
     def remove_listener(self, k, callback):
         d = self.listeners[k]
         try:
             events, futures = d[callback]
             del d[callback]
+            EventScope._listener_generation += 1
             return futures
         except KeyError:
             # We prefer our message
             raise KeyError(f'{callback} not registered as a listener for {k}') from None
 
+    def _listeners_for(self, k, event):
+        '''
+        :returns: A tuple of (callback, futures) for each listener interested in *event* directed at *k* in this scope or any parent.  Listeners of parent scopes come first.
+        '''
+        if self._index_generation != EventScope._listener_generation:
+            self._index = {}
+            self._index_generation = EventScope._listener_generation
+        try:
+            return self._index[k, event]
+        except KeyError:
+            pass
+        result = self.parent._listeners_for(k, event) if self.parent else ()
+        try:
+            d = self.listeners[k]
+        except KeyError:
+            pass
+        else:
+            result = result + tuple(
+                (callback, futures) for callback, (events, futures) in d.items()
+                if event in events)
+        self._index[k, event] = result
+        return result
+
     def emit(self, loop, k, event, target, *args,
              adl_keys=set(),
              **kwargs):
-        def gen_callback(futures):
-            def callback(future):
-                # ignore the result
-                try:
-                    future.result()
-                except BaseException:
-                    pass
-                futures.remove(future)
-            return callback
-        if not isinstance(adl_keys, set):
+        matches = [(k, self._listeners_for(k, event))]
+        if adl_keys and not isinstance(adl_keys, (set, frozenset)):
             adl_keys = set(adl_keys)
-        target_keys = {k} | adl_keys
-        result_futures = []
-        if self.parent:
-            result_futures.append(self.parent.emit(
-                loop, k, event, target, adl_keys=adl_keys,
-                **kwargs))
-        for ck in target_keys:
-            try:
-                d = self.listeners[ck]
-            except KeyError:
-                continue
-            for callback, (events, futures) in d.items():
-                if event in events:
-                    future = loop.create_task(
-                        possibly_async(callback(
-                            key=ck, event=event, target=target, *args,
-                            target_key=k, **kwargs)))
-                    result_futures.append(future)
+        for ck in adl_keys:
+            if ck != k:
+                matches.append((ck, self._listeners_for(ck, event)))
+        if not any(listeners for ck, listeners in matches):
+            return _result_future(loop, [])
+        results = []
+        pending = []
+        for ck, listeners in matches:
+            for callback, futures in listeners:
+                result = callback(
+                    key=ck, event=event, target=target, *args,
+                    target_key=k, **kwargs)
+                if asyncio.iscoroutine(result):
+                    future = loop.create_task(result)
                     futures.add(future)
-                    future.add_done_callback(gen_callback(futures))
+                    future.add_done_callback(functools.partial(_discard_future, futures))
+                    pending.append(future)
+                    results.append(future)
+                else:
+                    results.append(result)
         del args
         del kwargs
+        if not pending:
+            return _result_future(loop, results)
+        return asyncio.gather(*(
+            r if asyncio.isfuture(r) else _result_future(loop, r) for r in results))
 
-        if result_futures:
-            return asyncio.gather(*result_futures)
-        else:
-            future = loop.create_future()
-            future.set_result([])
-            return future
+
+def _discard_future(futures, future):
+    # ignore the result
+    try:
+        future.result()
+    except BaseException:
+        pass
+    futures.discard(future)
+
+
+def _result_future(loop, result):
+    future = loop.create_future()
+    future.set_result(result)
+    return future
 
 
 class EventListener:
@@ -7,6 +7,7 @@
 # LICENSE for details.
 
 from pathlib import Path
+import asyncio
 import contextlib
 import functools
 import os
@@ -24,6 +25,7 @@ from .config import ConfigLayout, config_key
 from . import sh
 from .utils import possibly_async, memoproperty
 from .setup_tasks import setup_task, SkipSetupTask, SetupTaskMixin, TaskWrapper
+from . import image_clone
 import carthage
 from .machine import ContainerCustomization, FilesystemCustomization, customization_task, AbstractMachineModel
 
@@ -396,20 +398,31 @@ class ImageVolume(SetupTaskMixin, AsyncInjectable):
                     base_path = Path(base_image)
                 else:
                     raise TypeError('Do not know what to do with base_image')
+                use_backing_file = self.config_layout.libvirt.use_backing_file
                 match [s[1:] for s in base_path.suffixes]:
+                    case [*rest, 'raw', 'gz'] if self.qemu_format == 'raw':
+                        btrfs_touch(self.path)
+                        await self._run_in_executor(image_clone.decompress_sparse, base_path, self.path)
                     case [*rest, 'raw', 'gz']:
                         with tempfile.NamedTemporaryFile(dir=self.directory) as t:
-                            await sh.gzip(
-                                '-d', '-c',
-                                base_path,
-                                _out=t.name)
+                            await self._run_in_executor(image_clone.decompress_sparse, base_path, t.name)
                             await sh.qemu_img(
                                 'convert',
                                 '-O'+self.qemu_format,
                                 '-fraw',
                                 t.name,
                                 self.path)
-                    case [*rest, 'raw'] if self.qemu_format == 'raw' and not self.config_layout.libvirt.use_backing_file:
+                    case [*rest, extension] if extension_to_qemu_format.get(extension) == self.qemu_format \
+                         and not use_backing_file \
+                         and self.config_layout.libvirt.reflink \
+                         and await self._run_in_executor(image_clone.clone_file, base_path, self.path):
+                        # A whole-file FICLONE shares every extent,
+                        # which neither cp --reflink nor qemu-img
+                        # convert -C reliably manage (see below).  The
+                        # clone is not marked nocow: btrfs cannot clone
+                        # between cow and nocow files.
+                        pass
+                    case [*rest, 'raw'] if self.qemu_format == 'raw' and not use_backing_file:
                         # This is the special case where we are cloning a
                         # raw image, and where we do not want to use a
                         # backing file. In this case we want to use cp
@@ -428,7 +441,7 @@ class ImageVolume(SetupTaskMixin, AsyncInjectable):
                             base_path,
                             self.path)
                     case [*rest, extension] if extension in extension_to_qemu_format:
-                        if self.config_layout.libvirt.use_backing_file:
+                        if use_backing_file:
                             #We want a thin clone
                             btrfs_touch(self.path)
                             await sh.qemu_img(
@@ -457,7 +470,7 @@ class ImageVolume(SetupTaskMixin, AsyncInjectable):
                     '-f'+self.qemu_format,
                     self.path,
                     self.size*1024**2)
-            shutil.rmtree(self.stamp_path, ignore_errors=True)
+            self.forget_stamps()
             self.stamp_path.mkdir(parents=True, exist_ok=True)
             if self.populate:
                 await self.populate()
@@ -469,6 +482,9 @@ class ImageVolume(SetupTaskMixin, AsyncInjectable):
             self.creating_path.unlink()
             raise
 
+    async def _run_in_executor(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
     async def resize(self, size):
         if self.readonly:
             logger.info('Not resizing %s because readonly', self)
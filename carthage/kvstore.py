@@ -5,7 +5,14 @@
 # WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
+import asyncio
+import bisect
 import collections.abc
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import threading
 
 import yaml
 from pathlib import Path
@@ -36,6 +43,18 @@ persistent_seed_path = InjectionKey('carthage.kvstore/persistent_seed_path')
 
 __all__ += ['persistent_seed_path']
 
+#: Maps each :class:`KvStore` with a transaction opened by :meth:`KvStore.transaction` in the current context to the owner of the transaction and the transaction.
+_ambient_transactions = contextvars.ContextVar('carthage.kvstore.ambient_transactions', default=None)
+
+def _transaction_owner():
+    # Tasks and threads started within a transaction inherit the
+    # context, but must not join the transaction.
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return threading.get_ident(), task
+
 @inject_autokwargs(injector=Injector,
                    persistent_seed_path=InjectionKey(persistent_seed_path, _optional=True),
                    )
@@ -65,6 +84,52 @@ class KvStore(Injectable):
     def close(self):
         self.environment.close()
 
+    @contextlib.contextmanager
+    def transaction(self):
+        '''Within this context, operations on this store and its :class:`KvDomain` objects share a single write transaction.  Reads see writes made earlier in the transaction.  The transaction commits when the outermost context exits; if an exception escapes, nothing done within the context is recorded.  Nested calls join the outer transaction.
+
+        Typical usage is to wrap a batch of updates so that it costs one commit rather than one per operation::
+
+            with kvstore.transaction():
+                for k, v in updates.items():
+                    domain.put(k, v, overwrite=True)
+
+        While the transaction is open, other processes and threads wait to write to the store, so assignments made by cooperating processes do not race.  Only the thread and :class:`asyncio.Task` that opened the transaction join it; other tasks and threads use their own transactions.  Do not await while the transaction is open.
+
+        '''
+        txn = self._ambient_transaction()
+        if txn is not None:
+            yield txn
+            return
+        with self.environment.begin(write=True) as txn:
+            transactions = dict(_ambient_transactions.get() or {})
+            transactions[self] = (_transaction_owner(), txn)
+            token = _ambient_transactions.set(transactions)
+            try:
+                yield txn
+            finally:
+                _ambient_transactions.reset(token)
+
+    def _ambient_transaction(self):
+        # Returns the transaction from transaction() if opened by this thread and task
+        transactions = _ambient_transactions.get()
+        if not transactions or self not in transactions:
+            return None
+        owner, txn = transactions[self]
+        if owner != _transaction_owner():
+            return None
+        return txn
+
+    @contextlib.contextmanager
+    def _begin(self, write=False):
+        # Returns the transaction from transaction() if active, else a new transaction.
+        txn = self._ambient_transaction()
+        if txn is not None:
+            yield txn
+        else:
+            with self.environment.begin(write=write) as txn:
+                yield txn
+
     def domain(self, d:str, include_in_dump):
         '''Return a :class:`KvDomain` for accessing a domain of keys in the Store.  Typical usage::
 
@@ -75,7 +140,7 @@ class KvStore(Injectable):
         :param include_in_dump: If True, then the contents of this domain should be included in the results of a call to :meth:`dump`
         '''
         if include_in_dump:
-            with self.environment.begin(write=True) as txn:
+            with self._begin(write=True) as txn:
                 assert txn.put(b'dump:'+bytes(d, 'utf-8'), b'true', True)
         return KvDomain(self, d)
 
@@ -83,7 +148,7 @@ class KvStore(Injectable):
         domains = set()
         file = Path(file)
         result = dict()
-        with self.environment.begin() as txn, txn.cursor() as csr:
+        with self._begin() as txn, txn.cursor() as csr:
             csr.set_range(b'dump')
             for key, value in csr:
                 if not key.startswith(b'dump:'): break
@@ -109,7 +174,7 @@ class KvStore(Injectable):
         '''
         file = Path(file)
         result = yaml.safe_load(file.read_text())
-        with self.environment.begin(write=True) as txn:
+        with self._begin(write=True) as txn:
             for domain, domain_dict in result.items():
                 for k,v in domain_dict.items():
                     txn.put(kv_key(domain, k), bytes(v, 'utf-8'))
@@ -128,6 +193,7 @@ class KvDomain:
 
     def __init__(self, store, domain):
         self.domain = domain
+        self.store = store
         self.environment = store.environment
 
     def put(self, k, v, *,
@@ -141,7 +207,7 @@ class KvDomain:
         if value:
             value_bytes = bytes(value, 'utf-8')
         else: value_bytes = None
-        with self.environment.begin(write=True) as txn:
+        with self.store._begin(write=True) as txn:
             if value_bytes:
                 actual_value = txn.get(key)
                 if actual_value != value_bytes:
@@ -153,7 +219,7 @@ class KvDomain:
     def get(self, k, default=None):
         '''Returns self[*k*] or if not present *default*'''
         key = kv_key(self.domain, k)
-        with self.environment.begin() as txn:
+        with self.store._begin() as txn:
             v = txn.get(key, NotPresent)
             if v == NotPresent: return default
             return str(v, 'utf-8')
@@ -163,7 +229,7 @@ class KvDomain:
         If *value* is given, then self[*k*] must equal *value* before the delete.
 '''
         key = kv_key(self.domain, k)
-        with self.environment.begin(write=True) as txn, \
+        with self.store._begin(write=True) as txn, \
              txn.cursor() as csr:
             csr.set_key(key)
             if csr.key() != key:
@@ -175,6 +241,18 @@ class KvDomain:
             csr.delete()
 
 
+    def items(self):
+        '''Returns a list of (key, value) pairs for everything in this domain, read in a single transaction.
+        '''
+        prefix = kv_key(self.domain, '')
+        result = []
+        with self.store._begin() as txn, txn.cursor() as csr:
+            if csr.set_range(prefix):
+                for key, value in csr:
+                    if not key.startswith(prefix): break
+                    result.append((str(key[len(prefix):], 'utf-8'), str(value, 'utf-8')))
+        return result
+
     def __getitem__(self, k):
         v = self.get(k, NotPresent)
         if v is NotPresent:
@@ -222,6 +300,44 @@ class HintedAssignments(Injectable):
     def new_assignments(self):
         "Indicate a new round of assignments is beginning.  The same assignment will never be used more than once in a single round of assignments, but may be reused across rounds."
         self._assignments_made = dict()
+        # The index is reloaded from the store at the start of each round
+        self._index = None
+
+    def _load_index(self):
+        '''
+        Returns an in-memory copy of the assignments domain mapping assignment to key, loading it from the store if needed.  Once loaded, the copy is kept in sync with every change this object makes to the domain, so probing an assignment does not require a store lookup.  If another process changes the domain, the resulting :class:`KvConsistency` causes the index to be reloaded.
+        '''
+        if self._index is None:
+            self._index = {}
+            self._index_by_key = {}
+            self._index_reset()
+            for assignment, key in self._assignments.items():
+                self._index_add(assignment, key)
+        return self._index
+
+    def _index_reset(self):
+        '''Extended by subclasses that maintain their own view of the index.'''
+        pass
+
+    def _index_add(self, assignment, key):
+        '''Record that the assignments domain maps *assignment* to *key*.  Extended by subclasses.'''
+        if self._index is None: return
+        old_key = self._index.get(assignment)
+        if old_key is not None:
+            self._index_by_key[old_key].discard(assignment)
+        self._index[assignment] = key
+        self._index_by_key.setdefault(key, set()).add(assignment)
+
+    def _index_remove(self, assignment):
+        '''Record that *assignment* has been removed from the assignments domain.  Extended by subclasses.'''
+        if self._index is None: return
+        key = self._index.pop(assignment, None)
+        if key is not None:
+            self._index_by_key[key].discard(assignment)
+
+    def _indexed_assignments_for(self, key):
+        '''Returns the assignments the index maps to *key*.'''
+        return self._index_by_key.get(key, ())
 
     def _assign(self,  key, obj):
         '''
@@ -257,6 +373,8 @@ Called in subclasses to indicate that an assignment should be made.  :meth:`reco
                 raise AssignmentsExhausted(f'Assignments for {self} exhausted')
                 
             except KvConsistency:
+                # Someone else changed the store
+                self._index = None
                 continue
         raise KvConsistency(f'Exceeded maximum retries')
 
@@ -276,13 +394,14 @@ Called in subclasses to indicate that an assignment should be made.  :meth:`reco
         '''
         try: del self._assignments_made[key]
         except KeyError: pass
-        current_key = self._assignments.get(str(assignment))
+        current_key = self._load_index().get(str(assignment))
         if current_key in self._assignments_made and self._assignments_made[current_key] == str(assignment):
             return False   # Has been allocated in this round to someone else
         elif current_key in self._assignments_made:
             # Has been assigned a different assignment this round
-            try: self._assignments.delete(key, value=current_key)
+            try: self._assignments.delete(str(assignment), value=current_key)
             except KvConsistency: return False
+            self._index_remove(str(assignment))
             # If we did delete the assignment, then we can use the
             # key.  Don't count as a reallocate, because the previous
             # allocated key has already moved.
@@ -295,6 +414,7 @@ Called in subclasses to indicate that an assignment should be made.  :meth:`reco
             if not reallocate_assigned: return 'reusable'
         # Is available for us to assign to key
         self._assignments.put(str(assignment), key, value=current_key)
+        self._index_add(str(assignment), key)
         # Past this point we should not get KvConsistency errors.
         self._hints.put(key, str(assignment), overwrite=True)
         # There is a race.  By recording the assignment before the hint, if
@@ -314,6 +434,7 @@ Called in subclasses to indicate that an assignment should be made.  :meth:`reco
         '''Force recording within the data store that *obj* identified by *key* has *assignment* as its assignment.  This is intended for dealing with statically assigned assignments that fall into the range that is automatically managed.  Does not call :meth:`record_assignment`
         '''
         self._assignments.put(key, str(assignment), overwrite=True)
+        self._index_add(key, str(assignment))
         self._hints.put(key, str(assignment), overwrite=True)
         self._assignments_made[key] = str(assignment)
         
@@ -355,12 +476,66 @@ It is best if this generator yields strings; ass discussed in the documentation
 __all__ += ['HintedAssignments']
 
 
+def ordinal_sum_hash(key: str):
+    '''The original hash used by :class:`HashedRangeAssignments`: the sum of the character ordinals of *key*.  Keys that differ only in the order of their characters collide.
+    '''
+    result = 0
+    for c in key: result += ord(c)
+    return result
+
+
+def blake2_hash(key: str):
+    '''A stable, well distributed hash: the first 8 bytes of the BLAKE2b digest of *key*.'''
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+__all__ += ['ordinal_sum_hash', 'blake2_hash']
+
+
 class HashedRangeAssignments(HintedAssignments):
 
+    #: Maps a hash version to a function from a key to a non-negative integer.  Subclasses may add versions.  A version must never change once assignments have been made with it.
+    hash_functions = {
+        1: ordinal_sum_hash,
+        2: blake2_hash,
+    }
+
+    #: The hash version used for domains that have no assignments yet.
+    hash_version = 2
+
     def __init__(self, domain,  **kwargs):
         super().__init__(domain, **kwargs)
+        # Dumped with the hints so that a loaded dump keeps its hash version
+        self._meta = self.store.domain(domain+'/meta', True)
 
-    
+    @memoproperty
+    def active_hash_version(self):
+        '''
+        The hash version used by this domain, recorded in the store the first time it is needed.  A domain that already has hints from before hash versions were recorded keeps version 1 so that keys whose hints are lost are not moved; :meth:`migrate_hash_version` switches such a domain.
+        '''
+        version = self._meta.get('hash_version')
+        if version is not None:
+            return int(version)
+        if self._hints.items():
+            version = 1
+        else:
+            version = self.hash_version
+        try: self._meta.put('hash_version', str(version))
+        except KvConsistency:
+            # Another process recorded a version first
+            return int(self._meta.get('hash_version'))
+        return version
+
+    def migrate_hash_version(self, version=None):
+        '''Switch this domain to hash *version* (by default :attr:`hash_version`).  Hints are always tried before the hash, so existing assignments are not renumbered; only keys without a usable hint are placed using the new hash.
+        '''
+        if version is None:
+            version = self.hash_version
+        if version not in self.hash_functions:
+            raise ValueError(f'Unknown hash version {version}')
+        self._meta.put('hash_version', str(version), overwrite=True)
+        try: del self.active_hash_version
+        except AttributeError: pass
 
     def hash_key(self, key, obj):
         '''Key hashed, bounded to low <= key <= high
@@ -368,8 +543,7 @@ class HashedRangeAssignments(HintedAssignments):
 '''
         assert isinstance(key, str)
         low, high = self.find_bounds(obj)
-        result = 0
-        for c in key: result += ord(c)
+        result = self.hash_functions[self.active_hash_version](key)
         try: size = high-low +1
         except TypeError:
             size = int(high)-int(low)+1
@@ -386,9 +560,54 @@ class HashedRangeAssignments(HintedAssignments):
        
         * Increase distance, stopping iteration if both ``hash+distance`` and ``hash-distance`` are out of bounds.
 
+        Unless :attr:`prefer_reallocate` is set, assignments that the free-space index shows are held by other keys are skipped on a first pass, so the nearest free assignment is reached without probing every occupied one.  Assignments held by keys that have already been given a different assignment this round are treated as free, as :meth:`_try_assignment` would reuse them.  Only if the first pass is exhausted are all assignments yielded in order, so that a reusable assignment can be found.
+
         '''
-        low, high = self.find_bounds(obj)
         low, hash, high = self.hash_key(key, obj)
+        if not self.prefer_reallocate:
+            self._load_index()
+            usable = set(self._moved)
+            for assignment in self._indexed_assignments_for(key):
+                position = self._position(assignment)
+                if position is not None: usable.add(position)
+            for position in self._free_positions(int(low), int(hash), int(high), usable):
+                # hash may be an address rather than an int; the
+                # assignment keeps its type.
+                offset = position - int(hash)
+                yield str(hash + offset)
+        yield from self._all_assignments(low, hash, high)
+
+    def _free_positions(self, low, hash, high, usable):
+        # Integer positions in the same order as _all_assignments,
+        # skipping runs the index shows as held, except for the
+        # usable positions within them.
+        occupied = self._occupied
+
+        def next_position(p, step):
+            while low <= p <= high:
+                run = occupied.run_containing(p)
+                if run is None or p in usable:
+                    return p
+                inside = [o for o in usable if run[0] <= o <= run[1]]
+                if step > 0:
+                    inside = [o for o in inside if o > p]
+                    p = min(inside) if inside else run[1] + 1
+                else:
+                    inside = [o for o in inside if o < p]
+                    p = max(inside) if inside else run[0] - 1
+            return None
+
+        def direction(start, step):
+            p = next_position(start, step)
+            while p is not None:
+                # Ties go upward first as in _all_assignments
+                yield abs(p - hash), (0 if step > 0 else 1), p
+                p = next_position(p + step, step)
+
+        for distance, tie, p in heapq.merge(direction(hash, 1), direction(hash - 1, -1)):
+            yield p
+
+    def _all_assignments(self, low, hash, high):
         result_yielded = True
         distance = 0
         while result_yielded:
@@ -417,5 +636,107 @@ class HashedRangeAssignments(HintedAssignments):
 '''
         return int(s)
 
+    def _position(self, assignment):
+        # The integer position of assignment or None
+        try: return int(self.str_to_assignment(assignment))
+        except ValueError: return None
+
+    def _index_reset(self):
+        super()._index_reset()
+        self._occupied = _RunSet()
+        #: Positions held by keys that were given another assignment this round
+        self._moved = set()
+
+    def _index_add(self, assignment, key):
+        super()._index_add(assignment, key)
+        if self._index is None: return
+        position = self._position(assignment)
+        if position is None: return
+        self._occupied.add(position)
+        made = self._assignments_made.get(key)
+        if made is not None and made != assignment:
+            self._moved.add(position)
+        else:
+            self._moved.discard(position)
+
+    def _index_remove(self, assignment):
+        super()._index_remove(assignment)
+        if self._index is None: return
+        position = self._position(assignment)
+        if position is None: return
+        self._occupied.discard(position)
+        self._moved.discard(position)
+
+    def _try_assignment(self, key, obj, assignment, reallocate_assigned):
+        if self._index is not None and key in self._assignments_made:
+            for held in self._indexed_assignments_for(key):
+                self._moved.discard(self._position(held))
+        result = super()._try_assignment(key, obj, assignment, reallocate_assigned)
+        if result is True and self._index is not None:
+            for held in self._indexed_assignments_for(key):
+                position = self._position(held)
+                if held != str(assignment) and position is not None:
+                    self._moved.add(position)
+        return result
+
 __all__ += ['HashedRangeAssignments']
 
+
+class _RunSet:
+
+    '''A set of integers stored as sorted, disjoint runs of consecutive values.  Used by :class:`HashedRangeAssignments` to find the ends of a block of occupied assignments without visiting each one.
+    '''
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def _find(self, n):
+        # Index of the run that would contain n
+        return bisect.bisect_right(self.starts, n) - 1
+
+    def run_containing(self, n):
+        ''':returns: (start, end) of the run containing *n* or None'''
+        i = self._find(n)
+        if i >= 0 and self.ends[i] >= n:
+            return self.starts[i], self.ends[i]
+        return None
+
+    def __contains__(self, n):
+        return self.run_containing(n) is not None
+
+    def add(self, n):
+        i = self._find(n)
+        if i >= 0 and self.ends[i] >= n:
+            return
+        joins_left = i >= 0 and self.ends[i] == n - 1
+        joins_right = i + 1 < len(self.starts) and self.starts[i + 1] == n + 1
+        if joins_left and joins_right:
+            self.ends[i] = self.ends[i + 1]
+            del self.starts[i + 1]
+            del self.ends[i + 1]
+        elif joins_left:
+            self.ends[i] = n
+        elif joins_right:
+            self.starts[i + 1] = n
+        else:
+            self.starts.insert(i + 1, n)
+            self.ends.insert(i + 1, n)
+
+    def discard(self, n):
+        i = self._find(n)
+        if i < 0 or self.ends[i] < n:
+            return
+        start, end = self.starts[i], self.ends[i]
+        if start == end:
+            del self.starts[i]
+            del self.ends[i]
+        elif n == start:
+            self.starts[i] = n + 1
+        elif n == end:
+            self.ends[i] = n - 1
+        else:
+            self.ends[i] = n - 1
+            self.starts.insert(i + 1, n + 1)
+            self.ends.insert(i + 1, end)
+
@@ -12,8 +12,11 @@ import asyncio
 import contextlib
 import os
 import os.path
+import random
 import shlex
+import socket
 import tempfile
+import time
 import typing
 from pathlib import Path
 
@@ -71,6 +74,20 @@ ssh_origin_vrf = InjectionKey("ssh-origin-vrf")
 ssh_jump_host = InjectionKey('ssh_jump_host')
 
 
+def _ssh_config_port(config):
+    # Given the output of ssh -G, the port ssh connects to directly or
+    # None if it uses a proxy
+    options = {}
+    for line in config.splitlines():
+        key, _, value = line.partition(' ')
+        options.setdefault(key.lower(), value.strip())
+    for proxy in ('proxycommand', 'proxyjump'):
+        if options.get(proxy, 'none').lower() != 'none':
+            return None
+    try: return int(options.get('port', 22))
+    except ValueError: return None
+
+
 class SshMixin:
     '''
     An item that accepts ssh connections.
@@ -158,8 +175,10 @@ class SshMixin:
             return self.model.ssh_online_timeout
         return 5
 
-    @memoproperty
-    def ssh(self):
+    def ssh_with_options(self, *options):
+        '''
+        :returns: A baked ssh command like :attr:`ssh` that also includes *options* before the destination.
+        '''
         from .network import access_ssh_origin
         try:
             ssh_origin_container = self.injector.get_instance(InjectionKey(ssh_origin, _optional=True))
@@ -177,7 +196,7 @@ class SshMixin:
             ssh_agent = self.injector.get_instance(carthage.ssh.SshAgent)
             key_options = tuple()
         options = self.ssh_options + ('-F' +
-                                      str(ssh_agent.ssh_config),)
+                                      str(ssh_agent.ssh_config),) + options
         if ssh_origin_container is not None:
             ip_address = self.ip_address
             ssh_origin_container.done_future().add_done_callback(self.ssh_recompute)
@@ -195,6 +214,50 @@ class SshMixin:
                                ssh_user_addr(self),
                                _env=ssh_agent.agent_environ)
 
+    @memoproperty
+    def ssh(self):
+        control_options = ()
+        if self.ssh_control_master:
+            control_options = self.ssh_control_master.ssh_options
+        return self.ssh_with_options(*control_options)
+
+    @memoproperty
+    def ssh_control_master(self):
+        '''
+        The :class:`~carthage.ssh.SshControlMaster` shared by ssh connections to this machine, or None if *ssh.multiplex* is false.  There is one master connection per login user, address, jump host, *ssh_origin* and key.  :meth:`ssh_multiplex` starts it; :meth:`stop_machine` stops it.
+        '''
+        if not self.config_layout.ssh.multiplex: return None
+        try:
+            origin = self.injector.get_instance(InjectionKey(ssh_origin, _optional=True))
+        except InjectionFailed:
+            origin = self
+        ssh_key = self.injector.get_instance(InjectionKey(carthage.ssh.SshKey, _optional=True))
+        if ssh_key:
+            ssh_agent = ssh_key.agent
+        else:
+            ssh_agent = self.injector.get_instance(carthage.ssh.SshAgent)
+        return ssh_agent.control_master(
+            self.ssh_login_user, self.ip_address, self.ssh_options,
+            getattr(origin, 'name', origin and repr(origin)),
+            str(ssh_key.key_path) if ssh_key else None)
+
+    async def ssh_multiplex(self):
+        '''
+        Start :attr:`ssh_control_master` if it is not running.  :meth:`run_command`, :meth:`rsync` and :meth:`filesystem_access` call this so that they and later uses of :attr:`ssh` share one authenticated connection.
+
+        :returns: ssh options that use the master connection, or an empty tuple if connections are not multiplexed.
+        '''
+        master = self.ssh_control_master
+        if master is None: return ()
+        await master.start(self.ssh_with_options)
+        return master.ssh_options
+
+    async def ssh_multiplex_stop(self):
+        '''Stop :attr:`ssh_control_master` if it has been used.
+        '''
+        master = self.__dict__.get('ssh_control_master')
+        if master: await master.stop()
+
     def rsync(self, *args):
         '''
         Call rsync with given arguments.
@@ -219,7 +282,76 @@ A marker in a call to :meth:`rsync` indicating that *p* should be copied to or f
     #: The command run remotely by :meth:`ssh_online`
     ssh_online_command = 'echo online'
 
+    #: Seconds between the first :meth:`ssh_online` probes; the delay doubles, with jitter, up to :attr:`ssh_online_max_delay`
+    ssh_online_initial_delay = 0.25
+    ssh_online_max_delay = 5.0
+
+    def _ssh_online_delays(self):
+        delay = self.ssh_online_initial_delay
+        while True:
+            yield random.uniform(delay/2, delay)
+            delay = min(delay*2, self.ssh_online_max_delay)
+
+    async def _ssh_probe_port(self):
+        # The port ssh connects to as reported by ssh -G, so that
+        # Port and ProxyCommand from ssh_config are honored; None if
+        # ssh does not connect directly or the port cannot be found.
+        try: return self.__dict__['_ssh_probe_port_result']
+        except KeyError: pass
+        port = None
+        try:
+            result = await self.ssh_with_options('-G')(_bg=True, _bg_exc=False, _timeout=10)
+            port = _ssh_config_port(str(result))
+        except Exception as e:
+            logger.debug('Unable to find ssh port of %s: %s', self.name, e)
+        self.__dict__['_ssh_probe_port_result'] = port
+        return port
+
+    async def ssh_port_open(self):
+        '''
+        Check whether the ssh port of :attr:`ip_address` accepts TCP connections, connecting from the *ssh_origin* network namespace if there is one.  This is much cheaper than running ssh, so :meth:`ssh_online` waits for it first.
+
+        :returns: False if the connection fails; True if it succeeds or cannot be checked, for example because a jump host or proxy command is used.
+        '''
+        from .network import ssh_origin_socket
+        if self.ssh_jump_host: return True
+        loop = asyncio.get_running_loop()
+        try:
+            port = await self._ssh_probe_port()
+            if port is None: return True
+            try:
+                origin = self.injector.get_instance(InjectionKey(ssh_origin, _optional=True))
+            except InjectionFailed:
+                from .container import Container
+                origin = self if isinstance(self, Container) else None
+            if origin is not None:
+                sock, address = await self.injector(ssh_origin_socket, self.ip_address, port, ssh_origin=origin)
+            else:
+                (family, *rest, address), *ignore = await loop.getaddrinfo(
+                    self.ip_address, port, type=socket.SOCK_STREAM)
+                sock = socket.socket(family, socket.SOCK_STREAM)
+        except Exception as e:
+            logger.debug('Not probing ssh port of %s: %s', self.name, e)
+            return True
+        with sock:
+            sock.setblocking(False)
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, address), self.ssh_online_timeout)
+            except (OSError, asyncio.TimeoutError):
+                return False
+        return True
+
     async def ssh_online(self):
+        '''
+        Wait until the machine accepts ssh connections.  First wait for :meth:`ssh_port_open`, then run :attr:`ssh_online_command` until it succeeds.  Port probes and ssh attempts together are limited to :attr:`ssh_online_retries`, and to the time that many ssh attempts with a one-second pause between them would take.  Delays between attempts back off exponentially with jitter so that many machines starting at once do not probe in lockstep.  Concurrent callers for the same machine share one probe.
+        '''
+        future = self.__dict__.get('_ssh_online_future')
+        if future is None or future.done():
+            future = asyncio.ensure_future(self._ssh_online())
+            self._ssh_online_future = future
+        return await asyncio.shield(future)
+
+    async def _ssh_online(self):
         online = False
         last_error = None
         await self.ainjector.get_instance_async(InjectionKey(carthage.ssh.SshKey, _optional=True)) #Instantiate in case it is async
@@ -227,18 +359,41 @@ A marker in a call to :meth:`rsync` indicating that *p* should be copied to or f
         if self.ssh_jump_host:
             await self.ssh_jump_host.ssh_online()
         logger.debug(f'Waiting for {self.name} to be ssh_online')
-        for i in range(self.ssh_online_retries):
+        # Port probes and ssh attempts share one budget: at most
+        # ssh_online_retries attempts in all, taking no longer than that
+        # many ssh attempts with one-second sleeps used to, so an
+        # unreachable machine fails no later than when only ssh was
+        # tried.  The probe is only advisory: if the port never
+        # answers, ssh is still tried at least once, since ssh may reach
+        # the machine in ways the probe does not understand.
+        deadline = time.monotonic() + self.ssh_online_retries*(self.ssh_online_timeout+1)
+        delays = self._ssh_online_delays()
+        attempts = 0
+        while not await self.ssh_port_open():
+            attempts += 1
+            if attempts >= self.ssh_online_retries-1 or time.monotonic() >= deadline:
+                logger.debug('ssh port of %s not reachable; trying ssh anyway', self.name)
+                break
+            await asyncio.sleep(next(delays))
+        delays = self._ssh_online_delays()
+        while True:
+            attempts += 1
             try:
                 await self.ssh(self.ssh_online_command,
                                _bg=True, _bg_exc=False,
                                _timeout=self.ssh_online_timeout)
             except (sh.TimeoutException, sh.ErrorReturnCode) as e:
                 last_error = e
-                await asyncio.sleep(1)
+                # A master connection left from before a restart may be stale
+                await self.ssh_multiplex_stop()
+                if attempts >= self.ssh_online_retries or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(next(delays))
                 continue
             online = True
             last_error = None
             self._ssh_online_required = False
+            await self.ssh_multiplex()
             logger.debug(f'{self.name} is ssh_online')
             break
         if not online:
@@ -249,10 +404,11 @@ A marker in a call to :meth:`rsync` indicating that *p* should be copied to or f
 
 
     def ssh_recompute(self, *args):
-        try:
-            del self.__dict__['ssh']
-        except KeyError:
-            pass
+        for attr in ('ssh', 'ssh_control_master', '_ssh_probe_port_result'):
+            try:
+                del self.__dict__[attr]
+            except KeyError:
+                pass
         self._ssh_online_required = True
 
     @classmethod
@@ -567,6 +723,7 @@ class Machine(NetworkedMixin, AsyncInjectable, SshMixin):
                                  adl_keys={InjectionKey(Machine, host=self.name)} |
                                  set(self.supplementary_injection_keys(InjectionKey(Machine, host=self.name))))
         self._ssh_online_required = True
+        await self.ssh_multiplex_stop()
 
     async def is_machine_running(self):
         '''
@@ -624,6 +781,7 @@ it works like :meth:`carthage.container.Container.container_command` and is used
         if _user != self.ssh_login_user:
             raise ValueError(f'{self.__class__.__qualname__} Does not support runas_user different than ssh_login_user; consider BecomePrivilegedMixin or another privilege management solution.')
         args = [str(a) if isinstance(a,Path) else a for a in args]
+        await self.ssh_multiplex()
         return await self.ssh(
             shlex.join(args),
             _bg=_bg, _bg_exc=_bg_exc, **kwargs)
@@ -633,6 +791,7 @@ it works like :meth:`carthage.container.Container.container_command` and is used
         if user != self.ssh_login_user:
             raise ValueError(f'{self.__class__.__qualname__} cannot set up filesystem access when runas_user != ssh_login_user')
         agent = await self.ainjector.get_instance_async(SshAgent)
+        await self.ssh_multiplex()
         return sh.sshfs(
             '-o' 'ssh_command=' + " ".join(
                 str(self.ssh).split()[:-1]),
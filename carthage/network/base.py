@@ -10,9 +10,12 @@ from __future__ import annotations
 import asyncio
 import abc
 import copy
+import ctypes
 import dataclasses
 import logging
 import re
+import socket
+import threading
 import typing
 import weakref
 from ipaddress import IPv4Address
@@ -951,6 +954,57 @@ def access_ssh_origin(ssh_origin, ssh_origin_vrf=None, extra_nsenter=[]):
                            '-n',
                            *vrf)
 
+_CLONE_NEWNET = 0x40000000
+
+def _namespace_socket(pid, host, port):
+    # Runs in a thread of its own that exits afterward: setns only
+    # changes the namespace of the calling thread, so the thread is
+    # never reused in the foreign namespace even if restoring fails.
+    # Both name resolution and the socket use the namespace of pid.
+    libc = ctypes.CDLL(None, use_errno=True)
+    with open(f'/proc/{pid}/ns/net', 'rb') as target:
+        if libc.setns(target.fileno(), _CLONE_NEWNET) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f'Unable to enter network namespace of {pid}')
+    (family, *rest, address), *ignore = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return socket.socket(family, socket.SOCK_STREAM), address
+
+def _run_in_thread(func, *args):
+    # Like run_in_executor, but in a new thread rather than a pooled one
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    def deliver(result, exception):
+        if not future.done():
+            if exception is not None: future.set_exception(exception)
+            else: future.set_result(result)
+        elif result is not None:
+            result[0].close()
+    def run():
+        try: result = func(*args)
+        except BaseException as e:
+            loop.call_soon_threadsafe(deliver, None, e)
+        else:
+            loop.call_soon_threadsafe(deliver, result, None)
+    threading.Thread(target=run, name='carthage-namespace', daemon=True).start()
+    return future
+
+@inject(ssh_origin=ssh_origin)
+async def ssh_origin_socket(host, port, *, ssh_origin, ssh_origin_vrf=None):
+    '''
+    Like :func:`access_ssh_origin`, but rather than a command, returns an unconnected TCP socket in the network namespace (and VRF) of *ssh_origin* along with the address to connect it to, found by resolving *host* and *port* within that namespace.  Used to probe ports without starting a process.
+
+    :returns: A tuple of socket and address.
+    '''
+    if ssh_origin_vrf is None:
+        try:
+            ssh_origin_vrf = ssh_origin.injector.get_instance(ssh_origin_vrf_key)
+        except KeyError:
+            pass
+    sock, address = await _run_in_thread(_namespace_socket, ssh_origin.container_leader, host, port)
+    if ssh_origin_vrf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, ssh_origin_vrf.encode())
+    return sock, address
+
 
 def hash_network_links(network_links: dict[str, NetworkLink]):
     '''
@@ -1002,7 +1056,7 @@ def hash_network_links(network_links: dict[str, NetworkLink]):
 
 __all__ = r'''Network TechnologySpecificNetwork BridgeNetwork
     external_network_key HostMapEntry mac_from_host_map host_map_key
-access_ssh_origin
+access_ssh_origin ssh_origin_socket
 NetworkConfig NetworkLink
 VlanList collect_vlans
 hash_network_links
@@ -1068,14 +1122,16 @@ class V4Pool(carthage.kvstore.HashedRangeAssignments):
         return f'{link.machine.name}|{link.interface}'
 
     def assignment_loop(self, links):
-        for link in links:
-            bounds = self.find_bounds(link)
-            if not bounds: continue
-            key = self.link_key(link)
-            if link.v4_config and link.v4_config.address:
-                self.force_assignment(key, link, link.v4_config.address)
-            else:
-                self._assign(key, link)
+        # The whole round is one KvStore transaction.
+        with self.store.transaction():
+            for link in links:
+                bounds = self.find_bounds(link)
+                if not bounds: continue
+                key = self.link_key(link)
+                if link.v4_config and link.v4_config.address:
+                    self.force_assignment(key, link, link.v4_config.address)
+                else:
+                    self._assign(key, link)
 
     def str_to_assignment(self, assignment):
         return IPv4Address(assignment)
@@ -39,6 +39,18 @@ class PodmanConfig(carthage.config.ConfigSchema, prefix='podman'):
     pull_policy:str = 'newer'
     #: An image used to gain access to volumes. Must have /bin/sh.
     volume_access_image: str = 'ghcr.io/hadron/carthage_volume_access:latest'
+    #: When deploying in dependency order, the maximum number of podman objects deployed at once on one container host; 0 for no limit
+    max_concurrent_deploys: int = 8
+    #: If True, volumes imported as images (such as for :class:`PodmanFromScratchImage`) are piped from tar straight into ``podman image import`` rather than written to a temporary tar file
+    import_streaming: bool = True
+    #: Compression for volumes streamed to a remote container host: none, gzip, pigz (multi-threaded gzip, falling back to gzip if not installed), or zstd (multi-threaded; requires zstd on the container host).  Local imports are never compressed.
+    import_compression: str = 'pigz'
+    #: If True, layers built by :func:`image_layer_task` are cached by parent layer, customization and commit options, and reused by later builds of any image; see :meth:`PodmanImage.customization_layer`.  Cached layers are tagged ``localhost/carthage-layer-cache:<key>``; Carthage never removes these tags, so remove them (for example with ``podman image rm``) to reclaim space.  A layer still used by another image is kept.
+    layer_cache: bool = False
+    #: The maximum number of images pulled at once on one container host; 0 for no limit
+    max_concurrent_pulls: int = 4
+    #: Seconds for which a successful registry login is reused by later pulls on the same container host
+    login_validity: int = 3600
     
     
 class PodmanDeployableFinder(carthage.DeployableFinder):
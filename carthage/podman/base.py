@@ -11,11 +11,12 @@ import sys
 import asyncio
 import contextlib
 import datetime
+import hashlib
+import inspect
 import json
 import logging
 from pathlib import Path
 import tempfile
-import shutil
 import dateutil.parser
 import carthage.machine
 from carthage.dependency_injection import *
@@ -25,6 +26,8 @@ from ..utils import memoproperty
 from ..network import TechnologySpecificNetwork, Network, V4Config, this_network, NetworkConfig
 from ..oci import *
 from ..setup_tasks import setup_task, SetupTaskMixin, TaskWrapperBase, SkipSetupTask
+from ..deployment import resource_limit, current_deployment_pass
+from ..context_manifest import ContextManifest
 from .container_host import instantiate_container_host
 import carthage.modeling
 
@@ -66,7 +69,7 @@ __all__ = []
 
 @inject(
     ainjector=AsyncInjector)
-async def login_to_registry(tag:str, *, podman, ainjector):
+async def registry_credentials(tag:str, *, ainjector):
     '''    Splits an image name on the first slash to find the name of the registry.
     Checks for ``InjectionKey(OciCredentials, registry=registry)`` in the supplied injector. If present that key can either be a :class:`OciCredentials` or a string in one of the following formats:
 
@@ -74,24 +77,38 @@ async def login_to_registry(tag:str, *, podman, ainjector):
 
     * username:password
 
+    :returns: A tuple of username and password, or None if there are no credentials for the registry.
     '''
     registry, *rest = tag.partition('/')
     try:
         credentials = await ainjector.get_instance_async(InjectionKey(OciCredentials, registry=registry))
-        match credentials:
-            case OciCredentials(username=username, password=password):
-                pass
-            case str() as s if ':' in s:
-                username, _, password = s.partition(':')
-            case str() as s:
-                username = 'registry'
-                password = s
-            case _:
-                raise ValueError(f'Do not know how to interpret {credentials}')
-        await podman('login', '-u', username, '-p', password, registry)
     except KeyError:
-        pass
-    
+        return None
+    match credentials:
+        case OciCredentials(username=username, password=password):
+            pass
+        case str() as s if ':' in s:
+            username, _, password = s.partition(':')
+        case str() as s:
+            username = 'registry'
+            password = s
+        case _:
+            raise ValueError(f'Do not know how to interpret {credentials}')
+    return username, password
+
+__all__ += ['registry_credentials']
+
+@inject(
+    ainjector=AsyncInjector)
+async def login_to_registry(tag:str, *, podman, ainjector):
+    '''Log in to the registry of *tag* with the credentials found by :func:`registry_credentials`, if any.
+    '''
+    registry, *rest = tag.partition('/')
+    credentials = await ainjector(registry_credentials, tag)
+    if credentials:
+        username, password = credentials
+        await podman('login', '-u', username, '-p', password, registry)
+
 class HasContainerHostMixin(OciManaged):
 
     '''
@@ -107,6 +124,13 @@ class HasContainerHostMixin(OciManaged):
         except AttributeError: pass
         return result
 
+    async def deployment_limit(self):
+        '''Limit concurrent deployments per container host; see *podman.max_concurrent_deploys*.
+        '''
+        if self.container_host is None:
+            await self.ainjector(instantiate_container_host, self)
+        return resource_limit(self.container_host, self.config_layout.podman.max_concurrent_deploys)
+
 
 @inject_autokwargs(network=this_network)
 class PodmanNetwork(HasContainerHostMixin, TechnologySpecificNetwork, OciManaged):
@@ -139,11 +163,14 @@ class PodmanNetwork(HasContainerHostMixin, TechnologySpecificNetwork, OciManaged
         if not await self.container_host.find():
             logger.debug('%s does not exist because its container host does not exist', self)
             return False
-        try:
-            inspect_result = await self.podman(
-                'network', 'inspect', self.network.name, _log=False)
-        except Exception: return False
-        info = json.loads(str(inspect_result))[0]
+        info = await self.container_host.inventory_inspect('network', self.network.name)
+        if info is False: return False
+        if info is None:
+            try:
+                inspect_result = await self.podman(
+                    'network', 'inspect', self.network.name, _log=False)
+            except Exception: return False
+            info = json.loads(str(inspect_result))[0]
         try:
             return dateutil.parser.isoparse(info['created']).timestamp()
         except (KeyError, ValueError):
@@ -300,14 +327,17 @@ class PodmanPod(HasContainerHostMixin, PodmanNetworkMixin, carthage.machine.Netw
             inspect_arg = self.id
         else:
             inspect_arg = self.name
-        try:
-            result = await self.podman(
-                'pod', 'inspect', inspect_arg, _log=False)
-        except sh.ErrorReturnCode:
-            return False
-        pod_info = json.loads(str(result.stdout, 'utf-8'))
-        if isinstance(pod_info, list):
-            pod_info = pod_info[0]
+        pod_info = await self.container_host.inventory_inspect('pod', inspect_arg)
+        if pod_info is False: return False
+        if pod_info is None:
+            try:
+                result = await self.podman(
+                    'pod', 'inspect', inspect_arg, _log=False)
+            except sh.ErrorReturnCode:
+                return False
+            pod_info = json.loads(str(result.stdout, 'utf-8'))
+            if isinstance(pod_info, list):
+                pod_info = pod_info[0]
         self.pod_info = pod_info
         return dateutil.parser.isoparse(pod_info['Created']).timestamp()
 
@@ -414,6 +444,11 @@ An OCI container implemented using ``podman``.  While it is possible to set up a
             logger.debug('%s does not exist because its container host does not exist', self)
             return False
         await self.resolve_networking()
+        # The snapshot only answers whether the container exists.
+        # Containers stop or crash, and are changed by other podman
+        # clients, so their state is always inspected directly.
+        if await self.container_host.inventory_inspect('container', self.full_name) is False:
+            return False
         try:
             result = await self.podman(
                 'container', 'inspect', self.full_name,
@@ -440,6 +475,11 @@ An OCI container implemented using ``podman``.  While it is possible to set up a
         if isinstance(image, OciImage):
             await image.async_become_ready()
             image = image.oci_image_tag
+        elif not image_is_local(image):
+            # Pull through the container host so that containers sharing an image do not each pull it
+            await self.container_host.pull_coordinator.pull(
+                image, missing_only=True,
+                credentials=await self.ainjector(registry_credentials, image))
         if self.pod:
             await self.pod.async_become_ready()
         command_options = []
@@ -728,11 +768,12 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
         pull_policy = self.config_layout.podman.pull_policy
         if pull_policy == 'never':
             return
+        credentials = None
         if not image_is_local(self.oci_image_tag):
-            await self.ainjector(login_to_registry, self.oci_image_tag, podman=self.podman)
+            credentials = await self.ainjector(registry_credentials, self.oci_image_tag)
         try:
             self.id = None
-            await self.podman('pull', self.oci_image_tag)
+            await self.container_host.pull_coordinator.pull(self.oci_image_tag, credentials=credentials)
             await self.find()
         except sh.ErrorReturnCode:
             if pull_policy == 'newer' and await self.find():
@@ -755,13 +796,15 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
             to_find = self.id
         else:
             to_find = self.oci_image_tag
-        try:
-            result = await self.podman(
-                'image', 'inspect', to_find,
-                _log=False)
-        except sh.ErrorReturnCode:
-            return False
-        info = json.loads(str(result))[0]
+        info = await self.container_host.inventory_inspect('image', to_find)
+        if not info:
+            try:
+                result = await self.podman(
+                    'image', 'inspect', to_find,
+                    _log=False)
+            except sh.ErrorReturnCode:
+                return False
+            info = json.loads(str(result))[0]
         self.id = info['Id']
         process_inspect_result(self, info)
         self.image_info = info
@@ -789,7 +832,8 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
             await self.podman('image', 'untag', self.oci_image_tag)
 
     @contextlib.asynccontextmanager
-    async def image_layer_context(self, commit_message=""):
+    async def image_layer_context(self, commit_message="", *,
+                                  layer_container=None, layer_cache_key=None):
         '''
         Generate a container to produce  a new image layer:
 
@@ -802,6 +846,10 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
             async with self.image_layer_context() as layer_container:
                 # Apply customizations/run commands in layer_container
             #Now, self.last_layer is the image ID of the new layer
+
+        :param layer_container: A container from :meth:`_layer_container` to use rather than creating one.
+
+        :param layer_cache_key: If supplied, the new layer is recorded in the layer cache under this key; see :meth:`customization_layer`.
         '''
         def container_delete(future):
             try:
@@ -809,21 +857,107 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
             except Exception as e:
                 logger.error('Error deleting %s: %s', layer_container, str(e))
 
-        base_image = self.last_layer or self.base_image
-        layer_container = await self.ainjector(
-            PodmanImageBuilderContainer,
-            oci_container_image=base_image,
-            name=f'carthage-image-build-{id(self)}-l{self.layer_number}',
-        )
+        if layer_container is None:
+            layer_container = await self._layer_container()
         self.layer_number += 1
         try:
+            await layer_container.async_become_ready()
             await layer_container.start_machine()
             yield layer_container
-            await self.commit_container(layer_container, commit_message)
+            await self.commit_container(layer_container, commit_message, layer_cache_key=layer_cache_key)
         finally:
             delete_task = asyncio.get_event_loop().create_task(layer_container.delete())
             delete_task.add_done_callback(container_delete)
 
+    async def _layer_container(self):
+        '''A :class:`PodmanImageBuilderContainer` for the next layer, instantiated but not ready.  :attr:`layer_number` advances once the container is used by :meth:`image_layer_context`.
+        '''
+        base_image = self.last_layer or self.base_image
+        with instantiation_not_ready():
+            return await self.ainjector(
+                PodmanImageBuilderContainer,
+                oci_container_image=base_image,
+                name=f'carthage-image-build-{id(self)}-l{self.layer_number}',
+            )
+
+    async def customization_layer(self, customization, commit_message=""):
+        '''
+        Apply the :class:`~carthage.machine.BaseCustomization` *customization* in a new layer; used by :func:`image_layer_task`.
+
+        If *podman.layer_cache* is true, a layer previously built by applying the same customization to the same parent layer is reused rather than built again, whether it was built for this image or another.  See :meth:`layer_cache_key` for what identifies a layer.  Cached layers are tagged with :meth:`layer_cache_tag` and are never removed by Carthage; remove those tags to reclaim space.
+        '''
+        if not self.config_layout.podman.layer_cache:
+            async with self.image_layer_context(commit_message) as container:
+                await container.apply_customization(customization)
+            return
+        layer_container = await self._layer_container()
+        instance = await layer_container.ainjector(customization, apply_to=layer_container)
+        key = await self.layer_cache_key(instance, commit_message)
+        if cached := await self.find_cached_layer(key):
+            logger.info('%s: using cached layer %s for %s', self, cached[:12], commit_message)
+            # The builder container was never created
+            layer_container.close()
+            self.last_layer = cached
+            return
+        async with self.image_layer_context(
+                commit_message,
+                layer_container=layer_container, layer_cache_key=key):
+            await instance.apply()
+
+    async def layer_cache_key(self, customization, commit_message=""):
+        '''
+        :param customization: An instance of the customization, which is not applied.
+
+        :returns: The key under which the layer produced by applying *customization* is cached.  The key covers:
+
+        * The parent layer (:attr:`last_layer`)
+
+        * The customization class, and for each of its setup tasks, the task's stamp, source code, and the result of its *hash_func*
+
+        * The options with which the layer is committed
+
+        Anything else a customization depends on, such as the contents of package repositories, is not covered; disable *podman.layer_cache* to rebuild layers unconditionally.
+        '''
+        h = hashlib.blake2b(digest_size=20)
+        def add(part):
+            h.update(str(part).encode('utf-8', 'surrogateescape') + b'\0')
+        add(self.last_layer or self.base_image)
+        cls = type(customization)
+        add(cls.__module__ + '.' + cls.__qualname__)
+        for option in await self._layer_commit_options(commit_message):
+            add(option)
+        for t in customization.setup_tasks:
+            add(t.stamp)
+            try: add(inspect.getsource(t.func))
+            except (OSError, TypeError): add(getattr(t.func, '__qualname__', t.func))
+            add(await customization.ainjector(t.hash_func, customization))
+        return h.hexdigest()
+
+    #: The label recording the layer cache key of a layer
+    layer_cache_label = 'com.hadronindustries.carthage.layer_cache'
+
+    @staticmethod
+    def layer_cache_tag(key):
+        '''Labels are inherited by images built on a layer, so cached layers are found by this tag instead.
+        '''
+        return f'localhost/carthage-layer-cache:{key}'
+
+    async def find_cached_layer(self, key):
+        '''
+        :returns: The ID of the layer cached under *key*, or None.
+        '''
+        try:
+            result = await self.podman(
+                'image', 'inspect', self.layer_cache_tag(key),
+                _log=False)
+        except sh.ErrorReturnCode:
+            return None
+        info = json.loads(str(result))[0]
+        labels = info.get('Labels') or info.get('Config', {}).get('Labels') or {}
+        if labels.get(self.layer_cache_label) != key:
+            return None
+        return info['Id']
+
     def _commit_options(self):
         entrypoint = None
         cmd = None
@@ -841,7 +975,7 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
             options.append('--change=ENV '+v.assignment)
         return options
 
-    async def commit_container(self, container, commit_message):
+    async def _layer_commit_options(self, commit_message):
         options = self._commit_options()
         from ..modeling import CarthageLayout
         layout = await self.ainjector.get_instance_async(InjectionKey(CarthageLayout, _optional=True))
@@ -852,6 +986,12 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
         if commit_message:
             options.append('-fdocker')
             options.append('--message=' + commit_message)
+        return options
+
+    async def commit_container(self, container, commit_message, layer_cache_key=None):
+        options = await self._layer_commit_options(commit_message)
+        if layer_cache_key:
+            options.extend(['--change', f'LABEL {self.layer_cache_label}={layer_cache_key}'])
         # options must be quoted if it's going through ssh or something that can split args on space
         # We use podman_nosocket because we have run into trouble with trixie podman driving a bookworm container host.
         commit_result = await self.container_host.podman_nosocket(
@@ -859,6 +999,10 @@ class PodmanImage(OciImage, SetupTaskMixin, no_auto_inject=True):
             *options,
             container.id, _log=False)
         self.last_layer = str(commit_result.stdout, 'utf-8').strip()
+        if layer_cache_key:
+            await self.podman(
+                'image', 'tag',
+                self.last_layer, self.layer_cache_tag(layer_cache_key))
 
     async def tag_last_layer(self):
         assert self.last_layer
@@ -945,13 +1089,9 @@ class PodmanFromScratchImage(PodmanImage):
 
     async def pull_base_image(self):
         await self.image_volume.async_become_ready()
-        async with self.container_host.tar_volume_context(self.image_volume) as tar_path:
-            result = await self.podman(
-                'image', 'import',
-                *self._commit_options(),
-                tar_path,
-                _log=False)
-        id = str(result.stdout, 'utf-8').strip()
+        id = await self.container_host.import_volume(
+            self.image_volume,
+            *self._commit_options())
         inspect_result = await self.podman(
             'image', 'inspect',
             id, _log=False)
@@ -982,8 +1122,7 @@ class ImageLayerTask(TaskWrapperBase):
         super().__init__(description=description, **kwargs)
 
     async def func(self, image:PodmanImage):
-        async with image.image_layer_context(self.description) as container:
-            await container.apply_customization(self.customization)
+        await image.customization_layer(self.customization, self.description)
 
     async def check_completed_func(self, image):
         # We always want to rerun images
@@ -1024,7 +1163,7 @@ class ContainerfileImage(OciImage, no_auto_inject=True):
     def __init__(self, container_context=None, **kwargs):
 
         if container_context:
-            self.container_context = container_context
+            self.source_container_context = self.container_context = Path(container_context).absolute()
 
         else:
 
@@ -1069,6 +1208,8 @@ class ContainerfileImage(OciImage, no_auto_inject=True):
         # By this point, self.container_context has the full path
         super().__init__(**kwargs)
         self.container_host = None
+        #: The DeploymentPass and digest of the last context_digest
+        self._context_digest = None
         if len(self.setup_tasks) > 2:
             # More than just find_or_create and copy_context_if_needed
             self.setup_tasks.sort(key=lambda t: 1 if t.func == OciManaged.find_or_create.func else 0)
@@ -1083,21 +1224,49 @@ class ContainerfileImage(OciImage, no_auto_inject=True):
     def stamp_subdir(self):
         return 'podman_image/'+self.oci_image_tag
 
+    @memoproperty
+    def source_context_manifest(self):
+        '''The :class:`~carthage.context_manifest.ContextManifest` of *source_container_context* used to copy it into :meth:`output_path`.
+        '''
+        return ContextManifest(self.stamp_path/'.context-manifest-source.json', self.source_container_context)
+
+    @memoproperty
+    def context_manifest(self):
+        '''The :class:`~carthage.context_manifest.ContextManifest` of the *container_context* that is built.
+        '''
+        return ContextManifest(self.stamp_path/'.context-manifest.json', self.container_context)
+
+    def context_digest(self):
+        '''
+        :returns: A digest of the contents of *container_context*.  Only files changed since the last scan are read.  Within a :class:`~carthage.deployment.DeploymentPass` the context is scanned once, and again after :meth:`run_setup_tasks` starts, since setup tasks may change the context.
+        '''
+        current_pass = current_deployment_pass()
+        if current_pass is not None and self._context_digest and self._context_digest[0] is current_pass:
+            return self._context_digest[1]
+        scan = self.context_manifest.scan()
+        if scan.modified:
+            self.context_manifest.save(scan.entries)
+        self._context_digest = (current_pass, scan.digest)
+        return scan.digest
+
+    async def run_setup_tasks(self, context=None):
+        # Copying the context and customizations change container_context
+        self._context_digest = None
+        return await super().run_setup_tasks(context)
+
     @setup_task("Copy Context if Needed", order=10)
     async def copy_context_if_needed(self):
         if len(self.setup_tasks) > 2:
             #More than just this task and find_or_create
             logger.info('copying container context for %s image', self.oci_image_tag)
-            shutil.rmtree(self.output_path)
-            shutil.copytree(self.source_container_context, self.output_path, symlinks=True)
+            await asyncio.get_event_loop().run_in_executor(
+                None, self.source_context_manifest.sync, self.output_path)
         else:
             raise SkipSetupTask
 
     @copy_context_if_needed.invalidator()
     def copy_context_if_needed(self, last_run):
-        source_mtime = self.container_context_mtime(self.source_container_context)
-        if source_mtime > last_run: return False
-        return True
+        return not self.source_context_manifest.scan().modified
 
     async def _handle_build_args(self):
         resolved_build_args = await resolve_deferred(self.ainjector, item=self.build_args, args={})
@@ -1117,6 +1286,7 @@ class ContainerfileImage(OciImage, no_auto_inject=True):
             '--annotation', 'com.hadronindustries.carthage.image_mtime='+ \
             datetime.datetime.fromtimestamp(
                 self.container_context_mtime(self.container_context),datetime.timezone.utc).isoformat(),
+            '--annotation', 'com.hadronindustries.carthage.context_digest='+self.context_digest(),
             '-t'+self.oci_image_tag,
             *options,
             self.container_context)
@@ -1127,14 +1297,24 @@ class ContainerfileImage(OciImage, no_auto_inject=True):
         if not await self.container_host.find():
             logger.debug('%s does not exist because its container host does not exist', self)
             return False
-        try: inspect_result = await self.container_host.podman(
-                'image', 'inspect',
-                self.oci_image_tag, _log=False)
-        except sh.ErrorReturnCode: return False
-        inspect_json = json.loads(str(inspect_result.stdout, 'utf-8'))
+        info = await self.container_host.inventory_inspect('image', self.oci_image_tag)
+        if info:
+            inspect_json = [info]
+        else:
+            try: inspect_result = await self.container_host.podman(
+                    'image', 'inspect',
+                    self.oci_image_tag, _log=False)
+            except sh.ErrorReturnCode: return False
+            inspect_json = json.loads(str(inspect_result.stdout, 'utf-8'))
         created = dateutil.parser.isoparse(inspect_json[0]['Created']).timestamp()
         process_inspect_result(self, inspect_json[0])
         hadron_mtime_str = inspect_json[0]['Annotations'].get('com.hadronindustries.carthage.image_mtime')
+        context_digest = inspect_json[0]['Annotations'].get('com.hadronindustries.carthage.context_digest')
+        if context_digest:
+            if context_digest != self.context_digest(): return False
+            if hadron_mtime_str:
+                return dateutil.parser.isoparse(hadron_mtime_str).timestamp()
+            return created
         if hadron_mtime_str:
             hadron_mtime = dateutil.parser.isoparse(hadron_mtime_str).timestamp()
             if self.container_context_mtime(self.container_context) > hadron_mtime+5: return False
@@ -1145,6 +1325,8 @@ class ContainerfileImage(OciImage, no_auto_inject=True):
 
     @staticmethod
     def container_context_mtime(container_context):
+        '''The latest modification time of the top level entries in *container_context*.  Images built with a *context_digest* annotation are compared by :meth:`context_digest` instead.
+        '''
         context = Path(container_context)
         mtime = 0.0
         for p in context.iterdir():
@@ -1193,12 +1375,15 @@ class PodmanVolume(HasContainerHostMixin, OciManaged):
         if not await self.container_host.find():
             logger.debug(f'{self} does not exist because the container host does not exist.')
             return False
-        try:
-            result = await self.podman(
-                'volume', 'inspect', self.name, _log=False)
-        except sh.ErrorReturnCode:
-            return False
-        info = json.loads(str(result))[0]
+        info = await self.container_host.inventory_inspect('volume', self.name)
+        if info is False: return False
+        if info is None:
+            try:
+                result = await self.podman(
+                    'volume', 'inspect', self.name, _log=False)
+            except sh.ErrorReturnCode:
+                return False
+            info = json.loads(str(result))[0]
         process_inspect_result(self, info)
         try:
             return dateutil.parser.isoparse(info['CreatedAt']).timestamp()
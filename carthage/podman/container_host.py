@@ -16,6 +16,7 @@ import logging
 import os
 import os.path
 from pathlib import Path
+import time
 import tempfile
 import shutil
 import shlex
@@ -26,6 +27,7 @@ from carthage.dependency_injection import *
 from .. import sh, ConfigLayout, become_privileged, deployment
 from ..machine import AbstractMachineModel, Machine
 from ..utils import memoproperty
+from ..dependency_injection.introspection import BaseInstantiationContext
 from ..oci import *
 
 __all__ = []
@@ -34,12 +36,281 @@ logger = logging.getLogger('carthage.podman')
 
 CARTHAGE_SOCKET_DIRECTORY = Path('/var/lib/carthage/podman_sockets')
 
+#: For each kind of object tracked by :meth:`PodmanContainerHost.inventory_inspect`: the podman command listing the objects, the command inspecting them, and the inspect fields by which they are looked up.
+_inventory_kinds = dict(
+    container=(('container', 'ls', '--all', '--quiet', '--no-trunc'), ('container', 'inspect'), ('Name', 'Id')),
+    pod=(('pod', 'ps', '--quiet', '--no-trunc'), ('pod', 'inspect'), ('Name', 'Id')),
+    network=(('network', 'ls', '--quiet'), ('network', 'inspect'), ('name', 'id')),
+    volume=(('volume', 'ls', '--quiet'), ('volume', 'inspect'), ('Name',)),
+    image=(('image', 'ls', '--all', '--quiet', '--no-trunc'), ('image', 'inspect'), ('Id', 'RepoTags', 'Names')),
+)
+
+#: Podman commands that group subcommands by object type
+_podman_object_commands = frozenset({
+    'container', 'pod', 'network', 'volume', 'image', 'system', 'manifest', 'generate', 'machine', 'secret'})
+
+#: Podman (sub)commands that do not change the objects in a container host's inventory
+_podman_read_only_commands = frozenset({
+    'inspect', 'ps', 'ls', 'list', 'images', 'exists', 'info', 'version', 'logs', 'port', 'top',
+    'stats', 'exec', 'diff', 'history', 'tree', 'search', 'events', 'export', 'save', 'df',
+})
+
+def podman_command_mutates(args):
+    '''
+    :returns: True unless the podman command line *args* is known not to create, delete or change podman objects.
+    '''
+    words = [str(a) for a in args if str(a) and not str(a).startswith('-')]
+    if not words: return False
+    command = words[0]
+    if command in _podman_object_commands and len(words) > 1:
+        command = words[1]
+    return command not in _podman_read_only_commands
+
+__all__ += ['podman_command_mutates']
+
+class PodmanPullContext(BaseInstantiationContext):
+
+    '''
+    Reports a caller waiting on a pull by a :class:`PodmanPullCoordinator` as a dependency of the current instantiation, so that slow pulls are visible in deployment introspection.
+    '''
+
+    def __init__(self, coordinator, reference):
+        super().__init__(coordinator.container_host.injector)
+        self.coordinator = coordinator
+        self.reference = reference
+        self.started = time.monotonic()
+
+    def __enter__(self):
+        res = super().__enter__()
+        if self.parent:
+            self.parent.dependency_progress(self.dependency_key, self)
+        return res
+
+    def __exit__(self, *args):
+        super().__exit__(*args)
+        self.done()
+        return False
+
+    def done(self):
+        if self.parent:
+            self.parent.dependency_final(self.dependency_key, self)
+        super().done()
+
+    @property
+    def dependency_key(self):
+        return f'podman pull {self.reference}'
+
+    @property
+    def description(self):
+        state = 'pulling' if self.reference in self.coordinator.pulls_running else 'waiting to pull'
+        return f'{state} {self.reference} on {self.coordinator.container_host!r} for {time.monotonic()-self.started:.0f}s'
+
+    def get_dependencies(self):
+        return iter(())
+
+
+class PodmanPullCoordinator:
+
+    '''
+    Coordinates image pulls and registry logins on one :class:`PodmanContainerHost`; available as :attr:`PodmanContainerHost.pull_coordinator`.
+
+    * Concurrent pulls of the same reference with the same credentials share one ``podman pull``.
+
+    * At most *podman.max_concurrent_pulls* pulls run at once.
+
+    * A successful registry login is reused for *podman.login_validity* seconds.  podman keeps one login per registry, so a pull with other credentials for a registry waits until pulls using the current login finish, then logs in again.
+
+    Callers waiting on a pull are reported with a :class:`PodmanPullContext`.
+    '''
+
+    def __init__(self, container_host):
+        self.container_host = container_host
+        config = container_host.injector(ConfigLayout).podman
+        self.login_validity = config.login_validity
+        self.limit = asyncio.Semaphore(config.max_concurrent_pulls) if config.max_concurrent_pulls else contextlib.nullcontext()
+        #: Maps a tuple of reference, *missing_only* and credentials to the future for that pull
+        self.pulls = {}
+        #: References currently being pulled rather than waiting for :attr:`limit`
+        self.pulls_running = set()
+        #: Maps a registry to a tuple of the credentials logged in with, the time the login expires, and the future for the login
+        self.logins = {}
+        #: Maps a registry to a list of the credentials and the number of pulls relying on the login to that registry
+        self.registry_users = {}
+        self.registry_users_changed = asyncio.Condition()
+
+    async def login(self, registry, credentials):
+        '''
+        Log in to *registry* with *credentials*, a tuple of username and password, unless a login with the same credentials succeeded within *login_validity* seconds or is in progress.  Callers must hold the registry with :meth:`_registry_login`.
+        '''
+        if entry := self.logins.get(registry):
+            logged_in, expires, future = entry
+            if logged_in == credentials:
+                if not future.done():
+                    return await asyncio.shield(future)
+                if not future.cancelled() and future.exception() is None and expires > time.monotonic():
+                    return
+        username, password = credentials
+        future = asyncio.ensure_future(self.container_host.podman(
+            'login', '-u', username, '-p', password, registry, _log=False))
+        self.logins[registry] = (credentials, time.monotonic()+self.login_validity, future)
+        try: await asyncio.shield(future)
+        except BaseException:
+            if self.logins.get(registry, (None, None, None))[2] is future:
+                del self.logins[registry]
+            raise
+
+    @contextlib.asynccontextmanager
+    async def _registry_login(self, reference, credentials):
+        # Log in to the registry of *reference* and keep pulls with
+        # other credentials from replacing the login until done.
+        if credentials is None:
+            yield
+            return
+        registry, *rest = reference.partition('/')
+        async with self.registry_users_changed:
+            await self.registry_users_changed.wait_for(
+                lambda: self.registry_users.get(registry, [credentials])[0] == credentials)
+            self.registry_users.setdefault(registry, [credentials, 0])[1] += 1
+        try:
+            await self.login(registry, credentials)
+            yield
+        finally:
+            async with self.registry_users_changed:
+                entry = self.registry_users[registry]
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.registry_users[registry]
+                self.registry_users_changed.notify_all()
+
+    async def pull(self, reference, *, missing_only=False, credentials=None):
+        '''
+        Pull *reference*, or wait for a pull of *reference* already in progress.
+
+        :param missing_only: Only pull if the image is not already present.  Such a caller also waits for a pull without *missing_only* that is already in progress; a caller without *missing_only* never relies on a check that the image is present.
+
+        :param credentials: If supplied, a tuple of username and password to log in to the registry with before actually pulling; see :func:`~carthage.podman.registry_credentials`.
+
+        :returns: True if a pull was run.
+        '''
+        keys = [(reference, False, credentials)]
+        if missing_only:
+            keys.insert(0, (reference, True, credentials))
+        for key in keys:
+            if future := self.pulls.get(key):
+                break
+        else:
+            key = (reference, missing_only, credentials)
+            future = asyncio.ensure_future(self._pull(reference, missing_only, credentials))
+            self.pulls[key] = future
+            future.add_done_callback(lambda f: self.pulls.pop(key, None) if self.pulls.get(key) is f else None)
+        with PodmanPullContext(self, reference):
+            return await asyncio.shield(future)
+
+    async def _pull(self, reference, missing_only, credentials):
+        async with self.limit:
+            if missing_only:
+                try:
+                    await self.container_host.podman('image', 'exists', reference, _log=False)
+                    return False
+                except sh.ErrorReturnCode: pass
+            async with self._registry_login(reference, credentials):
+                self.pulls_running.add(reference)
+                started = time.monotonic()
+                try:
+                    await self.container_host.podman('pull', reference)
+                finally:
+                    self.pulls_running.discard(reference)
+            logger.info('%r: pulled %s in %.1fs', self.container_host, reference, time.monotonic()-started)
+            return True
+
+__all__ += ['PodmanPullCoordinator', 'PodmanPullContext']
+
 class PodmanContainerHost(AsyncInjectable):
 
+    _inventory = None
+    _inventory_generation = 0
+    _mutations_in_progress = 0
+
     @memoproperty
     def podman_log(self):
         return self.injector.get_instance(InjectionKey("podman_log", _optional=True))
 
+    @memoproperty
+    def pull_coordinator(self):
+        '''The :class:`PodmanPullCoordinator` through which images are pulled onto this host.
+        '''
+        return PodmanPullCoordinator(self)
+
+    async def inventory_inspect(self, kind, name):
+        '''
+        Look up the ``podman inspect`` result for *name* in a snapshot of the *kind* objects (``container``, ``pod``, ``network``, ``volume`` or ``image``) on this host.  The first lookup of a *kind* during a :class:`~carthage.deployment.DeploymentPass` takes the snapshot with one listing and one inspect command; the snapshot is discarded whenever a podman command that may change objects is run through this host.
+
+        Objects may change without going through this host: containers stop or crash, and other podman clients or commands run over ssh change things.  Runtime state such as whether a container is running must not be taken from the snapshot.
+
+        :returns: The inspect result for *name* if it is in the snapshot; False if the snapshot shows that *name* does not exist; None if no snapshot is available and the caller should inspect *name* directly.  Images not in the snapshot return None because podman normalizes image references.
+        '''
+        current_pass = deployment.current_deployment_pass()
+        if current_pass is None: return None
+        if self._inventory is None or self._inventory[0] is not current_pass:
+            self._inventory = (current_pass, {})
+        snapshots = self._inventory[1]
+        try: future = snapshots[kind]
+        except KeyError:
+            future = asyncio.ensure_future(self._inventory_snapshot(kind))
+            snapshots[kind] = future
+        index = await asyncio.shield(future)
+        if index is None: return None
+        try: return index[name]
+        except KeyError:
+            if kind == 'image': return None
+            return False
+
+    async def _inventory_snapshot(self, kind):
+        list_command, inspect_command, keys = _inventory_kinds[kind]
+        # A snapshot taken while a mutation is in progress or that
+        # overlaps one might miss objects, so it is not used.
+        if self._mutations_in_progress: return None
+        generation = self._inventory_generation
+        try:
+            listing = await self.podman(*list_command, _log=False)
+            names = list(dict.fromkeys(str(listing).split()))
+            infos = []
+            if names:
+                result = await self.podman(*inspect_command, *names, _log=False)
+                infos = json.loads(str(result))
+                if isinstance(infos, dict): infos = [infos]
+        except (sh.ErrorReturnCode, ValueError):
+            logger.debug('%r: unable to take %s inventory', self, kind, exc_info=True)
+            return None
+        if generation != self._inventory_generation: return None
+        index = {}
+        for info in infos:
+            for key in keys:
+                values = info.get(key)
+                if isinstance(values, str): values = [values]
+                for v in values or []:
+                    index[v] = info
+        return index
+
+    def invalidate_inventory(self):
+        '''Discard any inventory snapshot; called when podman objects change.
+        '''
+        self._inventory_generation += 1
+        self._inventory = None
+
+    @contextlib.contextmanager
+    def _inventory_tracking(self, args):
+        # Wrapped around every podman command run by implementations of podman()
+        if not podman_command_mutates(args):
+            yield
+            return
+        self._mutations_in_progress += 1
+        self.invalidate_inventory()
+        try: yield
+        finally:
+            self._mutations_in_progress -= 1
+            self.invalidate_inventory()
+
     def podman(self, *args,
                _bg=True, _bg_exc=True):
         raise NotImplementedError
@@ -81,9 +352,99 @@ class PodmanContainerHost(AsyncInjectable):
                 await container_host.podman('import', path)
 
         On local systems this manages temporary directories.  For remote container hosts, this manages to get the tar file to the remote system and clean up later.
+
+        :meth:`import_volume` avoids the tar file entirely when *podman.import_streaming* is true.
         '''
         raise NotImplementedError
 
+    #: Compression programs usable by :meth:`import_volume`, mapped to their tar options
+    import_compressors = {
+        'none': (),
+        'gzip': ('-z',),
+        'pigz': ('-Ipigz',),
+        'zstd': ('-Izstd -T0',),
+    }
+
+    @property
+    def import_compression(self):
+        '''The compression used when streaming a volume into :meth:`import_volume`.  Uncompressed unless overridden for container hosts reached over a network.
+        '''
+        return 'none'
+
+    async def import_volume(self, volume, *options):
+        '''
+        Import the filesystem of *volume* (which must have a *path*) as an image using ``podman image import``.  *options* are passed to podman before the image source.
+
+        If *podman.import_streaming* is true, the output of ``tar`` is piped into ``podman image import -`` with no intermediate file, compressed according to :attr:`import_compression`.  Otherwise the volume is imported from :meth:`tar_volume_context`.
+
+        :returns: The ID of the imported image.
+        '''
+        assert hasattr(volume, 'path')
+        if not self.injector(ConfigLayout).podman.import_streaming:
+            async with self.tar_volume_context(volume) as tar_path:
+                result = await self.podman(
+                    'image', 'import',
+                    *options,
+                    tar_path,
+                    _log=False)
+            return str(result.stdout, 'utf-8').strip()
+        compression = self.import_compression
+        read_fd, write_fd = os.pipe()
+        tar = None
+        try:
+            tar = sh.tar(
+                "-C", str(volume.path),
+                "--xattrs",
+                "--xattrs-include=*.*",
+                *self.import_compressors[compression],
+                "-cf", "-",
+                ".",
+                _out=write_fd,
+                _bg=True,
+                _bg_exc=False)
+            # Once tar has its copy, closing ours lets the importer see EOF.
+            os.close(write_fd)
+            write_fd = None
+            result = await self._import_stream(read_fd, compression, options)
+        except BaseException as e:
+            if tar is not None:
+                # tar may be blocked writing to a pipe nobody reads
+                with contextlib.suppress(ProcessLookupError):
+                    tar.process.kill()
+                with contextlib.suppress(sh.ErrorReturnCode):
+                    await tar
+            if isinstance(e, sh.ErrorReturnCode):
+                # The importer may have imported a truncated stream before failing
+                await self._remove_imported_image(e.stdout)
+            raise
+        finally:
+            for fd in read_fd, write_fd:
+                if fd is not None: os.close(fd)
+        try:
+            await tar
+        except sh.ErrorReturnCode:
+            await self._remove_imported_image(result.stdout)
+            raise
+        return str(result.stdout, 'utf-8').strip()
+
+    async def _remove_imported_image(self, stdout):
+        # Remove the image whose ID is in the *stdout* of podman image import, if any
+        image_id = str(stdout or b'', 'utf-8').strip()
+        if not image_id: return
+        try:
+            await self.podman('image', 'rm', image_id, _log=False)
+        except sh.ErrorReturnCode:
+            logger.warning('Unable to remove image %s imported from an incomplete stream', image_id)
+
+    async def _import_stream(self, read_fd, compression, options):
+        '''Run ``podman image import`` reading a tar stream compressed with *compression* from *read_fd*.
+        '''
+        return await self.podman(
+            'image', 'import',
+            *options,
+            '-',
+            _log=False, _in=read_fd)
+
     async def find(self):
         '''Return true if find_deployable is true  for the underlying container host.
         '''
@@ -114,18 +475,21 @@ class LocalPodmanContainerHost(PodmanContainerHost):
             pass  # Perhaps we should unmount, but we'd need a refcount to do that.
 
     async def podman(self, *args,
-               _bg=True, _bg_exc=False, _log=True, _fg=False):
+               _bg=True, _bg_exc=False, _log=True, _fg=False, _in=None):
         options = {}
         if _log and self.podman_log:
             options['_out']=str(self.podman_log)
             options['_err_to_out'] = True
-        result = sh.podman(
-            *args,
-            _fg=_fg,
-            **options)
-        if not _fg:
-            return await result
-        return result
+        if _in is not None:
+            options['_in'] = _in
+        with self._inventory_tracking(args):
+            result = sh.podman(
+                *args,
+                _fg=_fg,
+                **options)
+            if not _fg:
+                return await result
+            return result
 
     @contextlib.asynccontextmanager
     async def tar_volume_context(self, volume):
@@ -370,14 +734,15 @@ class RemotePodmanHost(PodmanContainerHost):
         if _log and self.podman_log:
             options['_out']=str(self.podman_log)
             options['_err_to_out'] = True
-        result = sh.podman(
-            self.extra_args,
-                *args,
-                _fg=_fg,
-            **options)
-        if not _fg:
-            return await result
-        return result
+        with self._inventory_tracking(args):
+            result = sh.podman(
+                self.extra_args,
+                    *args,
+                    _fg=_fg,
+                **options)
+            if not _fg:
+                return await result
+            return result
 
     async def podman_nosocket(self, *args, _log=True, **kwargs):
         options = {}
@@ -385,13 +750,14 @@ class RemotePodmanHost(PodmanContainerHost):
         if _log and self.podman_log:
             options['_out']=str(self.podman_log)
             options['_err_to_out'] = True
-        result = self.machine.run_command(
-            'podman',
-            *args,
-            _user=self.user,
-            **options,
-            **kwargs)
-        return await result
+        with self._inventory_tracking(args):
+            result = self.machine.run_command(
+                'podman',
+                *args,
+                _user=self.user,
+                **options,
+                **kwargs)
+            return await result
 
     @contextlib.asynccontextmanager
     async def filesystem_access(self, *args):
@@ -425,6 +791,34 @@ class RemotePodmanHost(PodmanContainerHost):
         return f'--url=unix://{self.local_socket}'
 
     tar_volume_context = LocalPodmanContainerHost.tar_volume_context
+
+    @property
+    def import_compression(self):
+        compression = self.machine.config_layout.podman.import_compression
+        if compression not in self.import_compressors:
+            raise ValueError(f'Unknown podman.import_compression {compression}')
+        if compression == 'pigz' and not shutil.which('pigz'):
+            compression = 'gzip'
+        return compression
+
+    async def _import_stream(self, read_fd, compression, options):
+        # Stream over ssh to podman on the machine rather than through the socket so the data is only compressed by us
+        await self.start_container_host()
+        command = shlex.join(['podman', 'image', 'import', *map(str, options), '-'])
+        if compression == 'zstd':
+            # podman understands gzip but not necessarily zstd.  A
+            # missing or failing zstd must fail the import rather than
+            # look like an empty stream; not every /bin/sh supports
+            # pipefail, so check for zstd as well.
+            command = ('command -v zstd >/dev/null || { echo zstd not found >&2; exit 127; }; '
+                       '(set -o pipefail) 2>/dev/null && set -o pipefail; '
+                       'zstd -dc | '+command)
+        args = ('image', 'import')
+        with self._inventory_tracking(args):
+            return await self.machine.run_command(
+                'sh', '-c', command,
+                _user=self.user,
+                _in=read_fd)
 __all__ += ['RemotePodmanHost']
 
 class LocalPodmanSocket(PodmanContainerHost):
@@ -442,19 +836,22 @@ class LocalPodmanSocket(PodmanContainerHost):
             'sshfs_local_podman_'))
 
     async def podman(self, *args,
-               _bg=True, _bg_exc=False, _log=True, _fg=False):
+               _bg=True, _bg_exc=False, _log=True, _fg=False, _in=None):
         options = {}
         if _log and self.podman_log:
             options['_out']=str(self.podman_log)
             options['_err_to_out'] = True
-        result = sh.podman(
-            '--remote',
-            *args,
-            _fg=_fg,
-            **options)
-        if not _fg:
-            return await result
-        return result
+        if _in is not None:
+            options['_in'] = _in
+        with self._inventory_tracking(args):
+            result = sh.podman(
+                '--remote',
+                *args,
+                _fg=_fg,
+                **options)
+            if not _fg:
+                return await result
+            return result
 
     @contextlib.asynccontextmanager
     async def filesystem_access_container(self, container_name):
@@ -127,6 +127,37 @@ class DumpAssignmentsCommand(CarthageRunnerCommand):
         return True
     
 
+class ImportStampsCommand(CarthageRunnerCommand):
+
+    name = 'import_stamps'
+
+    subparser_kwargs = dict(
+        help='Import setup task stamp files from cache_dir, state_dir and any other directories given into the stamp index.  Stamps of objects whose stamp_path is elsewhere must be imported by naming a directory above it.',
+        )
+
+    def setup_subparser(self, parser):
+        parser.add_argument('--remove', action='store_true',
+                            help='Remove stamp files once imported')
+        parser.add_argument('directories', nargs='*',
+                            help='Additional directories to search for stamp files')
+
+    async def run(self, args):
+        import os.path
+        from pathlib import Path
+        from .stamp_index import StampIndex, stamp_index_for, database_name
+        config = await self.ainjector.get_instance_async(ConfigLayout)
+        index = stamp_index_for(config)
+        if index is None:
+            index = StampIndex(Path(config.cache_dir)/database_name)
+        roots = sorted({os.path.abspath(d) for d in (config.cache_dir, config.state_dir, *args.directories)})
+        count = 0
+        for i, root in enumerate(roots):
+            # A root below another one is already covered
+            if any(root.startswith(other+'/') for other in roots[:i]): continue
+            count += index.import_stamp_files(root, remove=args.remove)
+        print(f'Imported {count} stamps')
+
+
 def enable_runner_commands(ainjector):
     ainjector.add_provider(StartCommand)
     ainjector.add_provider(ListMachines)
@@ -134,4 +165,5 @@ def enable_runner_commands(ainjector):
     ainjector.add_provider(StopCommand)
     ainjector.add_provider(DeleteCommand)
     ainjector.add_provider(DumpAssignmentsCommand)
+    ainjector.add_provider(ImportStampsCommand)
 
@@ -28,6 +28,7 @@ from carthage.dependency_injection import AsyncInjector, AsyncInjectable, inject
 from carthage.dependency_injection.introspection import current_instantiation
 from carthage.config import ConfigLayout
 from carthage.utils import memoproperty, import_resources_files
+from carthage.stamp_index import StampIndex, stamp_index_for
 
 __all__ = ['logger', 'PathMixin', 'TaskWrapper', 'TaskMethod', 'setup_task', 'SkipSetupTask', 'SetupTaskMixin',
            'cross_object_dependency',
@@ -86,17 +87,38 @@ class PathMixin(Injectable):
         res.mkdir(parents=True, exist_ok=True)
         return res
 
+    @memoproperty
+    def stamp_index(self):
+        '''The :class:`~carthage.stamp_index.StampIndex` holding completion stamps, or None if stamps are kept as files in :meth:`stamp_path`.  Controlled by *tasks.stamp_backend*.
+        '''
+        return stamp_index_for(self.config_layout)
+
+    def forget_stamps(self):
+        '''Remove :meth:`stamp_path` along with the completion stamps for this object, including those kept in :attr:`stamp_index`, so that setup tasks run again if the object is recreated.
+        '''
+        if self.stamp_index is not None:
+            self.stamp_index.clear(self.stamp_path)
+        shutil.rmtree(self.stamp_path, ignore_errors=True)
+        try:
+            del self.stamp_path # so it gets recreated
+        except (AttributeError, TypeError): pass
+
     def clear_stamps_and_cache(self):
         cache_dir = Path(self.config_layout.cache_dir)
         if str(self.stamp_path).startswith(str(cache_dir)):
             logger.info('Clearing stamps and cache for %s', self)
-            shutil.rmtree(self.stamp_path, ignore_errors=True)
-            try:
-                del self.stamp_path # so it gets recreated
-            except (AttributeError, TypeError): pass
+            self.forget_stamps()
         else:
             logger.warn('Failed to clear stamps for %s: stamps not under cache_dir', self)
-            
+
+
+def _stamp_index(obj):
+    # check_stamp and friends are sometimes called with a class as self
+    index = getattr(obj, 'stamp_index', None)
+    if isinstance(index, StampIndex): return index
+    return None
+
+
 _task_order = 0
 
 
@@ -251,6 +273,11 @@ class TaskWrapperBase:
     #check_completed functions, dependencies may not be called.
     dependencies_always: bool = False
 
+    #: The earlier tasks on the same object that this task actually
+    #depends on; see :meth:`runs_after`.  None means the task depends
+    #on the task immediately before it.
+    task_dependencies: typing.Optional[list] = None
+
     @memoproperty
     def stamp(self):
         raise NotImplementedError
@@ -415,6 +442,29 @@ class TaskWrapperBase:
         assert isinstance(dependency, SystemDependency)
         self.dependencies.append(dependency)
         
+    def runs_after(self, *tasks):
+        '''
+        Declare the earlier setup tasks on the same object that this task depends on.  Only used when :attr:`SetupTaskMixin.setup_task_concurrency` is greater than 1; otherwise tasks always run in order.  Example usage::
+
+            @setup_task("install packages")
+            async def install_packages(self): ...
+
+            @setup_task("render configuration")
+            def render_config(self): ...
+            render_config.runs_after()
+
+            @setup_task("start service")
+            async def start_service(self): ...
+            start_service.runs_after(install_packages, render_config)
+
+        Here *render_config* may run concurrently with *install_packages*.  A task reruns if any task it depends on has run more recently, just as a task reruns when the task before it has run more recently in sequential execution.  Tasks that never call *runs_after* depend on the task immediately before them.
+
+        :param tasks: Tasks or task stamps.  Each must be ordered before this task.
+
+        '''
+        self.task_dependencies = list(tasks)
+        return self
+
     def invalidator(self, slow=False):
         '''Decorator to indicate  an invalidation function for a :func:`setup_task`
 
@@ -510,7 +560,7 @@ class TaskWrapper(TaskWrapperBase):
 
     def __setattr__(self, a, v):
         if a in ('func',
-                 'dependencies_always', 'stamp', 'order',
+                 'dependencies_always', 'task_dependencies', 'stamp', 'order',
                  'invalidator_func', 'check_completed_func', 'hash_func') or a in self.__class__.extra_attributes:
             return super().__setattr__(a, v)
         else:
@@ -573,6 +623,11 @@ class SkipSetupTask(Exception):
     pass
 
 
+class _SetupTaskNotRun(Exception):
+    # A task skipped because another task on the object failed
+    pass
+
+
 class SetupTaskMixin(PathMixin, AsyncInjectable):
 
     def __init__(self, *args, **kwargs):
@@ -621,12 +676,20 @@ class SetupTaskMixin(PathMixin, AsyncInjectable):
             return False
         return readonly
     
+    #: The number of setup tasks on this object that may run at once.
+    #If greater than 1, tasks are scheduled according to the
+    #dependencies declared with :meth:`TaskWrapperBase.runs_after`
+    #rather than strictly in order.
+    setup_task_concurrency: int = 1
+
     async def run_setup_tasks(self, context=None):
         '''Run the set of collected setup tasks.  If *context* is provided, it
         is used as an asynchronous context manager that will be entered before the
         first task and eventually exited.  The context is never
         entered if no tasks are run.
         This execution context is different from :class:`SetupTaskContext`. The *SetupTaskContext* is an introspection mechanism that tracks which setup task is running and why; the asynchronous context allows a set of tasks for example in a customization to have common resources available.
+
+        If :attr:`setup_task_concurrency` is greater than 1, tasks whose dependencies have completed run concurrently; see :meth:`TaskWrapperBase.runs_after`.
         
         '''
         injector = getattr(self, 'injector', carthage.base_injector)
@@ -637,59 +700,150 @@ class SetupTaskMixin(PathMixin, AsyncInjectable):
         if config is None:
             config = injector(ConfigLayout)
         context_entered = False
+        context_lock = asyncio.Lock()
         dry_run = config.tasks.dry_run
-        dependency_last_run = 0.0
         if self.readonly:
             self.logger_for().info('Not running tasks for %s which is readonly', self)
             return
-        for t in self.setup_tasks:
-            with SetupTaskContext(self, t) as introspection_context:
+        index = _stamp_index(self)
+        if index is not None:
+            index.refresh()
+
+        async def enter_context():
+            nonlocal context_entered
+            if context is None or context_entered: return
+            async with context_lock:
+                if context_entered: return
+                await context.__aenter__()
+                context_entered = True
+
+        def run_task(t, dependency_last_run):
+            return self._run_setup_task(
+                t, dependency_last_run,
+                ainjector=ainjector, dry_run=dry_run, enter_context=enter_context)
+
+        try:
+            if self.setup_task_concurrency > 1:
+                await self._run_setup_task_graph(run_task)
+            else:
+                dependency_last_run = 0.0
+                for t in self.setup_tasks:
+                    dependency_last_run = await run_task(t, dependency_last_run)
+        except:
+            if context_entered:
+                await context.__aexit__(*sys.exc_info())
+            raise
+        if context_entered:
+            await context.__aexit__(None, None, None)
+
+    async def _run_setup_task(self, t, dependency_last_run, *, ainjector, dry_run, enter_context):
+        '''Run *t* if it should run.  Returns the *dependency_last_run* for tasks that depend on *t*.
+        '''
+        with SetupTaskContext(self, t) as introspection_context:
+            try:
+                if t.dependencies_always:
+                    await enter_context()
+                should_run, dependency_last_run = await t.should_run_task(self, dependency_last_run, ainjector=ainjector, introspection_context=introspection_context)
+            except:
+                introspection_context.done()
+                raise
+            if should_run:
+                self.injector.emit_event(
+                    InjectionKey(SetupTaskMixin), "task_should_run",
+                    self, task=t,
+                    adl_keys=self.setup_task_event_keys())
                 try:
-                    if t.dependencies_always and (not context_entered) and context is not None:
-                        await context.__aenter__()
-                        context_entered = True
-                    should_run, dependency_last_run = await t.should_run_task(self, dependency_last_run, ainjector=ainjector, introspection_context=introspection_context)
-                except:
-                    introspection_context.done()
-                    if context_entered:
-                        await context.__aexit__(*sys.exc_info())
+                    await enter_context()
+                    if not dry_run:
+                        self.logger_for().info(f"Running {t.description} task for {self}")
+                        started = time.time()
+                        await ainjector(t, self)
+                        dependency_last_run = time.time()
+                        a = datetime.datetime.fromtimestamp(started)
+                        b = datetime.datetime.fromtimestamp(dependency_last_run)
+                        self.logger_for().info(f"Finished running {t.description} task for {self} from {a.time()} to {b.time()} ({b - a})")
+                    else:
+                        self.logger_for().info(f'Would run {t.description} task for {self}')
+                except SkipSetupTask:
+                    pass
+                except Exception:
+                    self.logger_for().exception(f"Error running {t.description} for {self}:")
                     raise
-                if should_run:
-                    self.injector.emit_event(
-                        InjectionKey(SetupTaskMixin), "task_should_run",
-                        self, task=t,
-                        adl_keys=self.setup_task_event_keys())
-                    try:
-                        if (not context_entered) and context is not None:
-                            await context.__aenter__()
-                            context_entered = True
-                        if not dry_run:
-                            self.logger_for().info(f"Running {t.description} task for {self}")
-                            started = time.time()
-                            await ainjector(t, self)
-                            dependency_last_run = time.time()
-                            a = datetime.datetime.fromtimestamp(started)
-                            b = datetime.datetime.fromtimestamp(dependency_last_run)
-                            self.logger_for().info(f"Finished running {t.description} task for {self} from {a.time()} to {b.time()} ({b - a})")
-                        else:
-                            self.logger_for().info(f'Would run {t.description} task for {self}')
-                    except SkipSetupTask:
-                        pass
-                    except Exception:
-                        self.logger_for().exception(f"Error running {t.description} for {self}:")
-                        if context_entered:
-                            await context.__aexit__(*sys.exc_info())
-                        raise
-                    finally:
-                        introspection_context.done()
-                else:           # not should_run
-                    self.injector.emit_event(
-                        InjectionKey(SetupTaskMixin), "task_already_run",
-                        self, task=t,
-                        adl_keys=self.setup_task_event_keys())
+                finally:
                     introspection_context.done()
-        if context_entered:
-            await context.__aexit__(None, None, None)
+            else:           # not should_run
+                self.injector.emit_event(
+                    InjectionKey(SetupTaskMixin), "task_already_run",
+                    self, task=t,
+                    adl_keys=self.setup_task_event_keys())
+                introspection_context.done()
+        return dependency_last_run
+
+    def setup_task_graph(self):
+        '''
+        :returns: A list parallel to :attr:`setup_tasks`; each element is the list of indices into *setup_tasks* of the tasks that task depends on.  See :meth:`TaskWrapperBase.runs_after`.
+        '''
+        result = []
+        by_stamp = {}
+        for i, t in enumerate(self.setup_tasks):
+            if t.task_dependencies is None:
+                result.append([i-1] if i > 0 else [])
+            else:
+                dependencies = []
+                for d in t.task_dependencies:
+                    stamp = d if isinstance(d, str) else d.stamp
+                    try: dependencies.append(by_stamp[stamp])
+                    except KeyError:
+                        raise ValueError(f'{t.description} for {self} runs after {stamp}, which is not an earlier setup task') from None
+                result.append(dependencies)
+            by_stamp[t.stamp] = i
+        return result
+
+    async def _run_setup_task_graph(self, run_task):
+        graph = self.setup_task_graph()
+        limit = asyncio.Semaphore(self.setup_task_concurrency)
+        loop = asyncio.get_running_loop()
+        results = [loop.create_future() for t in self.setup_tasks]
+        failed = False
+
+        async def run(i):
+            nonlocal failed
+            dependency_last_run = 0.0
+            for d in graph[i]:
+                # Raises if a dependency failed or was not run
+                dependency_last_run = max(dependency_last_run, await asyncio.shield(results[d]))
+            async with limit:
+                if failed: raise _SetupTaskNotRun
+                try:
+                    return await run_task(self.setup_tasks[i], dependency_last_run)
+                except BaseException:
+                    failed = True
+                    raise
+
+        def done(i, future):
+            if future.cancelled():
+                results[i].cancel()
+            elif future.exception() is not None:
+                results[i].set_exception(future.exception())
+            else:
+                results[i].set_result(future.result())
+
+        running = []
+        for i in range(len(self.setup_tasks)):
+            future = asyncio.ensure_future(run(i))
+            future.add_done_callback(lambda f, i=i: done(i, f))
+            running.append(future)
+        try:
+            outcomes = await asyncio.gather(*running, return_exceptions=True)
+        except asyncio.CancelledError:
+            for f in running: f.cancel()
+            raise
+        for r in results:
+            # Retrieve exceptions so that unwaited results are not logged
+            if not r.cancelled(): r.exception()
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException) and not isinstance(outcome, _SetupTaskNotRun):
+                raise outcome
 
     def setup_task_event_keys(self):
         '''Yield the set of keys that setup_task related events should be dispatc should be dispatched to.  In addition to keys yi.yielded by this generator, all setup tasks events are dispatched to InjectionKey(SetupTaskMixin).
@@ -730,6 +884,9 @@ class SetupTaskMixin(PathMixin, AsyncInjectable):
         return await super().async_ready()
 
     def create_stamp(self, stamp, contents):
+        index = _stamp_index(self)
+        if index is not None:
+            return index.create_stamp(self.stamp_path, stamp, contents)
         try:
             with open(os.path.join(self.stamp_path, ".stamp-" + stamp), "wt") as f:
                 # on NFS, opening a zero-length file even for truncate does not reset the utime
@@ -744,6 +901,9 @@ class SetupTaskMixin(PathMixin, AsyncInjectable):
                     f.write(contents)
 
     def delete_stamp(self, stamp):
+        index = _stamp_index(self)
+        if index is not None:
+            return index.delete_stamp(self.stamp_path, stamp)
         try:
             os.unlink(os.path.join(self.stamp_path, ".stamp-" + stamp))
         except FileNotFoundError:
@@ -755,6 +915,12 @@ class SetupTaskMixin(PathMixin, AsyncInjectable):
         '''
         if raise_on_error not in (True, False):
             raise SyntaxError(f'raise_on_error must be a boolean. current value: {raise_on_error}')
+        index = _stamp_index(self)
+        if index is not None and self.stamp_path:
+            result = index.check_stamp(self.stamp_path, stamp)
+            if result[0] is False and raise_on_error and not os.path.exists(self.stamp_path):
+                raise RuntimeError(f"stamp directory '{self.stamp_path}' did not exist")
+            return result
         try:
             if not self.stamp_path: raise FileNotFoundError
             path = Path(self.stamp_path) / f'.stamp-{stamp}'
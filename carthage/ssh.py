@@ -10,7 +10,9 @@ from __future__ import annotations
 import asyncio
 import contextlib
 import dataclasses
+import hashlib
 import io
+import logging
 import os
 import time
 from pathlib import Path
@@ -21,6 +23,7 @@ from . import sh, machine
 from .utils import memoproperty, when_needed
 from pathlib import Path
 
+logger = logging.getLogger('carthage.ssh')
 
 @dataclasses.dataclass
 class RsyncPath:
@@ -167,6 +170,8 @@ async def rsync(*args, config_layout,
                     ssh_origin = sso
                     vrf = a.ssh_origin_vrf
                     ssh_options = list(a.machine.ssh_options) + a.machine.config_layout.global_ssh_options.split()
+                    if hasattr(a.machine, 'ssh_multiplex'):
+                        ssh_options.extend(await a.machine.ssh_multiplex())
                 elif ssh_origin is not sso:
                     raise RuntimeError(f"Two different ssh_origins: {sso} and {ssh_origin}")
                 args[i] = str(a)
@@ -255,11 +260,36 @@ UserKnownHostsFile {config_layout.state_dir}/ssh_known_hosts
             ssh_config_text += 'Include config\n'
         ssh_config.write_text(ssh_config_text)
         self.ssh_config = ssh_config
+        self.control_dir = run/'ssh_control'
+        self.control_persist = config_layout.ssh.control_persist
+        self.control_masters = {}
         
     def handle_key(self, key):
         key.add_to_agent(self)
 
+    def control_master(self, *destination):
+        '''
+        :returns: The :class:`SshControlMaster` for *destination*, or None if its control socket path would be too long.
+
+        :param destination: Everything that distinguishes one ssh connection from another, typically the login user, address, ssh options (including jump host), ssh_origin and key.
+        '''
+        digest = hashlib.blake2b(repr(destination).encode(), digest_size=10).hexdigest()
+        try: return self.control_masters[digest]
+        except KeyError: pass
+        path = self.control_dir/digest
+        if len(str(path)) > 100:
+            # Unix socket paths are limited to 108 bytes and ssh adds a temporary suffix
+            logger.debug('Not multiplexing ssh connections because %s is too long', path)
+            return None
+        self.control_dir.mkdir(mode=0o700, exist_ok=True)
+        master = SshControlMaster(path, persist=self.control_persist)
+        self.control_masters[digest] = master
+        return master
+
     def close(self):
+        for master in self.control_masters.values():
+            master.stop_sync()
+        self.control_masters.clear()
         if self.process is not None:
             try:
                 self.process.terminate()
@@ -276,6 +306,106 @@ UserKnownHostsFile {config_layout.state_dir}/ssh_known_hosts
 
 ssh_agent = when_needed(SshAgent)
 
+class SshControlMaster:
+
+    '''
+    A multiplexed ssh connection (OpenSSH *ControlMaster*) to one destination, obtained from :meth:`SshAgent.control_master`.  While the master connection is running, ssh commands including :attr:`ssh_options` run over it rather than performing their own key exchange and authentication.  When it is not running, such commands connect directly.
+
+    '''
+
+    #: Seconds to wait before retrying a master connection that failed to start
+    retry_interval = 60
+
+    def __init__(self, path, persist):
+        self.path = Path(path)
+        self.persist = persist
+        self.last_used = None
+        self.failed_at = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ssh_options(self):
+        '''Options that cause ssh to use the master connection if it is running.
+        '''
+        return (f'-oControlPath={self.path}', '-oControlMaster=no')
+
+    def _control(self, operation):
+        return sh.ssh(f'-O{operation}', f'-oControlPath={self.path}', 'carthage-control-master',
+                      _bg=True, _bg_exc=False)
+
+    async def start(self, ssh, timeout=30):
+        '''
+        Start the master connection unless it is already running.
+
+        :param ssh: A function that takes ssh options and returns a baked ssh command connecting to the destination with those options, such as :meth:`carthage.machine.SshMixin.ssh_with_options`.
+
+        :returns: True if the master connection is running.
+        '''
+        now = time.time()
+        if self.last_used is not None and now-self.last_used < self.persist/2 and self.path.exists():
+            # Used recently enough that ControlPersist has not expired
+            self.last_used = now
+            return True
+        if self.failed_at is not None and now-self.failed_at < self.retry_interval:
+            return False
+        async with self._lock:
+            if self.path.exists():
+                try:
+                    await self._control('check')
+                    self.last_used = time.time()
+                    return True
+                except sh.ErrorReturnCode:
+                    with contextlib.suppress(OSError):
+                        self.path.unlink()
+            try:
+                # -f backgrounds once authenticated.  The background
+                # process keeps its stdout and stderr, so they must
+                # not be pipes that sh waits on.
+                await ssh(
+                    '-oControlMaster=yes', f'-oControlPath={self.path}',
+                    f'-oControlPersist={self.persist}',
+                    '-oServerAliveInterval=15',
+                    '-N', '-f')(
+                        _bg=True, _bg_exc=False,
+                        _out=os.devnull, _err=os.devnull,
+                        _timeout=timeout)
+            except (sh.ErrorReturnCode, sh.TimeoutException) as e:
+                logger.info('Unable to start ssh master connection %s: %s', self.path, e)
+                self.failed_at = time.time()
+                self.last_used = None
+                return False
+            self.failed_at = None
+            self.last_used = time.time()
+            return True
+
+    async def running(self):
+        '''
+        :returns: True if the master connection is running, as confirmed by ``ssh -O check``.
+        '''
+        if not self.path.exists(): return False
+        try:
+            await self._control('check')
+            return True
+        except sh.ErrorReturnCode:
+            return False
+
+    async def stop(self):
+        '''Stop the master connection and any connections using it.
+        '''
+        self.last_used = None
+        self.failed_at = None
+        if not self.path.exists(): return
+        async with self._lock:
+            try: await self._control('exit')
+            except sh.ErrorReturnCode: pass
+
+    def stop_sync(self):
+        self.last_used = None
+        if not self.path.exists(): return
+        try: sh.ssh('-Oexit', f'-oControlPath={self.path}', 'carthage-control-master')
+        except sh.ErrorReturnCode: pass
+
+
 def ssh_user_addr(machine):
     '''Returns a string like ``root@test.example.com`` from a model
     with *ip_address* of ``test.example.com`` and *ssh_login_user* of
@@ -309,6 +439,6 @@ def ssh_handle_jump_host(jump_host):
     except AttributeError:
         raise AttributeError(f'{jump_host!r} is not a valid jump host')
             
-__all__ = ('SshKey', 'ssh_agent', 'SshAgent', 'RsyncPath', 'rsync',
+__all__ = ('SshKey', 'ssh_agent', 'SshAgent', 'SshControlMaster', 'RsyncPath', 'rsync',
            'ssh_user_addr', 'ssh_handle_jump_host',
            )
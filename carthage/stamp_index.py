@@ -0,0 +1,179 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+'''
+An index of setup task completion stamps.
+
+By default each completion stamp is a ``.stamp-*`` file in an object's :meth:`~carthage.setup_tasks.PathMixin.stamp_path`; checking whether a task needs to run costs a *stat* and a read per task.  When *tasks.stamp_backend* is ``sqlite``, stamps are instead kept in a single SQLite database in *cache_dir*.  All the stamps for a *stamp_path* are loaded with one query the first time any of them is checked.
+
+Existing stamp files can be imported with :meth:`StampIndex.import_stamp_files` or with the ``import_stamps`` runner command.
+
+'''
+
+from __future__ import annotations
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+__all__ = ['StampIndex', 'stamp_index_for']
+
+logger = logging.getLogger('carthage.stamp_index')
+
+#: The name of the stamp database within *cache_dir*
+database_name = 'stamps.sqlite'
+
+
+class StampIndex:
+
+    '''
+    Completion stamps for every *stamp_path* under one cache directory.  Each stamp records the time it was created and the hash contents of the task.
+
+    Stamps are cached in memory one *stamp_path* at a time; changes made through the index update the cache as well as the database.  When another process commits changes to the database, the cache is dropped at the next :meth:`refresh`.  Use :func:`stamp_index_for` rather than constructing directly so that all objects share one connection.
+
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.connection.execute('pragma synchronous=normal')
+        self.connection.execute('''create table if not exists stamps (
+        dir text not null,
+        stamp text not null,
+        mtime real not null,
+        contents text not null,
+        primary key(dir, stamp))''')
+        self._lock = threading.Lock()
+        #: Maps a stamp directory to a dict of stamp: (mtime, contents)
+        self._loaded = {}
+        self._data_version = self._current_data_version()
+
+    def _current_data_version(self):
+        # Changes whenever another connection commits to the database
+        with self._lock:
+            return self.connection.execute('pragma data_version').fetchone()[0]
+
+    def refresh(self):
+        '''Drop the cache if another process has committed changes to the database since the last refresh.  Called once per :meth:`~carthage.setup_tasks.SetupTaskMixin.run_setup_tasks` rather than for every stamp checked.
+        '''
+        data_version = self._current_data_version()
+        if data_version != self._data_version:
+            self._loaded.clear()
+            self._data_version = data_version
+
+    def _stamps(self, stamp_path):
+        stamp_path = os.path.abspath(stamp_path)
+        try: return self._loaded[stamp_path]
+        except KeyError: pass
+        with self._lock:
+            rows = self.connection.execute(
+                'select stamp, mtime, contents from stamps where dir = ?', (stamp_path,)).fetchall()
+        result = {stamp: (mtime, contents) for stamp, mtime, contents in rows}
+        self._loaded[stamp_path] = result
+        return result
+
+    def check_stamp(self, stamp_path, stamp):
+        '''
+        :returns: a tuple of the time *stamp* was created and its contents; the first element is False if the stamp does not exist.  The same contract as :meth:`~carthage.setup_tasks.SetupTaskMixin.check_stamp`.
+        '''
+        return self._stamps(stamp_path).get(stamp, (False, ""))
+
+    def create_stamp(self, stamp_path, stamp, contents, mtime=None):
+        if mtime is None: mtime = time.time()
+        contents = contents or ""
+        with self._lock:
+            self.connection.execute(
+                'insert or replace into stamps(dir, stamp, mtime, contents) values (?,?,?,?)',
+                (os.path.abspath(stamp_path), stamp, mtime, contents))
+        self._stamps(stamp_path)[stamp] = (mtime, contents)
+
+    def delete_stamp(self, stamp_path, stamp):
+        with self._lock:
+            self.connection.execute(
+                'delete from stamps where dir = ? and stamp = ?', (os.path.abspath(stamp_path), stamp))
+        self._stamps(stamp_path).pop(stamp, None)
+
+    def clear(self, stamp_path):
+        '''Remove all stamps for *stamp_path* and any directory below it.
+        '''
+        stamp_path = os.path.abspath(stamp_path)
+        prefix = stamp_path + '/'
+        with self._lock:
+            self.connection.execute(
+                'delete from stamps where dir = ? or substr(dir, 1, ?) = ?',
+                (stamp_path, len(prefix), prefix))
+        for d in list(self._loaded):
+            if d == stamp_path or d.startswith(prefix):
+                del self._loaded[d]
+
+    def import_stamp_files(self, root, remove=False):
+        '''
+        Import ``.stamp-*`` files found anywhere under *root*, keeping their modification times.  Stamps already in the index are replaced.
+
+        :param remove: If True, remove each stamp file once imported.
+
+        :returns: The number of stamps imported.
+        '''
+        rows = []
+        for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+            for f in filenames:
+                if not f.startswith('.stamp-'): continue
+                path = Path(dirpath) / f
+                try:
+                    mtime = path.stat().st_mtime
+                    contents = path.read_text()
+                except (FileNotFoundError, UnicodeDecodeError):
+                    logger.warning('Unable to import stamp %s', path)
+                    continue
+                rows.append((dirpath, f[len('.stamp-'):], mtime, contents))
+        with self._lock:
+            self.connection.execute('begin')
+            try:
+                self.connection.executemany(
+                    'insert or replace into stamps(dir, stamp, mtime, contents) values (?,?,?,?)',
+                    rows)
+                self.connection.execute('commit')
+            except BaseException:
+                self.connection.execute('rollback')
+                raise
+        self._loaded.clear()
+        if remove:
+            for dirpath, stamp, *rest in rows:
+                try: os.unlink(os.path.join(dirpath, '.stamp-' + stamp))
+                except FileNotFoundError: pass
+        return len(rows)
+
+    def close(self):
+        if _indexes.get(str(self.path)) is self:
+            del _indexes[str(self.path)]
+        self.connection.close()
+        self._loaded.clear()
+
+
+_indexes: dict[str, StampIndex] = {}
+
+
+def stamp_index_for(config_layout):
+    '''
+    :returns: The shared :class:`StampIndex` for *config_layout*, or None if *tasks.stamp_backend* is ``files``.
+    '''
+    backend = config_layout.tasks.stamp_backend
+    if backend == 'files':
+        return None
+    if backend != 'sqlite':
+        raise ValueError(f'Unknown stamp backend {backend}')
+    path = str(Path(config_layout.cache_dir) / database_name)
+    try: return _indexes[path]
+    except KeyError: pass
+    index = StampIndex(path)
+    _indexes[path] = index
+    return index
+
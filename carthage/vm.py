@@ -11,7 +11,6 @@ import json
 import logging
 import os
 import os.path
-import shutil
 import types
 import uuid
 import xml.etree.ElementTree
@@ -246,10 +245,7 @@ class Vm(Machine, SetupTaskMixin):
             except FileNotFoundError:
                 pass
         if self.config_layout.delete_volumes:
-            try:
-                shutil.rmtree(self.stamp_path)
-            except FileNotFoundError:
-                pass
+            self.forget_stamps()
         if self.volume:
             self.volume.close()
         self.injector.close(canceled_futures=canceled_futures)
@@ -387,10 +383,7 @@ class Vm(Machine, SetupTaskMixin):
         if self.volume:
             await self.volume.delete()
 
-        try:
-            shutil.rmtree(self.stamp_path)
-        except Exception: pass
-        del self.stamp_path
+        self.forget_stamps()
 
     @memoproperty
     def virtiofs_mounts(self):
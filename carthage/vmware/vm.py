@@ -33,6 +33,8 @@ class VmwareVmConfig(ConfigSchema, prefix="vmware"):
     datacenter: str
     folder: str = "carthage"
     cluster: str
+    #: When deploying in dependency order, the maximum number of VMs created at once per vSphere connection; 0 for no limit
+    max_concurrent_clones: int = 4
 
 
 class HardwareConfig(ConfigSchema, prefix="vmware.hardware"):
@@ -149,6 +151,11 @@ class Vm(VmwareSpecifiedObject, Machine):
                 return True
         return super().satisfies_injection_key(k)
 
+    async def deployment_limit(self):
+        '''Limit concurrent clones per vSphere connection; see *vmware.max_concurrent_clones*.
+        '''
+        return carthage.deployment.resource_limit(self.connection, self.config_layout.vmware.max_concurrent_clones)
+
     async def delete(self):
         try:
             task = self.mob.PowerOffVM_Task()
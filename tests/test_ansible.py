@@ -21,8 +21,7 @@ state_dir = os.path.join(os.path.dirname(__file__), "test_state")
 
 
 @pytest.fixture()
-@async_test
-async def configured_ainjector(ainjector):
+def configured_ainjector(ainjector):
     config = ainjector.injector(carthage.ConfigLayout)
     config.state_dir = state_dir
     ainjector.add_provider(carthage.ssh.SshKey)
@@ -81,3 +80,207 @@ async def test_inventory(configured_ainjector):
     for g in layout.m1.ansible_groups:
         assert 'm1.example.com' in inventory.inventory[g]['hosts']
         assert inventory.inventory['all']['hosts']['m1.example.com']['foo'] == 90
+
+
+@async_test
+async def test_inventory_plugin_order(configured_ainjector):
+    ainjector = configured_ainjector
+    import asyncio
+
+    running = 0
+    max_running = 0
+
+    class SlowPlugin(carthage.ansible.AnsibleHostPlugin):
+        name = 'slow'
+        async def host_vars(self, m):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            try:
+                await asyncio.sleep(0.05)
+            finally:
+                running -= 1
+            return dict(foo='slow', slow=True)
+
+    class FastPlugin(carthage.ansible.AnsibleHostPlugin):
+        name = 'fast'
+        async def host_vars(self, m):
+            return dict(foo='fast')
+
+    class Layout(ModelGroup):
+
+        add_provider(machine_implementation_key, dependency_quote(machine_mock.Machine))
+        domain = "example.com"
+        # Higher priority plugins are merged first, so fast wins even though it finishes first
+        add_provider(InjectionKey(carthage.ansible.AnsibleHostPlugin, name='slow', priority=200), SlowPlugin)
+        add_provider(InjectionKey(carthage.ansible.AnsibleHostPlugin, name='fast', priority=50), FastPlugin)
+
+        class m1(MachineModel): pass
+
+        class m2(MachineModel): pass
+
+    layout = await ainjector(Layout)
+    ainjector = layout.injector.get_instance(AsyncInjector)
+    inventory = await ainjector(carthage.ansible.AnsibleInventory, os.path.join(state_dir, "inventory.yml"))
+    hosts = inventory.inventory['all']['hosts']
+    assert list(hosts) == ['m1.example.com', 'm2.example.com']
+    for h in hosts.values():
+        assert h['foo'] == 'fast'
+        assert h['slow'] is True
+    # Both machines' slow calls ran concurrently
+    assert max_running == 2
+    assert 'slow' in inventory.plugin_timings
+
+
+@async_test
+async def test_inventory_writes(configured_ainjector):
+    ainjector = configured_ainjector
+
+    class Layout(ModelGroup):
+
+        add_provider(machine_implementation_key, dependency_quote(machine_mock.Machine))
+        domain = "example.com"
+
+        class m1(MachineModel):
+            ansible_vars = dict(foo=1)
+
+        class m2(MachineModel):
+            ansible_vars = dict(foo=2)
+
+    layout = await ainjector(Layout)
+    ainjector = layout.injector.get_instance(AsyncInjector)
+    destination = os.path.join(state_dir, "inventory_writes", "hosts.yml")
+    inventory = await ainjector(carthage.ansible.AnsibleInventory, destination)
+    # Unchanged contents are not rewritten
+    assert not await inventory.write_inventory(destination, inventory.inventory)
+    config = ainjector.injector(carthage.ConfigLayout)
+    config.ansible.inventory_host_vars = True
+    try:
+        assert await inventory.write_inventory(destination, inventory.inventory)
+        host_vars = os.path.join(state_dir, "inventory_writes", "host_vars")
+        assert sorted(os.listdir(host_vars)) == ['m1.example.com.yml', 'm2.example.com.yml']
+        m2_mtime = os.stat(os.path.join(host_vars, 'm2.example.com.yml')).st_mtime_ns
+        assert not await inventory.write_inventory(destination, inventory.inventory)
+        inventory.inventory['all']['hosts']['m1.example.com']['foo'] = 10
+        assert await inventory.write_inventory(destination, inventory.inventory)
+        assert os.stat(os.path.join(host_vars, 'm2.example.com.yml')).st_mtime_ns == m2_mtime
+        del inventory.inventory['all']['hosts']['m2.example.com']
+        await inventory.write_inventory(destination, inventory.inventory)
+        assert os.listdir(host_vars) == ['m1.example.com.yml']
+    finally:
+        config.ansible.inventory_host_vars = False
+    # Host variables are back in hosts.yml, so host_vars would be stale
+    assert await inventory.write_inventory(destination, inventory.inventory)
+    assert not os.path.exists(host_vars)
+
+
+@async_test
+async def test_inventory_writes_remote(configured_ainjector):
+    import types
+    from carthage.ssh import RsyncPath
+    ainjector = configured_ainjector
+
+    class Layout(ModelGroup):
+
+        add_provider(machine_implementation_key, dependency_quote(machine_mock.Machine))
+        domain = "example.com"
+
+        class m1(MachineModel):
+            ansible_vars = dict(foo=1)
+
+    rsyncs = []
+
+    class FakeKey:
+        async def rsync(self, *args):
+            rsyncs.append([str(a) for a in args])
+
+    layout = await ainjector(Layout)
+    layout.injector.replace_provider(InjectionKey(carthage.ssh.SshKey), dependency_quote(FakeKey()))
+    ainjector = layout.injector.get_instance(AsyncInjector)
+    inventory = await ainjector(carthage.ansible.AnsibleInventory, os.path.join(state_dir, "inventory_writes", "hosts.yml"))
+    remote = types.SimpleNamespace(ip_address='remote.example.com', ssh_login_user='root')
+    destination = RsyncPath(remote, '/srv/ansible/hosts.yml')
+    await inventory.write_inventory(destination, inventory.inventory)
+    # Unchanged inventories are still transferred, since the remote copy may have changed
+    rsyncs.clear()
+    await inventory.write_inventory(destination, inventory.inventory)
+    assert len(rsyncs) == 2
+    assert rsyncs[0][-1] == 'root@remote.example.com:/srv/ansible/hosts.yml'
+    # host_vars is synchronized empty so no stale host variables remain
+    assert rsyncs[1][:2] == ['-rt', '--delete']
+    assert rsyncs[1][-1] == 'root@remote.example.com:/srv/ansible/host_vars/'
+    assert os.listdir(rsyncs[1][2]) == []
+
+
+def ansible_json(*hosts, failed=()):
+    # Output of the ansible json callback for one task run on *hosts*
+    return dict(
+        plays=[dict(play=dict(name='play'), tasks=[dict(
+            task=dict(name='task', duration=dict(start='', end='')),
+            hosts={h: dict(changed=False, failed=h in failed) for h in hosts})])],
+        stats={h: dict(ok=1, changed=0, unreachable=0, failures=int(h in failed)) for h in hosts})
+
+
+@async_test
+async def test_ansible_batch(configured_ainjector):
+    import asyncio
+    from carthage.ansible import AnsibleResult, _run_batched
+    result = AnsibleResult(ansible_json('a', 'b', failed=['b']))
+    assert not result.success
+    assert result.for_host('a').success
+    assert result.for_host('a').tasks['task'].failed is False
+    assert not result.for_host('b').success
+    # A host no play matched has an empty, successful result
+    missing = result.for_host('c')
+    assert missing.success
+    assert missing.host_stats == {}
+    assert missing.tasks == {}
+    runs = []
+    async def run(ainjector, hosts, batch_args):
+        assert ainjector.injector is configured_ainjector.injector
+        runs.append((list(hosts), batch_args))
+        return AnsibleResult(ansible_json(*(h.name for h in hosts)))
+    class Host:
+        def __init__(self, name): self.name = name
+    config = configured_ainjector.injector(carthage.ConfigLayout)
+    config.ansible.batch_window = 0.05
+    try:
+        hosts = [Host(n) for n in ('a', 'b', 'c')]
+        results = await asyncio.gather(*(
+            _run_batched(configured_ainjector.injector, ('test',), h, run) for h in hosts))
+    finally:
+        config.ansible.batch_window = 0.0
+    assert len(runs) == 1
+    assert runs[0] == (hosts, ['-f', '3'])
+    assert [list(r.host_stats) for r in results] == [['a'], ['b'], ['c']]
+
+
+@async_test
+async def test_ansible_batch_key(configured_ainjector):
+    from carthage.ansible import _batch_key
+    ainjector = configured_ainjector
+
+    class Layout(ModelGroup):
+
+        add_provider(machine_implementation_key, dependency_quote(carthage.LocalMachine))
+        domain = "example.com"
+
+        class m1(MachineModel): pass
+
+        class m2(MachineModel): pass
+
+    layout = await ainjector(Layout)
+    config = ainjector.injector(carthage.ConfigLayout)
+    config.ansible.batch_window = 0.05
+    try:
+        m1 = await layout.ainjector.get_instance_async(InjectionKey(carthage.Machine, host='m1.example.com'))
+        m2 = await layout.ainjector.get_instance_async(InjectionKey(carthage.Machine, host='m2.example.com'))
+        batch_injector, key = await _batch_key(m1.ainjector, m1, 'playbook', origin=None, extra_args=['-ex=1'])
+        # Both machines resolve ansible dependencies through the layout, so share a batch
+        assert (batch_injector, key) == await _batch_key(
+            m2.ainjector, m2, 'playbook', origin=None, extra_args=['-ex=1'])
+        assert batch_injector is layout.injector
+        assert key != (await _batch_key(m1.ainjector, m1, 'playbook', origin=None, extra_args=['-ex=2']))[1]
+        assert await _batch_key(m1.ainjector, m1, 'playbook', origin=m2, extra_args=['-ex=1']) is None
+    finally:
+        config.ansible.batch_window = 0.0
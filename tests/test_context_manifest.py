@@ -0,0 +1,54 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import os
+from carthage.context_manifest import ContextManifest
+
+
+def test_context_manifest_sync(tmp_path):
+    source = tmp_path/'source'
+    dest = tmp_path/'dest'
+    (source/'deep/deeper').mkdir(parents=True)
+    (source/'Containerfile').write_text('FROM debian\n')
+    (source/'deep/deeper/file').write_text('one')
+    (source/'deep/gone').write_text('gone')
+    os.symlink('deeper/file', source/'deep/link')
+    manifest = ContextManifest(tmp_path/'manifest.json', source)
+    scan = manifest.sync(dest)
+    assert (dest/'deep/deeper/file').read_text() == 'one'
+    assert os.readlink(dest/'deep/link') == 'deeper/file'
+    digest = scan.digest
+    (dest/'.stamp-task').write_text('')
+    # A fresh manifest loads the saved state and finds nothing changed
+    manifest = ContextManifest(tmp_path/'manifest.json', source)
+    scan = manifest.scan()
+    assert not scan.modified
+    assert scan.digest == digest
+    # Touching a file without changing it is not a change
+    os.utime(source/'Containerfile', ns=(0, 0))
+    assert not manifest.scan().modified
+    (source/'deep/deeper/file').write_text('two')
+    (source/'deep/gone').unlink()
+    scan = manifest.scan()
+    assert scan.changed == ['deep/deeper/file']
+    assert scan.removed == ['deep/gone']
+    assert scan.digest != digest
+    # A copy modified in the destination is copied again
+    (dest/'Containerfile').write_text('FROM modified\n')
+    # Entries that were never part of the source are removed
+    (dest/'extra').write_text('extra')
+    (dest/'deep/extra-dir').mkdir()
+    (dest/'deep/extra-dir/file').write_text('extra')
+    manifest.sync(dest)
+    assert not (dest/'extra').exists()
+    assert not (dest/'deep/extra-dir').exists()
+    assert (dest/'deep/deeper/file').read_text() == 'two'
+    assert (dest/'Containerfile').read_text() == 'FROM debian\n'
+    assert not (dest/'deep/gone').exists()
+    assert (dest/'.stamp-task').exists()
+    assert not manifest.scan().modified
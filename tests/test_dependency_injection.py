@@ -9,6 +9,7 @@
 from carthage import dependency_injection
 from carthage.dependency_injection import *
 from carthage.dependency_injection.introspection import *
+from carthage.dependency_injection import is_obj_ready
 from carthage.utils import when_needed
 from carthage.pytest import async_test
 from carthage_test_utils import Trigger
@@ -703,3 +704,108 @@ async def test_deferred_injections(ainjector):
     assert defer_me_instantiated == 1
     assert res3.dependency.value is ainjector.get_instance(DeferMe)
     
+
+def test_resolution_cache_invalidation(injector):
+    key = InjectionKey('cached')
+    middle = injector(Injector)
+    leaf = middle(Injector)
+    with pytest.raises(KeyError):
+        leaf.get_instance(key)
+    injector.add_provider(key, 1)
+    assert leaf.get_instance(key) == 1
+    middle.add_provider(key, 2)
+    assert leaf.get_instance(key) == 2
+    middle.replace_provider(key, 3)
+    assert leaf.get_instance(key) == 3
+    middle.close()
+    with pytest.raises(KeyError):
+        leaf.get_instance(key)
+
+def test_resolution_cache_scoped(injector):
+    key = InjectionKey('scoped')
+    injector.add_provider(key, 1)
+    leaf = injector(Injector)
+    sibling = injector(Injector)
+    assert leaf.get_instance(key) == 1
+    entry = leaf._resolution_cache[key]
+    sibling.add_provider(InjectionKey('sibling'), 2)
+    generation = injector._generation
+    injector.add_provider(key, injector._get(key))
+    assert injector._generation == generation
+    assert leaf.get_instance(key) == 1
+    assert leaf._resolution_cache[key] is entry
+    # Changes to an ancestor reach cached entries deeper in the tree
+    deep = leaf(Injector)
+    assert deep.get_instance(key) == 1
+    injector.replace_provider(key, 3)
+    assert deep.get_instance(key) == 3
+    leaf.add_provider(key, 4)
+    assert deep.get_instance(key) == 4
+
+def test_filter_indexed(injector):
+    class Plugin(Injectable): pass
+    sub = injector(Injector)
+    injector.add_provider(InjectionKey(Plugin, name='a'), 1)
+    injector.add_provider(InjectionKey(Plugin, name='b', kind='x'), 2)
+    assert sub.filter(Plugin, ['name']) == [
+        InjectionKey(Plugin, name='a'), InjectionKey(Plugin, name='b', kind='x')]
+    assert sub.filter(Plugin, ['name', 'kind']) == [InjectionKey(Plugin, name='b', kind='x')]
+    sub.add_provider(InjectionKey(Plugin, name='c'), 3)
+    assert sub.filter(Plugin, ['name'])[-1] == InjectionKey(Plugin, name='c')
+    assert sub.filter(Plugin, ['name'], stop_at=sub) == [InjectionKey(Plugin, name='c')]
+    assert sub.filter(Plugin, lambda k: k.constraints.get('name') == 'b') == [
+        InjectionKey(Plugin, name='b', kind='x')]
+
+def test_filter_cache_scoped(injector):
+    class Plugin(Injectable): pass
+    injector.add_provider(InjectionKey(Plugin, name='a'), 1)
+    leaf = injector(Injector)
+    sibling = injector(Injector)
+    result = leaf._filter_constraints(Plugin, ('name',), None)
+    sibling.add_provider(InjectionKey(Plugin, name='b'), 2)
+    assert leaf._filter_constraints(Plugin, ('name',), None) is result
+    injector.add_provider(InjectionKey(Plugin, name='c'), 3)
+    assert leaf.filter(Plugin, ['name']) == [
+        InjectionKey(Plugin, name='a'), InjectionKey(Plugin, name='c')]
+
+def test_injection_key_interning():
+    class Machine: pass
+    k1 = InjectionKey(Machine, host='web01')
+    assert InjectionKey(Machine, host='web01') is k1
+    assert InjectionKey(Machine, host='web01', _ready=False) is not k1
+    assert InjectionKey(Machine, host='web01', _ready=False) == k1
+    assert InjectionKey('n', value=1) is not InjectionKey('n', value=True)
+    assert hash(k1) == hash(InjectionKey(Machine, host='web01', _optional=True))
+    assert k1.host == 'web01'
+    with pytest.raises(TypeError):
+        k1.host = 'web02'
+
+def test_injection_plan_invalidated(injector):
+    injector.add_provider(InjectionKey('first'), 1)
+    injector.add_provider(InjectionKey('second'), 2)
+
+    @inject_autokwargs(first=InjectionKey('first'))
+    class Planned(Injectable): pass
+    assert injector(Planned).first == 1
+    inject_autokwargs(second=InjectionKey('second'))(Planned)
+    planned = injector(Planned)
+    assert (planned.first, planned.second) == (1, 2)
+
+    class SubPlanned(Planned): pass
+    inject(second=None)(SubPlanned)
+    assert not hasattr(injector(SubPlanned), 'second')
+    assert injector(Planned).second == 2
+
+def test_final_provider_fast_path(injector):
+    class NotReady(AsyncInjectable):
+        async def async_ready(self):
+            return await super().async_ready()
+    with instantiation_not_ready():
+        obj = injector(NotReady)
+    assert not is_obj_ready(obj)
+    injector.add_provider(obj)
+    injector.add_provider(InjectionKey('quoted'), dependency_quote(NotReady))
+    assert injector.get_instance(InjectionKey(NotReady, _ready=False)) is obj
+    with pytest.raises(AsyncRequired):
+        injector.get_instance(InjectionKey(NotReady, _ready=True))
+    assert injector.get_instance(InjectionKey('quoted')) is NotReady
@@ -6,6 +6,7 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
 
+import asyncio
 import pytest
 
 from carthage import *
@@ -250,6 +251,116 @@ async def test_deploy_destroy(ainjector):
         if d in successes: continue
         assert await d.find()
         
+@async_test
+async def test_destroy_concurrency(ainjector):
+    deleting = 0
+    max_deleting = 0
+    class Concurrent(MockDeployable):
+        async def delete(self):
+            nonlocal deleting, max_deleting
+            deleting += 1
+            max_deleting = max(deleting, max_deleting)
+            await asyncio.sleep(0.01)
+            deleting -= 1
+            await super().delete()
+
+    class layout(CarthageLayout):
+        class base(Concurrent):
+            name = 'base'
+        for i in range(4):
+            @inject_autokwargs(base=InjectionKey('base'))
+            class leaf(Concurrent):
+                name = f'leaf{i}'
+            del leaf
+
+    ainjector.add_provider(layout)
+    l = await ainjector.get_instance_async(layout)
+    result = await l.ainjector(run_deployment)
+    assert result.is_successful()
+    result = await l.ainjector(run_deployment_destroy, max_concurrency=2)
+    assert len(result.successes) == 5
+    assert max_deleting == 2
+    assert result.successes[-1] == l.base
+    assert set(result.level_timings) == {0, 1}
+    assert not deployed_deployables
+
+@async_test
+async def test_destroy_reports_all_failures(ainjector):
+    "A dependency failure lists every reverse dependency that failed to delete"
+    class FailingDelete(MockDeployable):
+        delay = 0
+        async def delete(self):
+            await asyncio.sleep(self.delay)
+            raise RuntimeError(f'{self.name} cannot be deleted')
+
+    class layout(CarthageLayout):
+        class base(MockDeployable):
+            name = 'base'
+        @inject_autokwargs(base=InjectionKey('base'))
+        class fast(FailingDelete):
+            name = 'fast'
+        @inject_autokwargs(base=InjectionKey('base'))
+        class slow(FailingDelete):
+            name = 'slow'
+            delay = 0.05
+
+    ainjector.add_provider(layout)
+    l = await ainjector.get_instance_async(layout)
+    result = await l.ainjector(run_deployment)
+    assert result.is_successful()
+    result = await l.ainjector(run_deployment_destroy)
+    assert len(result.failures) == 2
+    failure, = result.dependency_failures
+    assert failure.deployable == l.base
+    assert set(failure.depended_deployables) == {l.fast, l.slow}
+
+@async_test
+async def test_deploy_dependency_order(ainjector):
+    created = []
+    class Ordered(MockDeployable):
+        async def do_create(self):
+            created.append(self.name)
+            await super().do_create()
+
+    class layout(CarthageLayout):
+        class base(Ordered):
+            name = 'base'
+        @inject_autokwargs(base=InjectionKey('base'))
+        class middle(Ordered):
+            name = 'middle'
+        @inject_autokwargs(middle=InjectionKey('middle'))
+        class top(Ordered):
+            name = 'top'
+        class broken(Ordered):
+            name = 'broken'
+            async def do_create(self):
+                raise RuntimeError('broken')
+        @inject_autokwargs(broken=InjectionKey('broken'))
+        class needs_broken(Ordered):
+            name = 'needs_broken'
+
+    ainjector.add_provider(layout)
+    l = await ainjector.get_instance_async(layout)
+    result = await l.ainjector(run_deployment, dependency_order=True, max_concurrency=2)
+    assert created.index('base') < created.index('middle') < created.index('top')
+    assert 'needs_broken' not in created
+    assert l.broken in result.failures
+    assert l.needs_broken in result.dependency_failures
+    assert len(result.successes) == 3
+    assert set(result.level_timings) == {0, 1, 2}
+
+def test_resource_limit():
+    class Resource: pass
+    resource = Resource()
+    assert resource_limit(resource, 0) is None
+    with deployment_pass():
+        limit = resource_limit(resource, 2)
+        assert resource_limit(resource, 2) is limit
+        assert resource_limit(resource, 3) is not limit
+        assert not hasattr(resource, '_deployment_limit')
+    with deployment_pass():
+        assert resource_limit(resource, 2) is not limit
+
 @async_test
 async def test_find_orphans(ainjector):
     class layout(CarthageLayout):
@@ -298,6 +409,68 @@ async def test_find_orphans(ainjector):
     assert len(orphans) == 1
     assert orphan in orphans
     
+@async_test
+async def test_find_orphans_concurrent(ainjector):
+    probing = 0
+    max_probing = 0
+    class Probed(MockDeployable):
+        async def find(self):
+            nonlocal probing, max_probing
+            probing += 1
+            max_probing = max(max_probing, probing)
+            try:
+                await asyncio.sleep(0)
+                return await super().find()
+            finally:
+                probing -= 1
+
+    class layout(CarthageLayout):
+        class one(Probed):
+            name = 'one'
+        class two(Probed):
+            name = 'two'
+
+    ainjector.add_provider(layout)
+    l = await ainjector.get_instance_async(layout)
+    lainjector = l.ainjector
+    await lainjector(run_deployment)
+    orphans = [await lainjector(Probed, name=f'orphan{i}') for i in range(4)]
+    max_probing = 0
+    finder_timings = {}
+    found = await lainjector(find_orphan_deployables, max_concurrency=2, finder_timings=finder_timings)
+    assert set(found) == set(orphans)
+    assert 'mock' in finder_timings
+    assert max_probing == 2
+
+@async_test
+async def test_deployment_pass(ainjector):
+    passes = []
+    class layout(CarthageLayout):
+
+        class one(MockDeployable):
+            name = 'one'
+
+            async def find(self):
+                passes.append(current_deployment_pass())
+                return await super().find()
+
+        class two(one):
+            name = 'two'
+
+    ainjector.add_provider(layout)
+    l = await ainjector.get_instance_async(layout)
+    assert current_deployment_pass() is None
+    await l.ainjector(run_deployment)
+    assert passes and passes[0] is not None
+    assert all(p is passes[0] for p in passes)
+    first_pass = passes[0]
+    passes.clear()
+    with deployment_pass() as outer:
+        await l.ainjector(run_deployment_destroy)
+    assert passes and all(p is outer for p in passes)
+    assert outer is not first_pass
+    assert current_deployment_pass() is None
+
 @pytest.mark.parametrize(
     'input,result',
     [(r'foo?', r'foo.'),
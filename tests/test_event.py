@@ -70,3 +70,39 @@ def test_multiple_scope_breaks(loop):
     key = InjectionKey("event")
     injector3.add_event_listener(key, "foo", callback)
     injector2.add_event_listener(key, "foo", callback)
+
+
+@async_test
+async def test_event_listener_index(loop):
+    injector = base_injector(Injector).claim("injector")
+    injector2 = injector(Injector).claim("injector2")
+    injector3 = injector2(Injector).claim("injector3")
+    key = InjectionKey("indexed")
+    # Nothing is listening, so emits return an already completed future
+    f1 = injector3.emit_event(key, "foo", injector3)
+    f2 = injector3.emit_event(InjectionKey("other"), "bar", injector3)
+    assert f1.done() and f2.done()
+    f1.result().append('changed')
+    assert await f2 == []
+    calls = []
+
+    def callback(*args, key, **kwargs):
+        calls.append((key, args))
+        return len(calls)
+
+    async def async_callback(*args, **kwargs):
+        calls.append('async')
+        return 'async'
+    injector.add_event_listener(key, "foo", callback)
+    injector2.add_event_listener(key, "foo", async_callback)
+    assert await injector3.emit_event(key, "foo", injector3, 1) == [1, 'async']
+    assert calls == [(key, (1,)), 'async']
+    # Removing a listener is seen by scopes below it
+    injector2.remove_event_listener(key, async_callback)
+    calls.clear()
+    await injector3.emit_event(key, "foo", injector3)
+    assert calls == [(key, ())]
+    injector.remove_event_listener(key, callback)
+    f3 = injector3.emit_event(key, "foo", injector3)
+    assert f3.done()
+    assert await f3 == []
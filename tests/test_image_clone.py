@@ -0,0 +1,40 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import gzip
+import os
+from carthage import image_clone
+
+
+def test_decompress_sparse(tmp_path):
+    block = 64*1024
+    data = b'\1' * 1000 + bytes(10*block) + b'\2' * block + bytes(3*block + 17)
+    source = tmp_path/'base.raw.gz'
+    with gzip.open(source, 'wb') as f:
+        f.write(data)
+    destination = tmp_path/'image.raw'
+    assert image_clone.decompress_sparse(source, destination, block_size=block, read_size=4*block) == len(data)
+    assert destination.read_bytes() == data
+    # Zero blocks are holes
+    assert destination.stat().st_blocks*512 < len(data)
+
+
+def test_clone_file(tmp_path):
+    source = tmp_path/'base.raw'
+    source.write_bytes(os.urandom(8192))
+    os.chmod(source, 0o640)
+    destination = tmp_path/'image.raw'
+    supported = image_clone.reflink_supported(tmp_path)
+    # The probe is cached per filesystem
+    assert os.stat(tmp_path).st_dev in image_clone._reflink_support
+    if image_clone.clone_file(source, destination):
+        assert supported
+        assert destination.read_bytes() == source.read_bytes()
+        assert destination.stat().st_mode == source.stat().st_mode
+    else:
+        assert not destination.exists()
@@ -5,8 +5,10 @@
 # WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
+import contextvars
 import dataclasses
 import os
+import threading
 import shutil
 import pytest
 from pathlib import Path
@@ -161,6 +163,8 @@ async def test_dump_load(ainjector):
     o3 = AssignedObj(1,6)
     o4 = AssignedObj(3,5)
     objs = [o1, o2, o3, o4]
+    # Pin the initial placement; greedy hashing can strand o4
+    for o, h in zip(objs, (5, 6, 4, 3)): o.hash = h
     assignments = await ainjector(TestAssignments, objs)
     assignments.do_assignments()
     kvstore = ainjector.get_instance(KvStore)
@@ -205,3 +209,100 @@ async def test_network_pool(ainjector):
         assert v4_pool.valid_key(v4_pool.link_key(l))
         
     
+
+@async_test
+async def test_transaction(ainjector):
+    kvstore = ainjector.get_instance(KvStore)
+    domain = kvstore.domain('test_transaction', False)
+    with kvstore.transaction():
+        domain.put('a', '1')
+        assert domain.get('a') == '1'
+        with kvstore.transaction():
+            domain.put('b', '2')
+        domain.delete('a')
+    assert domain.get('a') is None
+    assert domain.get('b') == '2'
+    with pytest.raises(KvConsistency):
+        with kvstore.transaction():
+            domain.put('c', '3')
+            domain.put('b', '4')
+    assert domain.get('c') is None
+    assert domain.get('b') == '2'
+
+@async_test
+async def test_transaction_not_shared(ainjector):
+    "Threads started within a transaction do not join it"
+    kvstore = ainjector.get_instance(KvStore)
+    domain = kvstore.domain('test_transaction_not_shared', False)
+    seen = []
+    with kvstore.transaction():
+        domain.put('a', '1')
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(lambda: seen.append(domain.get('a')),))
+        thread.start()
+        thread.join()
+    assert seen == [None]
+    assert domain.get('a') == '1'
+
+@async_test
+async def test_free_space_index_order(ainjector):
+    "Collisions take the nearest free assignment in hash-nearest order, also for a fresh index"
+    objs = [AssignedObj(1, 9) for i in range(9)]
+    for o in objs: o.hash = 5
+    assignments = await ainjector(TestAssignments, objs[:4])
+    assignments.do_assignments()
+    assert [o.assignment for o in objs[:4]] == [5, 6, 4, 7]
+    assignments2 = await ainjector(TestAssignments, objs)
+    assignments2.enable_key_validation()
+    for o in objs[:4]:
+        o.assignment = None
+    assignments2.do_assignments()
+    assert [o.assignment for o in objs] == [5, 6, 4, 7, 3, 8, 2, 9, 1]
+    assignments2.check_consistency()
+
+@async_test
+async def test_free_space_index_moved(ainjector):
+    "An assignment held by a key that moved this round is as good as free"
+    a, b, c = [AssignedObj(1, 30) for i in range(3)]
+    a.hash, b.hash, c.hash = 5, 6, 5
+    assignments = await ainjector(TestAssignments, [a, b])
+    assignments.do_assignments()
+    assert (a.assignment, b.assignment) == (5, 6)
+    assignments._hints.delete(a.key)
+    a.hash = 20
+    assignments.objs = [a, b, c]
+    assignments.do_assignments()
+    assert (a.assignment, b.assignment, c.assignment) == (20, 6, 5)
+
+@async_test
+async def test_hash_versions(ainjector):
+    assert ordinal_sum_hash('web01|eth0') == ordinal_sum_hash('web10|eth0')
+    assert blake2_hash('web01|eth0') != blake2_hash('web10|eth0')
+    objs = [AssignedObj(0, 1000) for i in range(3)]
+    assignments = await ainjector(TestAssignments, objs)
+    assert assignments.active_hash_version == HashedRangeAssignments.hash_version
+    assignments.do_assignments()
+    # A domain with hints but no recorded version is legacy
+    assignments._meta.delete('hash_version')
+    legacy = await ainjector(TestAssignments, objs)
+    assert legacy.active_hash_version == 1
+    before = [o.assignment for o in objs]
+    legacy.migrate_hash_version()
+    assert legacy.active_hash_version == 2
+    legacy.do_assignments()
+    assert [o.assignment for o in objs] == before
+
+@async_test
+async def test_hash_version_dump_load(ainjector):
+    objs = [AssignedObj(0, 1000) for i in range(3)]
+    assignments = await ainjector(TestAssignments, objs)
+    assignments.do_assignments()
+    assert assignments.active_hash_version == 2
+    kvstore = ainjector.get_instance(KvStore)
+    kvstore.dump(state_dir/'dump.yml', lambda d, k, v: True)
+    with kvstore.environment.begin(write=True) as txn, txn.cursor() as csr:
+        csr.first()
+        while csr.delete(): pass
+    kvstore.load(state_dir/'dump.yml')
+    loaded = await ainjector(TestAssignments, objs)
+    assert loaded.active_hash_version == 2
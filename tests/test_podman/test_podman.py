@@ -5,10 +5,12 @@
 # WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
 # LICENSE for details.
+import asyncio
 import json
 import os
 import pytest
 import shutil
+import types
 from pathlib import Path
 from carthage.podman import *
 from carthage.oci import oci_container_image, OciExposedPort, OciMount
@@ -307,6 +309,25 @@ async def test_podman_image(ainjector):
     await l.DebianWithAuthorizedKeys.async_become_ready()
 
 
+@async_test
+async def test_podman_layer_cache(ainjector):
+    l = await ainjector(podman_layout)
+    ainjector = l.ainjector
+    config = await ainjector(ConfigLayout)
+    config.podman.layer_cache = True
+    try:
+        image = l.DebianWithAuthorizedKeys
+        await image.async_become_ready()
+        await image.build_image()
+        first = image.last_layer
+        # An identical build reuses the cached layer
+        await image.build_image()
+        assert image.last_layer == first
+        assert await image.find_cached_layer('no-such-key') is None
+    finally:
+        config.podman.layer_cache = False
+
+
 @async_test
 async def test_podman_mount(ainjector):
     l = await ainjector(podman_layout)
@@ -472,3 +493,106 @@ async def test_podman_volume(layout_fixture):
             logger.exception('deleting populated volume')
             
         
+
+@async_test
+async def test_podman_inventory(layout_fixture):
+    volume = layout_fixture.volume
+    await volume.async_become_ready()
+    container_host = volume.container_host
+    try:
+        # Outside a deployment pass there is no inventory
+        assert await container_host.inventory_inspect('volume', volume.name) is None
+        with carthage.deployment.deployment_pass():
+            assert await container_host.inventory_inspect('volume', volume.name)
+            assert await container_host.inventory_inspect('volume', 'carthage-no-such-volume') is False
+            assert await volume.find()
+            await volume.delete()
+            # Deleting invalidates the inventory
+            assert not await volume.find()
+    finally:
+        try: await volume.delete()
+        except Exception: pass
+
+
+@async_test
+async def test_pull_coordinator(loop):
+    from carthage.podman.container_host import PodmanContainerHost
+    commands = []
+    present = set()
+    class FakeHost(PodmanContainerHost):
+        async def podman(self, *args, _log=True):
+            commands.append(args)
+            await asyncio.sleep(0.05)
+            if args[:2] == ('image', 'exists') and args[2] not in present:
+                raise carthage.sh.ErrorReturnCode_1(' '.join(args), b'', b'')
+    ainjector = base_injector.claim('test_pull_coordinator')(AsyncInjector)
+    try:
+        host = await ainjector(FakeHost)
+        coordinator = host.pull_coordinator
+        credentials = ('user', 'password')
+        results = await asyncio.gather(*(
+            coordinator.pull('registry.example/debian', missing_only=True, credentials=credentials)
+            for i in range(10)))
+        assert results == [True]*10
+        assert commands.count(('pull', 'registry.example/debian')) == 1
+        await coordinator.pull('registry.example/other', credentials=credentials)
+        # The login is reused within its validity period
+        logins = [c for c in commands if c[0] == 'login']
+        assert logins == [('login', '-u', 'user', '-p', 'password', 'registry.example')]
+        # Other credentials for the registry log in again, after pulls using the current login
+        commands.clear()
+        await asyncio.gather(
+            coordinator.pull('registry.example/third', credentials=credentials),
+            coordinator.pull('registry.example/third', credentials=('other', 'secret')))
+        assert [c[0] for c in commands] == ['pull', 'login', 'pull']
+        # A forced pull does not join a check that finds the image present
+        commands.clear()
+        present.add('registry.example/debian')
+        results = await asyncio.gather(
+            coordinator.pull('registry.example/debian', missing_only=True),
+            coordinator.pull('registry.example/debian'))
+        assert results == [False, True]
+        assert ('pull', 'registry.example/debian') in commands
+    finally:
+        ainjector.close()
+
+
+@async_test
+async def test_import_volume_streaming(loop, tmp_path):
+    from carthage.podman.container_host import PodmanContainerHost
+    commands = []
+    class FakeHost(PodmanContainerHost):
+        fail_import = False
+        accept_anything = False
+        async def podman(self, *args, _log=True):
+            commands.append(args)
+        async def _import_stream(self, read_fd, compression, options):
+            if self.fail_import:
+                raise carthage.sh.ErrorReturnCode_1('podman image import', b'', b'')
+            if self.accept_anything:
+                while os.read(read_fd, 65536): pass
+                return types.SimpleNamespace(stdout=b'partial-image\n')
+            listing = await carthage.sh.tar('-tf', '-', _in=read_fd)
+            assert './etc/hostname' in str(listing).split()
+            return listing
+    volume_path = tmp_path/'volume'
+    (volume_path/'etc').mkdir(parents=True)
+    (volume_path/'etc/hostname').write_text('imported\n')
+    ainjector = base_injector.claim('test_import_volume_streaming')(AsyncInjector)
+    try:
+        host = await ainjector(FakeHost)
+        volume = types.SimpleNamespace(path=volume_path)
+        assert await host.import_volume(volume)
+        # A failing importer reaps tar rather than leaving it blocked on the pipe
+        host.fail_import = True
+        with pytest.raises(carthage.sh.ErrorReturnCode):
+            await asyncio.wait_for(host.import_volume(volume), 10)
+        # If tar fails, the image imported from its partial output is removed
+        host.fail_import = False
+        host.accept_anything = True
+        volume = types.SimpleNamespace(path=tmp_path/'missing')
+        with pytest.raises(carthage.sh.ErrorReturnCode):
+            await host.import_volume(volume)
+        assert commands == [('image', 'rm', 'partial-image')]
+    finally:
+        ainjector.close()
@@ -402,3 +402,93 @@ async def test_depend_on(ainjector):
     await ainjector(d)
     assert called == 1
     
+
+@async_test
+async def test_stamp_index(ainjector):
+    from carthage.stamp_index import StampIndex
+    config = ainjector.injector(carthage.ConfigLayout)
+    called = 0
+
+    class c(Stampable):
+        @setup_task("indexed stamp")
+        def indexed(self):
+            nonlocal called
+            called += 1
+
+    # A stamp file from before the index is imported
+    c.stamp_path.mkdir(parents=True)
+    c.stamp_path.joinpath('.stamp-imported').write_text('hash')
+    config.tasks.stamp_backend = 'sqlite'
+    o = await ainjector(c)
+    assert isinstance(o.stamp_index, StampIndex)
+    assert called == 1
+    assert o.check_stamp('indexed')[0]
+    assert not c.stamp_path.joinpath('.stamp-indexed').exists()
+    assert await ainjector(c) and called == 1
+    assert o.stamp_index.import_stamp_files(state_dir) == 1
+    assert o.check_stamp('imported')[1] == 'hash'
+    o.delete_stamp('indexed')
+    assert not o.check_stamp('indexed')[0]
+    o.stamp_index.close()
+
+@async_test
+async def test_stamp_index_forget(ainjector):
+    from carthage.stamp_index import StampIndex
+    config = ainjector.injector(carthage.ConfigLayout)
+    config.tasks.stamp_backend = 'sqlite'
+    called = 0
+
+    class c(Stampable):
+        @setup_task("forgotten stamp")
+        def forgotten(self):
+            nonlocal called
+            called += 1
+
+    o = await ainjector(c)
+    assert called == 1
+    # Deleting and recreating the object runs its tasks again
+    o.forget_stamps()
+    await ainjector(c)
+    assert called == 2
+    # Stamps removed by another process are noticed
+    other = StampIndex(o.stamp_index.path)
+    other.clear(c.stamp_path)
+    other.close()
+    await ainjector(c)
+    assert called == 3
+    o.stamp_index.close()
+
+@async_test
+async def test_setup_task_graph(ainjector):
+    runs = []
+    class c(Stampable):
+        setup_task_concurrency = 2
+        @setup_task("waits for render")
+        async def install(self):
+            await asyncio.wait_for(rendered.wait(), 5)
+            runs.append('install')
+        @setup_task("render")
+        async def render(self):
+            rendered.set()
+            runs.append('render')
+        render.runs_after()
+        @setup_task("start")
+        def start(self):
+            runs.append('start')
+        start.runs_after(install, render)
+        @setup_task("unrelated")
+        def unrelated(self):
+            runs.append('unrelated')
+        unrelated.runs_after()
+
+    rendered = asyncio.Event()
+    o = await ainjector(c)
+    assert o.setup_task_graph() == [[], [], [0, 1], []]
+    assert runs.index('render') < runs.index('install') < runs.index('start')
+    runs.clear()
+    await o.run_setup_tasks()
+    assert runs == []
+    # Rerunning render reruns start but not install
+    o.delete_stamp('render')
+    await o.run_setup_tasks()
+    assert sorted(runs) == ['render', 'start']
@@ -0,0 +1,144 @@
+# Copyright (C) 2026, Hadron Industries, Inc.
+# Carthage is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation. It is distributed
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the file
+# LICENSE for details.
+
+import asyncio
+import pytest
+import carthage
+from carthage import sh
+from carthage.ssh import SshAgent
+from carthage.machine import SshMixin, _ssh_config_port
+from carthage.dependency_injection import *
+from carthage.pytest import *
+
+
+@pytest.fixture()
+def ainjector(ainjector, tmp_path):
+    ainjector = ainjector.claim("test_ssh.py")
+    config = ainjector.injector(carthage.ConfigLayout)
+    config.local_run_dir = str(tmp_path)
+    yield ainjector
+
+
+@async_test
+async def test_control_master(ainjector):
+    agent = await ainjector(SshAgent)
+    try:
+        master = agent.control_master('root', '192.0.2.1', (), None, None)
+        assert master is agent.control_master('root', '192.0.2.1', (), None, None)
+        assert master is not agent.control_master('user', '192.0.2.1', (), None, None)
+        assert f'-oControlPath={master.path}' in master.ssh_options
+        calls = []
+        def ssh(*options):
+            calls.append(options)
+            return sh.false.bake()
+        # A master that fails to start is not retried immediately
+        assert not await master.start(ssh)
+        assert not await master.start(ssh)
+        assert len(calls) == 1
+        assert '-N' in calls[0]
+        assert not await master.running()
+        # Multiplexing is opt-in
+        assert ainjector.get_instance(carthage.ConfigLayout).ssh.multiplex is False
+    finally:
+        agent.close()
+
+
+@async_test
+async def test_ssh_online_probe(ainjector):
+    server = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    probes = 0
+    class Probed(SshMixin):
+        name = 'probed'
+        ip_address = '127.0.0.1'
+        ssh_options = ('-p', str(port))
+        ssh_jump_host = None
+        ssh_online_timeout = 1
+        injector = ainjector.injector
+        config_layout = ainjector.injector(carthage.ConfigLayout)
+
+        async def _ssh_probe_port(self):
+            return port
+
+        async def _ssh_online(self):
+            nonlocal probes
+            probes += 1
+            await asyncio.sleep(0.1)
+
+    probed = Probed()
+    async with server:
+        assert await probed.ssh_port_open()
+    assert not await probed.ssh_port_open()
+    # Concurrent callers share one probe
+    await asyncio.gather(*(probed.ssh_online() for i in range(5)))
+    assert probes == 1
+    await probed.ssh_online()
+    assert probes == 2
+
+
+def test_ssh_config_port():
+    assert _ssh_config_port('user root\nport 2222\nproxycommand none\n') == 2222
+    assert _ssh_config_port('port 22\nproxyjump bastion\n') is None
+    assert _ssh_config_port('port 22\nproxycommand nc %h %p\n') is None
+
+
+@async_test
+async def test_ssh_online_probe_advisory(ainjector):
+    "ssh is still tried when the port probe never succeeds"
+    ssh_calls = []
+    class Unprobeable(SshMixin):
+        name = 'unprobeable'
+        ip_address = '192.0.2.1'
+        ssh_options = ()
+        ssh_jump_host = None
+        ssh_online_retries = 1
+        ssh_online_timeout = 1
+        injector = ainjector.injector
+        config_layout = ainjector.injector(carthage.ConfigLayout)
+
+        async def ssh_port_open(self):
+            return False
+
+        async def ssh(self, *args, **kwargs):
+            ssh_calls.append(args)
+
+    Unprobeable.ainjector = ainjector
+    await Unprobeable().ssh_online()
+    assert len(ssh_calls) == 1
+
+
+@async_test
+async def test_ssh_online_budget(ainjector):
+    "Port probes count against ssh_online_retries"
+    probes = 0
+    ssh_calls = 0
+    class Unreachable(SshMixin):
+        name = 'unreachable'
+        ip_address = '192.0.2.1'
+        ssh_options = ()
+        ssh_jump_host = None
+        ssh_online_retries = 4
+        ssh_online_timeout = 1
+        ssh_online_initial_delay = ssh_online_max_delay = 0.01
+        injector = ainjector.injector
+        config_layout = ainjector.injector(carthage.ConfigLayout)
+
+        async def ssh_port_open(self):
+            nonlocal probes
+            probes += 1
+            return False
+
+        async def ssh(self, *args, **kwargs):
+            nonlocal ssh_calls
+            ssh_calls += 1
+            raise sh.ErrorReturnCode_255('ssh', b'', b'')
+
+    Unreachable.ainjector = ainjector
+    with pytest.raises(TimeoutError):
+        await Unreachable().ssh_online()
+    assert (probes, ssh_calls) == (3, 1)